@@ -0,0 +1,567 @@
+"""Load test for the bot's message pipeline with stub backends.
+
+Drives ``handle_message`` with simulated Telegram updates (scenario
+``telegram``) or ``cli_loop`` with scripted input (scenario ``cli``) against
+the stubs in ``benchmarks/stubs.py``, and reports end-to-end latency
+percentiles, throughput, event-loop lag and memory growth per 1k
+conversations (per 1k turns for the single-conversation CLI scenario).
+Scenarios ``polling`` and ``webhook`` measure the update ingress alone: a
+burst of updates reaches a bare handler through getUpdates or through the
+webhook server of ``src/webhook.py``.
+
+    python -m benchmarks.harness                     # compare with baseline
+    python -m benchmarks.harness --update-baseline   # record a new baseline
+
+Regressions beyond the tolerance make the command exit with status 1; the
+same comparison runs in ``tests/test_benchmark.py`` with RUN_BENCHMARKS=1.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+from unittest.mock import patch
+
+import aiohttp
+from aiohttp.test_utils import unused_port
+from telegram import Bot, Update
+from telegram.ext import Application, ContextTypes, MessageHandler, filters
+
+from benchmarks.stubs import (
+    FakeTelegramRequest,
+    StubImagen,
+    StubLLM,
+    communicate_with_latency,
+)
+from src import artifacts, main, media, selfies, tools
+from src.artifacts import ArtifactStore
+from src.cache import DiskCache
+from src.config import Config, Personality
+from src.media import MediaIndex
+from src.registry import AgentRegistry
+from src.selfies import SelfieService
+from src.tools import SelfieTool
+from src.webhook import serve_webhook
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+TOKEN = "123:bench"
+
+# Metrics where a larger value is a regression, and the absolute slack added
+# to the relative tolerance so tiny baselines don't fail on noise
+LOWER_IS_BETTER = {
+    "p50_ms": 20.0,
+    "p95_ms": 30.0,
+    "p99_ms": 40.0,
+    "loop_lag_p99_ms": 50.0,
+    "memory_kb_per_1k": 2048.0,
+}
+HIGHER_IS_BETTER = {"throughput": 0.0}
+
+
+@dataclass
+class Settings:
+    conversations: int = 100
+    turns: int = 2
+    concurrency: int = 25
+    # Every Nth turn asks for media, alternating selfie and voice note
+    media_every: int = 5
+    llm_latency: float = 0.02
+    tts_latency: float = 0.01
+    image_latency: float = 0.02
+    telegram_latency: float = 0.002
+    # Bot's uplink to the Bot API for file uploads (0: not modelled)
+    upload_mbps: float = 0.0
+    warmup: int = 10
+
+
+@dataclass
+class Report:
+    scenario: str
+    turns: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    throughput: float
+    loop_lag_p99_ms: float
+    loop_lag_max_ms: float
+    memory_kb_per_1k: float
+    counters: Dict[str, int] = field(default_factory=dict)
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            name: getattr(self, name) for name in (*LOWER_IS_BETTER, *HIGHER_IS_BETTER)
+        }
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+class LoopLagMonitor:
+    """Measures how late ``asyncio.sleep(interval)`` wakes up."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            self.samples.append(max(0.0, lag))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    def summary(self) -> Dict[str, float]:
+        samples = self.samples or [0.0]
+        p99 = percentiles(samples)["p99"] if len(samples) > 1 else samples[0]
+        return {"p99": p99, "max": max(samples)}
+
+
+class MemoryProbe:
+    """Heap growth between ``mark()`` and ``growth()``, traced only if enabled.
+
+    tracemalloc slows every allocation down several times, so latencies come
+    from a separate untraced pass over the same workload.
+    """
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.start = 0
+
+    def __enter__(self) -> "MemoryProbe":
+        if self.enabled:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.enabled:
+            tracemalloc.stop()
+
+    def mark(self) -> None:
+        if self.enabled:
+            gc.collect()
+            self.start = tracemalloc.get_traced_memory()[0]
+
+    def growth(self) -> int:
+        if not self.enabled:
+            return 0
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] - self.start
+
+
+@dataclass
+class Run:
+    latencies: List[float]
+    elapsed: float
+    lag: Dict[str, float]
+    growth: int
+    # Conversations (telegram) or turns (cli) the memory growth is spread over
+    units: int
+    counters: Dict[str, int]
+
+
+def turn_text(conversation: int, turn: int, settings: Settings) -> str:
+    index = conversation * settings.turns + turn
+    if settings.media_every and index % settings.media_every == 0:
+        if (index // settings.media_every) % 2:
+            return f"send me a voice note, #{conversation}"
+        return f"send me a selfie, #{conversation}"
+    return f"hi there, this is turn {turn}"
+
+
+@contextlib.contextmanager
+def stub_backends(settings: Settings) -> Iterator[Dict[str, Any]]:
+    """Point the bot's globals at the stubs and fresh, isolated caches."""
+    llm = StubLLM(settings.llm_latency)
+    imagen = StubImagen(settings.image_latency)
+    personality = Personality(
+        name="Sacha", byline="a benchmark", identity=["bench"], behavior=["reply"]
+    )
+    with contextlib.ExitStack() as stack:
+        tmp = stack.enter_context(tempfile.TemporaryDirectory())
+        for name, value in {
+            "LLM_PROVIDER": "google",
+            "STREAM_REPLIES": False,
+            "RESPONSE_CACHE": False,
+            "GEMINI_CONTEXT_CACHE": False,
+            "CHECKPOINT_DB": "",
+        }.items():
+            stack.enter_context(patch.object(Config, name, value))
+        stack.enter_context(patch("src.agent.ChatGoogleGenerativeAI", return_value=llm))
+        stack.enter_context(
+            patch.object(SelfieTool, "_get_client", lambda self: imagen)
+        )
+        stack.enter_context(
+            patch(
+                "src.speech.edge_tts.Communicate",
+                communicate_with_latency(settings.tts_latency),
+            )
+        )
+        stack.enter_context(
+            patch.object(tools, "_tts_cache", DiskCache(tmp, 1024 * 1024 * 1024))
+        )
+        # Production queueing, but no per-chat limit: the CLI is a single chat
+        image = selfies.image_options()
+        selfie_service = SelfieService(
+            DiskCache(f"{tmp}/selfies", 1024 * 1024 * 1024, suffix=image.suffix),
+            workers=Config.SELFIE_WORKERS,
+            queue_size=Config.SELFIE_QUEUE_SIZE,
+            rate_limit=10**9,
+            rate_window=3600,
+            image=image,
+        )
+        stack.enter_context(patch.object(selfies, "_service", selfie_service))
+        stack.enter_context(
+            patch.object(artifacts, "_store", ArtifactStore(1024 * 1024, 600))
+        )
+        stack.enter_context(patch.object(media, "media_index", MediaIndex()))
+        stack.enter_context(patch.object(main, "graph", None))
+        stack.enter_context(
+            patch.object(main, "agents", AgentRegistry(main.build_agent, 8))
+        )
+        stack.enter_context(patch.object(main, "personalities", {"sacha": personality}))
+        stack.enter_context(patch.object(main.chat_queue, "debounce", 0))
+        # The tools and the CLI print progress; keep the report readable.
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        yield {"llm": llm, "imagen": imagen}
+
+
+def update_data(chat_id: int, update_id: int, text: str) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }
+
+
+def make_update(bot: Bot, chat_id: int, update_id: int, text: str) -> Update:
+    return Update.de_json(update_data(chat_id, update_id, text), bot)
+
+
+async def run_telegram(settings: Settings, memory: MemoryProbe) -> Run:
+    """``settings.conversations`` chats with ``settings.turns`` turns each."""
+    latencies: List[float] = []
+    request = FakeTelegramRequest(settings.telegram_latency, settings.upload_mbps)
+    bot = Bot(TOKEN, request=request)
+    semaphore = asyncio.Semaphore(settings.concurrency)
+    update_ids = iter(range(1, 10**9))
+
+    async def conversation(chat_id: int, record: bool) -> None:
+        async with semaphore:
+            context = SimpleNamespace(bot=bot, user_data={})
+            for turn in range(settings.turns):
+                text = turn_text(chat_id, turn, settings)
+                update = make_update(bot, chat_id, next(update_ids), text)
+                started = time.perf_counter()
+                await main.handle_message(update, context)  # type: ignore[arg-type]
+                if record:
+                    latencies.append(time.perf_counter() - started)
+
+    monitor = LoopLagMonitor()
+    with stub_backends(settings) as stubs, memory:
+        async with bot:
+            warmup = range(10**6, 10**6 + settings.warmup)
+            await asyncio.gather(*(conversation(c, False) for c in warmup))
+
+            memory.mark()
+            monitor.start()
+            started = time.perf_counter()
+            chats = range(1, settings.conversations + 1)
+            await asyncio.gather(*(conversation(c, True) for c in chats))
+            elapsed = time.perf_counter() - started
+            await monitor.stop()
+            growth = memory.growth()
+
+    counters = {
+        "llm_calls": stubs["llm"].calls,
+        "images": stubs["imagen"].calls,
+        **{f"telegram_{k}": v for k, v in sorted(request.calls.items())},
+        **{f"telegram_{k}_bytes": v for k, v in sorted(request.uploaded.items())},
+    }
+    return Run(
+        latencies, elapsed, monitor.summary(), growth, settings.conversations, counters
+    )
+
+
+async def run_cli(settings: Settings, memory: MemoryProbe) -> Run:
+    """One CLI conversation of ``settings.conversations`` scripted turns."""
+    total = settings.conversations
+    script = iter(
+        ["sacha"]
+        + [turn_text(0, i, settings) for i in range(settings.warmup + total)]
+        + ["quit"]
+    )
+    stamps: List[float] = []
+
+    def scripted_input(prompt: str = "") -> str:
+        stamps.append(time.perf_counter())
+        # stamps[0] is the personality prompt; turn i starts at stamps[i + 1].
+        if len(stamps) == settings.warmup + 1:
+            memory.mark()
+        return next(script)
+
+    monitor = LoopLagMonitor()
+    with stub_backends(settings) as stubs, memory:
+        with patch("builtins.input", scripted_input):
+            monitor.start()
+            await main.cli_loop()
+            await monitor.stop()
+            growth = memory.growth()
+
+    measured = stamps[settings.warmup + 1 :]
+    latencies = [b - a for a, b in zip(measured, measured[1:])]
+    counters = {"llm_calls": stubs["llm"].calls, "images": stubs["imagen"].calls}
+    return Run(
+        latencies,
+        measured[-1] - measured[0],
+        monitor.summary(),
+        growth,
+        total,
+        counters,
+    )
+
+
+@contextlib.contextmanager
+def quiet_loggers(*names: str) -> Iterator[None]:
+    """Keep per-request INFO logs of ``names`` out of the report."""
+    loggers = [logging.getLogger(name) for name in names]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+async def run_ingress(webhook: bool, settings: Settings, memory: MemoryProbe) -> Run:
+    """A burst of ``settings.conversations`` updates, one chat each, answered
+    by a handler that only waits ``settings.llm_latency``.
+
+    Both modes hand the updates to PTB with CONCURRENT_UPDATES set to
+    ``settings.concurrency``; latency runs from the burst to each reply.
+    """
+    request = FakeTelegramRequest(settings.telegram_latency)
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .request(request)
+        .get_updates_request(request)
+        .concurrent_updates(settings.concurrency)
+        .build()
+    )
+
+    async def reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await asyncio.sleep(settings.llm_latency)
+        await update.message.reply_text("ok")  # type: ignore[union-attr]
+
+    application.add_handler(MessageHandler(filters.TEXT, reply))
+    port = unused_port()
+    url = f"http://127.0.0.1:{port}"
+
+    async def burst(chats: range) -> float:
+        updates = [update_data(c, c, "hi") for c in chats]
+        started = time.perf_counter()
+        if webhook:
+            async with aiohttp.ClientSession() as session:
+                for data in updates:
+                    async with session.post(f"{url}/telegram", json=data) as r:
+                        r.raise_for_status()
+        else:
+            request.push(updates)
+        while not all(c in request.replied for c in chats):
+            await asyncio.sleep(0.001)
+        return started
+
+    async def serve(stop: asyncio.Event) -> None:
+        if webhook:
+            await serve_webhook(
+                application, "127.0.0.1", port, "https://bench.example.com/", stop=stop
+            )
+            return
+        async with application:
+            await application.start()
+            await application.updater.start_polling(  # type: ignore[union-attr]
+                poll_interval=0, timeout=1
+            )
+            await stop.wait()
+            await application.updater.stop()  # type: ignore[union-attr]
+            await application.stop()
+
+    monitor = LoopLagMonitor()
+    stop = asyncio.Event()
+    with memory, quiet_loggers("aiohttp.access", "telegram.ext", "src.webhook"):
+        serving = asyncio.create_task(serve(stop))
+        # The webhook is registered once the server listens
+        ready = "setWebhook" if webhook else "getUpdates"
+        while ready not in request.calls:
+            await asyncio.sleep(0.01)
+        await burst(range(10**6, 10**6 + settings.warmup))
+
+        memory.mark()
+        monitor.start()
+        chats = range(1, settings.conversations + 1)
+        started = await burst(chats)
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+        growth = memory.growth()
+        stop.set()
+        await serving
+
+    latencies = [request.replied[c] - started for c in chats]
+    counters = {f"telegram_{k}": v for k, v in sorted(request.calls.items())}
+    return Run(
+        latencies, elapsed, monitor.summary(), growth, settings.conversations, counters
+    )
+
+
+async def run_polling(settings: Settings, memory: MemoryProbe) -> Run:
+    return await run_ingress(False, settings, memory)
+
+
+async def run_webhook(settings: Settings, memory: MemoryProbe) -> Run:
+    return await run_ingress(True, settings, memory)
+
+
+def build_report(scenario: str, timed: Run, traced: Run) -> Report:
+    pct = percentiles(timed.latencies)
+    return Report(
+        scenario=scenario,
+        turns=len(timed.latencies),
+        p50_ms=round(pct["p50"] * 1000, 2),
+        p95_ms=round(pct["p95"] * 1000, 2),
+        p99_ms=round(pct["p99"] * 1000, 2),
+        throughput=round(len(timed.latencies) / timed.elapsed, 1),
+        loop_lag_p99_ms=round(timed.lag["p99"] * 1000, 2),
+        loop_lag_max_ms=round(timed.lag["max"] * 1000, 2),
+        memory_kb_per_1k=round(traced.growth / 1024 / traced.units * 1000, 1),
+        counters=timed.counters,
+    )
+
+
+SCENARIOS: Dict[str, Callable[[Settings, MemoryProbe], Awaitable[Run]]] = {
+    "telegram": run_telegram,
+    "cli": run_cli,
+    "polling": run_polling,
+    "webhook": run_webhook,
+}
+
+# What the memory growth of each scenario is spread over
+UNITS = {"cli": "turns", "polling": "updates", "webhook": "updates"}
+
+
+async def measure(scenario: str, settings: Settings) -> Report:
+    """Run ``scenario`` twice: timed without tracing, then for memory."""
+    timed = await SCENARIOS[scenario](settings, MemoryProbe(False))
+    traced = await SCENARIOS[scenario](settings, MemoryProbe(True))
+    return build_report(scenario, timed, traced)
+
+
+def compare(report: Report, baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Describe every metric that regressed beyond ``tolerance``."""
+    regressions = []
+    for name, value in report.metrics().items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if name in LOWER_IS_BETTER:
+            limit = base * tolerance + LOWER_IS_BETTER[name]
+            if value > limit:
+                regressions.append(f"{name}: {value} > {limit:.2f} (baseline {base})")
+        elif value < base / tolerance:
+            limit = base / tolerance
+            regressions.append(f"{name}: {value} < {limit:.2f} (baseline {base})")
+    return regressions
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> Dict[str, Any]:
+    return dict(json.loads(path.read_text(encoding="utf-8")))
+
+
+def format_report(report: Report) -> str:
+    lines = [
+        f"Scenario {report.scenario}: {report.turns} turns",
+        f"  latency p50/p95/p99: {report.p50_ms} / {report.p95_ms} / "
+        f"{report.p99_ms} ms",
+        f"  throughput: {report.throughput} turns/s",
+        f"  event-loop lag p99/max: {report.loop_lag_p99_ms} / "
+        f"{report.loop_lag_max_ms} ms",
+        f"  memory growth: {report.memory_kb_per_1k} KiB per 1k "
+        f"{UNITS.get(report.scenario, 'conversations')}",
+        f"  counters: {report.counters}",
+    ]
+    return "\n".join(lines)
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    for name, default in asdict(Settings()).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(default), default=None
+        )
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline) if args.baseline.exists() else {}
+    settings = Settings(**baseline.get("settings", {}))
+    for name in asdict(settings):
+        if getattr(args, name) is not None:
+            setattr(settings, name, getattr(args, name))
+
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = {}
+    regressions: List[str] = []
+    for scenario in scenarios:
+        report = asyncio.run(measure(scenario, settings))
+        results[scenario] = report.metrics()
+        print(format_report(report))
+        expected = baseline.get("scenarios", {}).get(scenario)
+        if expected and not args.update_baseline:
+            regressions += [
+                f"{scenario} {r}" for r in compare(report, expected, args.tolerance)
+            ]
+
+    if args.update_baseline:
+        new = {"settings": asdict(settings), "scenarios": results}
+        args.baseline.write_text(json.dumps(new, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
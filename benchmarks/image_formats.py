@@ -0,0 +1,114 @@
+"""Payload size and send time of selfies: Imagen's PNG against processed images.
+
+Runs the selfie image pipeline (``src/encoders.py``) with several settings
+on a photo-like synthetic image (the default) or image files given on the
+command line, and reports bytes, processing time and the time to upload
+each result at a given uplink speed.
+
+    python -m benchmarks.image_formats                      # synthetic photo
+    python -m benchmarks.image_formats selfie.png ...       # real outputs
+    python -m benchmarks.image_formats --uplink-mbps 5      # slower uplink
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.stubs import photo_png
+from src.encoders import ImageOptions, process_image
+from src.selfies import image_options
+
+# Side of Imagen's default square output
+IMAGEN_SIDE = 1024
+VARIANTS: Dict[str, ImageOptions] = {
+    "jpeg q85": ImageOptions(),
+    "jpeg q70": ImageOptions(quality=70),
+    "jpeg <=64KiB": ImageOptions(max_bytes=64 * 1024),
+    "webp q85": ImageOptions(format="webp"),
+    "webp q70": ImageOptions(format="webp", quality=70),
+}
+
+
+@dataclass
+class Row:
+    variant: str
+    bytes: int
+    ratio: float
+    process_ms: float
+    upload_ms: float
+
+
+def upload_ms(size: int, uplink_mbps: float) -> float:
+    return round(size * 8 / (uplink_mbps * 1e6) * 1000, 1)
+
+
+def compare_variants(
+    image: bytes,
+    variants: Dict[str, ImageOptions],
+    uplink_mbps: float,
+    repeat: int = 3,
+) -> List[Row]:
+    """Process ``image`` with each variant, keeping the fastest of ``repeat``
+    runs."""
+    rows = [
+        Row("png (Imagen)", len(image), 1.0, 0.0, upload_ms(len(image), uplink_mbps))
+    ]
+    for name, options in variants.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            processed = process_image(image, options)
+            timings.append(time.perf_counter() - started)
+        if processed is None:
+            raise ValueError("not an image")
+        rows.append(
+            Row(
+                name,
+                len(processed),
+                round(len(processed) / len(image), 3),
+                round(min(timings) * 1000, 1),
+                upload_ms(len(processed), uplink_mbps),
+            )
+        )
+    return rows
+
+
+def format_rows(name: str, rows: List[Row]) -> str:
+    lines = [f"{name}:"]
+    for row in rows:
+        lines.append(
+            f"  {row.variant:<14} {row.bytes:>9} bytes  {row.ratio:>6.1%}  "
+            f"process {row.process_ms:>6.1f} ms  upload {row.upload_ms:>7.1f} ms"
+        )
+    return "\n".join(lines)
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    images = [(str(path), path.read_bytes()) for path in args.files]
+    if not images:
+        images.append((f"synthetic {IMAGEN_SIDE}px photo", photo_png(IMAGEN_SIDE)))
+    variants = {**VARIANTS, "configured": image_options()}
+
+    ratios = []
+    for name, image in images:
+        rows = compare_variants(image, variants, args.uplink_mbps)
+        print(format_rows(name, rows))
+        ratios.append({row.variant: row.ratio for row in rows})
+    if len(images) > 1:
+        print("median size relative to PNG:")
+        for name in ratios[0]:
+            print(f"  {name:<14} {statistics.median(r[name] for r in ratios):.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,307 @@
+"""Deterministic stand-ins for the LLM, edge-tts, Imagen and the Bot API.
+
+Every backend waits for a configurable latency with ``asyncio.sleep`` (never
+blocking the event loop) and answers the same way for the same input, so two
+benchmark runs do exactly the same work.
+"""
+
+import array
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+import random
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import av
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from PIL import Image, ImageDraw, ImageFilter
+from telegram.request import BaseRequest, RequestData
+
+# Side of the fake selfie (noise compresses poorly: ~200KB as PNG)
+IMAGE_SIDE = 256
+# Fake voice clips: MP3 in edge-tts's output format, about as long as a
+# typical voice reply
+TTS_SAMPLE_RATE = 24000
+TTS_BITRATE = 48000
+VOICE_SECONDS = 4.0
+
+
+def noise_png(side: int) -> bytes:
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+def photo_png(side: int, seed: int = 0) -> bytes:
+    """Photo-like PNG: smooth gradients, soft shapes and sensor-like grain.
+
+    Compresses roughly like a real photo, so format comparisons are fair
+    (noise favours no codec, flat colour favours PNG).
+    """
+    rnd = random.Random(seed)
+    base = Image.merge(
+        "RGB",
+        (
+            Image.linear_gradient("L").resize((side, side)),
+            Image.radial_gradient("L").resize((side, side)),
+            Image.linear_gradient("L").rotate(90).resize((side, side)),
+        ),
+    )
+    draw = ImageDraw.Draw(base)
+    for _ in range(12):
+        x, y, r = (rnd.randrange(side) for _ in range(3))
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.ellipse((x - r // 4, y - r // 4, x + r // 4, y + r // 4), fill=color)
+    photo = base.filter(ImageFilter.GaussianBlur(side / 64))
+    grain = Image.effect_noise((side, side), 20).convert("RGB")
+    photo = Image.blend(photo, grain, 0.15)
+    output = io.BytesIO()
+    photo.save(output, "PNG")
+    return output.getvalue()
+
+
+def speech_pcm(seconds: float, seed: int = 0) -> bytes:
+    """Speech-like 16-bit mono PCM: voiced harmonics and breath noise shaped
+    into ~4 syllables a second. Not intelligible, but codecs treat it much
+    like a voice, unlike a pure tone or white noise."""
+    rnd = random.Random(seed)
+    pitch = rnd.uniform(110, 220)
+    samples = array.array("h")
+    for i in range(int(TTS_SAMPLE_RATE * seconds)):
+        t = i / TTS_SAMPLE_RATE
+        envelope = max(0.0, math.sin(2 * math.pi * 4 * t))
+        voiced = sum(math.sin(2 * math.pi * pitch * k * t) / k for k in range(1, 6))
+        samples.append(
+            int(envelope * (0.2 * voiced + 0.1 * rnd.uniform(-1, 1)) * 12000)
+        )
+    return samples.tobytes()
+
+
+def tone_pcm(seconds: float, frequency: float) -> bytes:
+    samples = array.array("h")
+    for i in range(int(TTS_SAMPLE_RATE * seconds)):
+        samples.append(
+            int(math.sin(2 * math.pi * frequency * i / TTS_SAMPLE_RATE) * 8000)
+        )
+    return samples.tobytes()
+
+
+def encode_mp3(pcm: bytes) -> bytes:
+    """Encode 16-bit mono PCM like edge-tts does (24 kHz, 48 kbit/s MP3)."""
+    output = io.BytesIO()
+    # Bare frames, no ID3 tag or Xing header, as edge-tts streams them
+    options = {"write_xing": "0", "id3v2_version": "0"}
+    with av.open(output, "w", "mp3", options=options) as container:
+        stream = container.add_stream("libmp3lame", rate=TTS_SAMPLE_RATE, layout="mono")
+        stream.bit_rate = TTS_BITRATE
+        frame = av.AudioFrame(format="s16", layout="mono", samples=len(pcm) // 2)
+        frame.planes[0].update(pcm)
+        frame.rate = TTS_SAMPLE_RATE
+        container.mux(stream.encode(frame))
+        container.mux(stream.encode(None))
+    return output.getvalue()
+
+
+class StubLLM:
+    """Chat model that asks for a selfie or a voice note when the user does."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+        self._ids = itertools.count()
+
+    def bind_tools(self, tools: Any) -> "StubLLM":
+        return self
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        last = messages[-1]
+        if isinstance(last, HumanMessage):
+            text = str(last.content)
+            if "selfie" in text:
+                return self._tool_call("SelfieTool", {"description": text})
+            if "voice" in text:
+                return self._tool_call("VoiceTool", {"text": text})
+            return AIMessage(content=f"You said: {text}")
+        return AIMessage(content="There you go!")
+
+    def _tool_call(self, name: str, args: Dict[str, Any]) -> AIMessage:
+        call_id = f"call-{next(self._ids)}"
+        return AIMessage(
+            content="", tool_calls=[{"name": name, "args": args, "id": call_id}]
+        )
+
+    def invoke(self, messages: List[BaseMessage], **kwargs: Any) -> AIMessage:
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def ainvoke(self, messages: List[BaseMessage], **kwargs: Any) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+class StubImagen:
+    """``genai.Client`` look-alike whose ``generate_images`` returns fake PNGs."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.png = noise_png(IMAGE_SIDE)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(generate_images=self._agenerate)
+        )
+        self.models = SimpleNamespace(generate_images=self._generate)
+
+    def _image(self, prompt: str) -> Any:
+        self.calls += 1
+        # Decoders ignore data after the PNG's end, so this keeps every
+        # output a valid image with distinct bytes.
+        data = self.png + f"{self.calls} {prompt}".encode()
+        image = SimpleNamespace(image=SimpleNamespace(image_bytes=data))
+        return SimpleNamespace(generated_images=[image])
+
+    def _generate(self, model: str, prompt: str, config: Any = None) -> Any:
+        time.sleep(self.latency)
+        return self._image(prompt)
+
+    async def _agenerate(self, model: str, prompt: str, config: Any = None) -> Any:
+        await asyncio.sleep(self.latency)
+        return self._image(prompt)
+
+
+class StubCommunicate:
+    """``edge_tts.Communicate`` look-alike that streams a real MP3 clip.
+
+    ``latency`` is the wait before the first chunk of each request. Every
+    clip is the same speech-like audio followed by a short tone whose pitch
+    depends on the text, so different texts upload different files.
+    """
+
+    latency = 0.0
+    speech = b""
+
+    def __init__(self, text: str, voice: str, **kwargs: Any) -> None:
+        self.text = text
+
+    def _clip(self) -> bytes:
+        frequency = 300 + zlib.crc32(self.text.encode()) % 1000
+        # MP3 frames are self-contained, so two clips concatenate into one
+        return self.speech + encode_mp3(tone_pcm(0.1, frequency))
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        # Encoding is the stub's own cost, not edge-tts's: keep it off the loop
+        yield {"type": "audio", "data": await asyncio.to_thread(self._clip)}
+
+
+def communicate_with_latency(latency: float) -> type:
+    # Encoded up front, so the measured run only pays for the short tone
+    speech = encode_mp3(speech_pcm(VOICE_SECONDS))
+    return type(
+        "Communicate", (StubCommunicate,), {"latency": latency, "speech": speech}
+    )
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Bot API transport that answers locally after ``latency`` seconds.
+
+    Plugged into a real ``telegram.Bot``, so requests still go through PTB's
+    serialization and response parsing. ``calls`` counts requests per method
+    and ``uploaded`` the bytes of files sent with them, which also take
+    their transfer time at ``upload_mbps`` (0: instantly). ``getUpdates``
+    long-polls for the updates queued with ``push``; ``replied`` holds the
+    time of the last ``sendMessage`` to each chat.
+    """
+
+    def __init__(self, latency: float, upload_mbps: float = 0.0) -> None:
+        self.latency = latency
+        self.upload_mbps = upload_mbps
+        self.calls: Dict[str, int] = {}
+        self.uploaded: Dict[str, int] = {}
+        self.replied: Dict[int, float] = {}
+        self._updates: List[Dict[str, Any]] = []
+        self._arrived = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+
+    def push(self, updates: List[Dict[str, Any]]) -> None:
+        self._updates.extend(updates)
+        self._arrived.set()
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if not self._updates:
+            self._arrived.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._arrived.wait(), params.get("timeout", 0))
+        limit = int(params.get("limit", 100))
+        updates, self._updates = self._updates[:limit], self._updates[limit:]
+        return updates
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": 0,
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+        }
+
+    def _file(self) -> Dict[str, Any]:
+        number = next(self._file_ids)
+        return {"file_id": f"file-{number}", "file_unique_id": f"u{number}"}
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bb"}
+        if method == "sendMessage":
+            self.replied[int(params.get("chat_id", 0))] = time.perf_counter()
+            return {**self._message(params), "text": params.get("text", "")}
+        if method == "sendPhoto":
+            photo = {**self._file(), "width": 512, "height": 512}
+            return {**self._message(params), "photo": [photo]}
+        if method == "sendVoice":
+            return {**self._message(params), "voice": {**self._file(), "duration": 1}}
+        return True
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout: Any = None,
+        write_timeout: Any = None,
+        connect_timeout: Any = None,
+        pool_timeout: Any = None,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+        if request_data and request_data.contains_files:
+            files = request_data.multipart_data.values()
+            size = sum(len(content) for _, content, _ in files)
+            self.uploaded[api_method] = self.uploaded.get(api_method, 0) + size
+            if self.upload_mbps:
+                await asyncio.sleep(size * 8 / (self.upload_mbps * 1e6))
+        await asyncio.sleep(self.latency)
+        if api_method == "getUpdates":
+            result: Any = await self._get_updates(params)
+        else:
+            result = self._result(api_method, params)
+        payload = {"ok": True, "result": result}
+        return 200, json.dumps(payload).encode()
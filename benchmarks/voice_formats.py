@@ -0,0 +1,113 @@
+"""Payload size of voice messages: edge-tts's MP3 against OGG/Opus.
+
+Measures the bytes uploaded per voice message and the time to transcode it,
+for a speech-like synthetic clip (the default), MP3 files given on the
+command line, or text synthesized with the real edge-tts service.
+
+    python -m benchmarks.voice_formats                    # synthetic clip
+    python -m benchmarks.voice_formats reply.mp3 ...      # recorded clips
+    python -m benchmarks.voice_formats --text "Oi, amor!"  # needs network
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from benchmarks.stubs import VOICE_SECONDS, encode_mp3, speech_pcm
+from src.config import Config
+from src.speech import edge_tts_synthesizer, stream_speech, to_ogg_opus
+
+BITRATES = (16000, 24000, 32000)
+
+
+@dataclass
+class Row:
+    format: str
+    bytes: int
+    ratio: float
+    transcode_ms: float
+
+
+def compare_formats(
+    mp3: bytes, bitrates: Sequence[int] = BITRATES, repeat: int = 3
+) -> List[Row]:
+    """Transcode ``mp3`` at each Opus bitrate, keeping the fastest of
+    ``repeat`` runs."""
+    rows = [Row("mp3 (edge-tts)", len(mp3), 1.0, 0.0)]
+    for bitrate in bitrates:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            ogg = to_ogg_opus(mp3, bitrate)
+            timings.append(time.perf_counter() - started)
+        rows.append(
+            Row(
+                f"ogg/opus {bitrate // 1000}k",
+                len(ogg),
+                round(len(ogg) / len(mp3), 3),
+                round(min(timings) * 1000, 1),
+            )
+        )
+    return rows
+
+
+def format_rows(name: str, rows: List[Row]) -> str:
+    lines = [f"{name}:"]
+    for row in rows:
+        lines.append(
+            f"  {row.format:<16} {row.bytes:>8} bytes  {row.ratio:>6.1%}  "
+            f"{row.transcode_ms:>6.1f} ms"
+        )
+    return "\n".join(lines)
+
+
+async def synthesize(text: str) -> bytes:
+    synthesize = edge_tts_synthesizer(
+        str(Config.EDGE_TTS_VOICE), Config.EDGE_TTS_RATE, Config.EDGE_TTS_PITCH
+    )
+    async with aclosing(
+        stream_speech(text, synthesize, Config.TTS_PIPELINE_DEPTH)
+    ) as chunks:
+        return b"".join([data async for data in chunks])
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--text", help="synthesize this text with edge-tts")
+    parser.add_argument("--bitrate", type=int, action="append")
+    args = parser.parse_args(argv)
+
+    clips = [(str(path), path.read_bytes()) for path in args.files]
+    if args.text:
+        clips.append(
+            (f"edge-tts: {args.text[:30]!r}", asyncio.run(synthesize(args.text)))
+        )
+    if not clips:
+        clips.append(
+            (
+                f"synthetic {VOICE_SECONDS:g}s clip",
+                encode_mp3(speech_pcm(VOICE_SECONDS)),
+            )
+        )
+
+    ratios = []
+    for name, mp3 in clips:
+        rows = compare_formats(mp3, args.bitrate or BITRATES)
+        print(format_rows(name, rows))
+        ratios.append({row.format: row.ratio for row in rows})
+    if len(clips) > 1:
+        print("median size relative to MP3:")
+        for name in ratios[0]:
+            print(f"  {name:<16} {statistics.median(r[name] for r in ratios):.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,16 +1,58 @@
+import asyncio
 import logging
-from typing import Annotated, Any, Dict, TypedDict, Union
+import time
+import weakref
+from collections import OrderedDict
+from typing import (
+    Annotated,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    NotRequired,
+    Optional,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
-from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import (
+    Runnable,
+    RunnableBinding,
+    RunnableConfig,
+    RunnableLambda,
+)
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_ollama import ChatOllama
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt.tool_node import ToolCallRequest
 
+from src.artifacts import MediaArtifact
+from src.checkpoint import create_checkpointer
 from src.config import Config, Personality
-from src.tools import SelfieTool, VoiceTool
+from src.context_cache import GeminiContextCache
+from src.failover import (
+    UNSTREAMED,
+    CircuitBreaker,
+    Failover,
+    Provider,
+    ProvidersUnavailable,
+)
+from src.response_cache import ResponseCache, get_response_cache, normalize
+from src.router import FLAGSHIP, needs_escalation, route_text
+from src.telemetry import metrics, span
+from src.tools import SelfieTool, VoiceTool, tool_limits
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -18,39 +60,105 @@ logger = logging.getLogger(__name__)
 # Define the tools
 tools = [SelfieTool(), VoiceTool()]
 
+llm_tokens = metrics.counter(
+    "llm_tokens_total", "Tokens sent to and received from the LLM", ("direction",)
+)
+model_routes = metrics.counter(
+    "model_routes_total",
+    "User turns by model tier and routing reason",
+    ("tier", "reason"),
+)
+model_escalations = metrics.counter(
+    "model_escalations_total", "Fast-model replies redone by the flagship model"
+)
+model_latency = metrics.histogram(
+    "model_tier_seconds", "Time for each model tier to reply", ("tier",)
+)
+
+
+def merge_media(
+    current: list[MediaArtifact], update: Optional[list[MediaArtifact]]
+) -> list[MediaArtifact]:
+    # ``None`` clears the channel at the start of a turn.
+    if update is None:
+        return []
+    return current + update
+
 
 # Define the state
 class AgentState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    # Rolling summary of turns that fell out of the history window
+    summary: NotRequired[str]
+    # Media produced by tools during the current turn only
+    media: Annotated[list[MediaArtifact], merge_media]
+    # Model tier picked for the current turn (MODEL_CASCADE only)
+    tier: NotRequired[str]
 
 
-def create_agent(personality: Personality) -> Any:
-    # Initialize LLM based on provider (2026 Edition with LangGraph)
-    llm: Union[ChatOllama, ChatGoogleGenerativeAI]
-    if Config.LLM_PROVIDER == "ollama":
-        logger.info(f"Initializing agent with Ollama model: {Config.OLLAMA_MODEL}")
-        llm = ChatOllama(
-            model=Config.OLLAMA_MODEL,
-            base_url=Config.OLLAMA_BASE_URL,
-            temperature=0.8,
-        )
-    else:
-        # Default to Google Gemini
-        logger.info(f"Initializing agent with Google model: {Config.GOOGLE_MODEL}")
-        llm = ChatGoogleGenerativeAI(
-            model=Config.GOOGLE_MODEL,
-            api_key=Config.GOOGLE_API_KEY,
-            temperature=0.8,
-            max_tokens=None,
-            timeout=None,
-            max_retries=2,
-        )
+SUMMARY_INSTRUCTION = (
+    "Update the running summary of this conversation with the messages above. "
+    "Keep names, facts and promises; drop small talk. Reply with the summary only."
+)
+
+
+def split_turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """Group messages into turns, each starting at a HumanMessage.
 
-    # Bind tools
-    llm_with_tools = llm.bind_tools(tools)
+    An AI tool call and its ToolMessage results always land in the same turn,
+    so trimming whole turns never orphans one half of the pair.
+    """
+    turns: list[list[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
 
-    # System prompt
-    system_prompt = f"""The current year is {Config.CURRENT_YEAR}.
+
+def select_window(
+    messages: list[BaseMessage], max_turns: int, max_tokens: int
+) -> Tuple[list[BaseMessage], list[BaseMessage]]:
+    """Split the history into (dropped, kept) under the turn and token limits.
+
+    The most recent turn is always kept, even if it alone exceeds the budget.
+    """
+    kept_turns: list[list[BaseMessage]] = []
+    tokens = 0
+    for turn in reversed(split_turns(messages)):
+        turn_tokens = count_tokens_approximately(turn)
+        if kept_turns and (
+            len(kept_turns) >= max_turns or tokens + turn_tokens > max_tokens
+        ):
+            break
+        kept_turns.append(turn)
+        tokens += turn_tokens
+
+    cut = len(messages) - sum(len(turn) for turn in kept_turns)
+    return messages[:cut], messages[cut:]
+
+
+def summary_request(summary: str, dropped: list[BaseMessage]) -> list[BaseMessage]:
+    instruction = SUMMARY_INSTRUCTION
+    if summary:
+        instruction += f"\n\nCurrent summary:\n{summary}"
+    return dropped + [HumanMessage(content=instruction)]
+
+
+def collect_media(messages: list[BaseMessage]) -> list[MediaArtifact]:
+    """Return the artifacts attached to the trailing batch of tool results."""
+    media: list[MediaArtifact] = []
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            break
+        if message.artifact:
+            media.append(message.artifact)
+    return media[::-1]
+
+
+def build_system_prompt(personality: Personality) -> str:
+    return f"""The current year is {Config.CURRENT_YEAR}.
 You are {personality.name}, {personality.byline}.
 
 Who you are:
@@ -64,34 +172,509 @@ If the user asks for a selfie or photo, use the SelfieTool.
 If the user asks for a voice message or you want to speak, use the VoiceTool.
 """
 
-    def chatbot(state: AgentState) -> Dict[str, Any]:
-        messages = state["messages"]
-        # Ensure system prompt is the first message if not present or needs update
-        # For simplicity in this graph, we assume the system message is injected at
-        # start of conversation or we prepend it here if we want to be stateless
-        # regarding system prompt. But langgraph state accumulates.
 
-        conversation_messages = [SystemMessage(content=system_prompt)] + messages
-        response = llm_with_tools.invoke(conversation_messages)
+# Rendered system prompts keyed by id() of live personalities (pydantic models
+# are unhashable); each entry is dropped when its personality is collected.
+_system_messages: Dict[int, SystemMessage] = {}
+
+
+def system_message(personality: Personality) -> SystemMessage:
+    """Return the persona's system message, rendering it only once.
+
+    Every turn of every chat with the same personality reuses this object, so
+    the prompt is neither re-formatted nor re-allocated per LLM call.
+    """
+    key = id(personality)
+    message = _system_messages.get(key)
+    if message is None:
+        message = SystemMessage(content=build_system_prompt(personality))
+        _system_messages[key] = message
+        weakref.finalize(personality, _system_messages.pop, key, None)
+    return message
+
+
+def record_usage(response: BaseMessage) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        llm_tokens.inc(usage.get("input_tokens", 0), direction="input")
+        llm_tokens.inc(usage.get("output_tokens", 0), direction="output")
+
+
+def run_tool_call(request: ToolCallRequest, execute: Callable[..., Any]) -> Any:
+    """Run one tool call within its tool's concurrency cap, as a span."""
+    name = request.tool_call["name"]
+    with span(f"tool.{name}") as current:
+        with tool_limits.hold(name) as waited:
+            current.set(waited=waited)
+            return execute(request)
+
+
+async def arun_tool_call(
+    request: ToolCallRequest, execute: Callable[..., Awaitable[Any]]
+) -> Any:
+    name = request.tool_call["name"]
+    with span(f"tool.{name}") as current:
+        async with tool_limits.acquire(name) as waited:
+            current.set(waited=waited)
+            return await execute(request)
+
+
+def traced_node(name: str, node: Runnable[Any, Any]) -> Runnable[Any, Any]:
+    """Run ``node`` inside a ``node.<name>`` span."""
+
+    def run(state: Any, config: RunnableConfig) -> Any:
+        with span(f"node.{name}"):
+            return node.invoke(state, config)
+
+    async def arun(state: Any, config: RunnableConfig) -> Any:
+        with span(f"node.{name}"):
+            return await node.ainvoke(state, config)
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+def personality_from(config: RunnableConfig) -> Personality:
+    personality = config.get("configurable", {}).get("personality")
+    if not isinstance(personality, Personality):
+        raise ValueError("No personality configured for this run.")
+    return personality
+
+
+def create_llm(
+    provider: str, fast: bool = False
+) -> Union[ChatOllama, ChatGoogleGenerativeAI]:
+    # The clients' own timeouts bound sync calls; async calls are also
+    # abandoned by the failover layer after LLM_TIMEOUT_SECONDS.
+    timeout = Config.LLM_TIMEOUT_SECONDS or None
+    if provider == "ollama":
+        model = Config.OLLAMA_FAST_MODEL if fast else Config.OLLAMA_MODEL
+        logger.info(f"Initializing agent with Ollama model: {model}")
+        return ChatOllama(
+            model=model,
+            base_url=Config.OLLAMA_BASE_URL,
+            temperature=0.8,
+            client_kwargs={"timeout": timeout},
+        )
+    model = Config.GOOGLE_FAST_MODEL if fast else Config.GOOGLE_MODEL
+    logger.info(f"Initializing agent with Google model: {model}")
+    return ChatGoogleGenerativeAI(
+        model=model,
+        api_key=Config.GOOGLE_API_KEY,
+        temperature=0.8,
+        max_tokens=None,
+        timeout=timeout,
+        max_retries=2,
+    )
+
+
+def provider_names() -> list[str]:
+    """LLM_PROVIDER (anything but 'ollama' means Google), then the fallback."""
+    names = ["ollama" if Config.LLM_PROVIDER == "ollama" else "google"]
+    fallback = Config.LLM_FALLBACK_PROVIDER
+    if fallback in ("google", "ollama") and fallback not in names:
+        names.append(fallback)
+    return names
+
+
+def create_failover(fast: bool = False) -> Failover:
+    """The configured providers, in order, behind deadlines and breakers.
+
+    Fast-tier providers are named "<provider>-fast" in logs and metrics.
+    """
+    providers = []
+    for name in provider_names():
+        llm = create_llm(name, fast)
+        providers.append(
+            Provider(
+                f"{name}-fast" if fast else name,
+                llm,
+                llm.bind_tools(tools),
+                CircuitBreaker(
+                    Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_RESET_SECONDS
+                ),
+            )
+        )
+    return Failover(
+        providers,
+        timeout=Config.LLM_TIMEOUT_SECONDS or None,
+        hedge=Config.LLM_HEDGE,
+        hedge_delay=Config.LLM_HEDGE_DELAY_SECONDS,
+    )
+
+
+def create_graph() -> Any:
+    """Compile the chat graph shared by every personality.
+
+    The persona is not baked into the graph: each run reads it from
+    ``config["configurable"]["personality"]`` (see ``bind_personality``), so one
+    LLM client, one set of bound tools and one checkpointer serve all of them.
+    LLM requests go through ``Failover`` (see src/failover.py), which moves on
+    to the fallback provider when the primary fails or times out. With
+    MODEL_CASCADE, a ``route`` node sends small talk to a fast model first
+    (see src/router.py).
+    """
+    context_cache: Optional[GeminiContextCache] = None
+    response_cache: Optional[ResponseCache] = None
+    if Config.RESPONSE_CACHE:
+        response_cache = get_response_cache()
+    failover = create_failover()
+    # The cascade's fast tier: same providers, smaller models, no tools
+    fast = create_failover(fast=True) if Config.MODEL_CASCADE else None
+    google = next((p for p in failover.providers if p.name == "google"), None)
+    if google is not None and Config.GEMINI_CONTEXT_CACHE:
+        context_cache = GeminiContextCache(
+            google.llm.client,
+            Config.GOOGLE_MODEL,
+            tools,
+            Config.GEMINI_CONTEXT_CACHE_TTL,
+        )
+
+    def build_messages(
+        state: AgentState, personality: Personality
+    ) -> list[BaseMessage]:
+        # The system prompt is prepended on every call rather than stored in the
+        # checkpointed state, so the persona can change without rewriting history.
+        system = system_message(personality)
+        if state.get("summary"):
+            system = SystemMessage(
+                content=f"{system.content}\nSummary of the earlier conversation:\n"
+                f"{state['summary']}\n"
+            )
+        return [system] + state["messages"]
+
+    def cached_messages(state: AgentState) -> list[BaseMessage]:
+        # The persona and the tools already live in the context cache, which
+        # must not be combined with a system instruction, so the summary (the
+        # only per-chat part of the prefix) travels as a leading user turn.
+        if not state.get("summary"):
+            return state["messages"]
+        summary = f"Summary of the earlier conversation:\n{state['summary']}"
+        return [HumanMessage(content=summary)] + state["messages"]
+
+    def respond(state: AgentState, personality: Personality) -> BaseMessage:
+        def call(provider: Provider, config: Optional[RunnableConfig]) -> BaseMessage:
+            # The context cache lives on Gemini, so only Google can use it.
+            cached = None
+            if context_cache is not None and provider.name == "google":
+                cached = context_cache.get(str(system_message(personality).content))
+            if cached:
+                return provider.llm.invoke(  # type: ignore[no-any-return]
+                    cached_messages(state), config=config, cached_content=cached
+                )
+            return provider.with_tools.invoke(  # type: ignore[no-any-return]
+                build_messages(state, personality), config=config
+            )
+
+        return failover.invoke(call)
+
+    async def arespond(state: AgentState, personality: Personality) -> BaseMessage:
+        async def call(
+            provider: Provider, config: Optional[RunnableConfig]
+        ) -> BaseMessage:
+            cached = None
+            if context_cache is not None and provider.name == "google":
+                prompt = str(system_message(personality).content)
+                cached = await context_cache.aget(prompt)
+            if cached:
+                return await provider.llm.ainvoke(  # type: ignore[no-any-return]
+                    cached_messages(state), config=config, cached_content=cached
+                )
+            return await provider.with_tools.ainvoke(  # type: ignore[no-any-return]
+                build_messages(state, personality), config=config
+            )
+
+        return await failover.ainvoke(call)
+
+    def timed(tier: str, started: float) -> None:
+        # Without a cascade every step is the flagship's; nothing to compare.
+        if fast is None:
+            return
+        elapsed = time.perf_counter() - started
+        model_latency.observe(elapsed, tier=tier)
+        logger.info(f"The {tier} model replied in {elapsed:.2f}s")
+
+    def accepted(response: Optional[BaseMessage]) -> Optional[BaseMessage]:
+        """The fast model's reply, or None if the flagship must answer."""
+        if response is not None and not needs_escalation(response.text):
+            return response
+        model_escalations.inc()
+        logger.info("Escalating the turn to the flagship model")
+        return None
+
+    def cascade(state: AgentState, personality: Personality) -> BaseMessage:
+        if fast is not None and state.get("tier") == "fast":
+            started = time.perf_counter()
+            messages = build_messages(state, personality)
+            response: Optional[BaseMessage] = None
+            try:
+                response = fast.invoke(
+                    lambda p, config: p.llm.invoke(messages, config=config)
+                )
+            except ProvidersUnavailable:
+                pass  # escalated like an unusable reply
+            timed("fast", started)
+            response = accepted(response)
+            if response is not None:
+                return response
+        started = time.perf_counter()
+        response = respond(state, personality)
+        timed("flagship", started)
+        return response
+
+    async def acascade(state: AgentState, personality: Personality) -> BaseMessage:
+        if fast is not None and state.get("tier") == "fast":
+            started = time.perf_counter()
+            messages = build_messages(state, personality)
+            response: Optional[BaseMessage] = None
+            try:
+                response = await fast.ainvoke(
+                    lambda p, config: p.llm.ainvoke(messages, config=config)
+                )
+            except ProvidersUnavailable:
+                pass  # escalated like an unusable reply
+            timed("fast", started)
+            response = accepted(response)
+            if response is not None:
+                return response
+        started = time.perf_counter()
+        response = await arespond(state, personality)
+        timed("flagship", started)
+        return response
+
+    def small_talk(
+        state: AgentState, personality: Personality
+    ) -> Optional[Tuple[str, str]]:
+        """(scope, text) if this turn may use the response cache.
+
+        Only short user turns qualify, never a model step inside a tool loop.
+        The cache is shared by every chat of the persona, so the scope must
+        describe the whole prompt: the persona prompt plus every earlier
+        message, which only fits chats no longer than
+        RESPONSE_CACHE_CONTEXT_TURNS turns and not yet summarized. A reply is
+        thus only reused after the very same exchange and never carries
+        another chat's history.
+        """
+        if response_cache is None or state.get("summary"):
+            return None
+        *earlier, last = state["messages"]
+        if not isinstance(last, HumanMessage) or not isinstance(last.content, str):
+            return None
+        if len(last.content) > Config.RESPONSE_CACHE_MAX_CHARS:
+            return None
+        turns = split_turns(earlier)
+        if len(turns) > max(Config.RESPONSE_CACHE_CONTEXT_TURNS, 0):
+            return None
+        scope = [str(system_message(personality).content)]
+        for message in earlier:
+            # Replies after a selfie or voice note depend on it, not on the text
+            if isinstance(message, ToolMessage) or not isinstance(message.content, str):
+                return None
+            scope.append(f"{message.type}: {normalize(message.content)}")
+        return "\n".join(scope), last.content
+
+    def from_cache(key: Optional[Tuple[str, str]]) -> Optional[BaseMessage]:
+        if key is None or response_cache is None:
+            return None
+        reply = response_cache.lookup(*key)
+        if reply is None:
+            return None
+        return AIMessage(content=reply, response_metadata={"response_cache": True})
+
+    def remember(
+        key: Optional[Tuple[str, str]], response: BaseMessage, started: float
+    ) -> None:
+        if key is None or response_cache is None:
+            return
+        # Replies that call tools produce media, so they are never reused.
+        if getattr(response, "tool_calls", None) or not isinstance(
+            response.content, str
+        ):
+            return
+        response_cache.store(*key, response.content, time.perf_counter() - started)
+
+    def chatbot(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+        personality = personality_from(config)
+        key = small_talk(state, personality)
+        response = from_cache(key)
+        if response is None:
+            started = time.perf_counter()
+            response = cascade(state, personality)
+            record_usage(response)
+            remember(key, response, started)
+        return {"messages": [response]}
+
+    async def achatbot(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+        # Native async path used by ainvoke/astream so a slow LLM reply only
+        # suspends this chat instead of blocking the whole event loop.
+        personality = personality_from(config)
+        key = small_talk(state, personality)
+        response = from_cache(key)
+        if response is None:
+            started = time.perf_counter()
+            response = await acascade(state, personality)
+            record_usage(response)
+            remember(key, response, started)
         return {"messages": [response]}
 
+    def compact(dropped: list[BaseMessage], summary: str) -> Dict[str, Any]:
+        # Removing old turns from the checkpoint (not just from the prompt) keeps
+        # both the per-turn prompt size and the per-thread state bounded.
+        return {
+            "messages": [RemoveMessage(id=str(m.id)) for m in dropped],
+            "summary": summary,
+        }
+
+    def history_window(state: AgentState) -> list[BaseMessage]:
+        max_turns, max_tokens = Config.HISTORY_MAX_TURNS, Config.HISTORY_MAX_TOKENS
+        dropped, _ = select_window(state["messages"], max_turns, max_tokens)
+        if not dropped:
+            return dropped
+        # Over a limit: cut down to the low watermark, so the next several
+        # turns fit again without another trim (and summary request).
+        low = Config.HISTORY_LOW_WATERMARK
+        dropped, _ = select_window(
+            state["messages"],
+            max(1, int(max_turns * low)),
+            max(1, int(max_tokens * low)),
+        )
+        return dropped
+
+    def trim_history(state: AgentState) -> Dict[str, Any]:
+        # Every turn enters here first, so this is also where the media of the
+        # previous turn is cleared. A sync caller waits for the whole run
+        # anyway, so this path writes the summary inline (see atrim_history).
+        dropped = history_window(state)
+        if not dropped:
+            return {"media": None}
+        summary = state.get("summary", "")
+        if Config.HISTORY_SUMMARIZE:
+            request = summary_request(summary, dropped)
+            response = failover.invoke(
+                lambda p, config: p.llm.invoke(request, config=config)
+            )
+            summary = str(response.content)
+        return {**compact(dropped, summary), "media": None}
+
+    # Summaries being written in the background, per thread: the ids of the
+    # messages they cover and the task producing the new summary. Bounded like
+    # the checkpoint LRU, so chats that go quiet do not keep theirs forever; an
+    # evicted summary is requested again by the thread's next turn.
+    summarizing: OrderedDict[str, Tuple[set[str], asyncio.Task[BaseMessage]]] = (
+        OrderedDict()
+    )
+
+    def summarize(thread: str, ids: set[str], request: list[BaseMessage]) -> None:
+        # Detached from the turn's callbacks (tracing, streaming), which the
+        # task would otherwise inherit from the context it was created in.
+        # Summaries are not urgent enough to be worth a hedged request.
+        task = asyncio.create_task(
+            failover.ainvoke(
+                lambda p, config: p.llm.ainvoke(request, config=UNSTREAMED),
+                hedge=False,
+            )
+        )
+        summarizing[thread] = (ids, task)
+        while len(summarizing) > max(1, Config.CHECKPOINT_MAX_THREADS):
+            _, (_, evicted) = summarizing.popitem(last=False)
+            if evicted.done() and not evicted.cancelled():
+                evicted.exception()  # retrieved, so a failure is not reported
+            evicted.cancel()
+
+    async def atrim_history(
+        state: AgentState, config: RunnableConfig
+    ) -> Dict[str, Any]:
+        # The summary request runs as a background task so the turn that
+        # crosses the limit does not wait for it. The dropped messages stay in
+        # the checkpoint (and the prompt) until a later turn finds the summary
+        # ready and swaps them for it.
+        thread = str(config["configurable"]["thread_id"])
+        messages, summary = state["messages"], state.get("summary", "")
+        removed: list[BaseMessage] = []
+        if thread in summarizing:
+            ids, task = summarizing[thread]
+            if not task.done():
+                return {"media": None}
+            del summarizing[thread]
+            if task.cancelled() or task.exception() is not None:
+                logger.warning(f"Summarizing the history of {thread} failed; retrying")
+            else:
+                summary = str(task.result().content)
+                removed = [m for m in messages if m.id in ids]
+                messages = [m for m in messages if m.id not in ids]
+        dropped = history_window({**state, "messages": messages})
+        if dropped and Config.HISTORY_SUMMARIZE:
+            ids = {str(m.id) for m in dropped}
+            summarize(thread, ids, summary_request(summary, dropped))
+            dropped = []
+        removed += dropped
+        if not removed:
+            return {"media": None}
+        return {**compact(removed, summary), "media": None}
+
+    def route(state: AgentState) -> Dict[str, Any]:
+        # Runs once per user turn; the model steps of a tool loop keep its tier.
+        last = state["messages"][-1]
+        decision = FLAGSHIP
+        if isinstance(last, HumanMessage) and isinstance(last.content, str):
+            decision = route_text(last.content, Config.CASCADE_MAX_CHARS)
+        model_routes.inc(tier=decision.tier, reason=decision.reason)
+        logger.info(
+            f"Routing the turn to the {decision.tier} model ({decision.reason})"
+        )
+        return {"tier": decision.tier}
+
+    def media(state: AgentState) -> Dict[str, Any]:
+        # Only the tool results just appended are inspected, never the history.
+        return {"media": collect_media(state["messages"])}
+
     # Define the graph
     workflow = StateGraph(AgentState)
 
-    workflow.add_node("chatbot", chatbot)
-    workflow.add_node("tools", ToolNode(tools))
+    workflow.add_node("history", RunnableLambda(trim_history, afunc=atrim_history))
+    workflow.add_node(
+        "chatbot", traced_node("chatbot", RunnableLambda(chatbot, afunc=achatbot))
+    )
+    # ToolNode runs the calls of one AI message concurrently, so a selfie and a
+    # voice note take as long as the slower of the two.
+    tool_node = ToolNode(
+        tools, wrap_tool_call=run_tool_call, awrap_tool_call=arun_tool_call
+    )
+    workflow.add_node("tools", traced_node("tools", tool_node))
+    workflow.add_node("media", media)
 
-    workflow.set_entry_point("chatbot")
+    workflow.set_entry_point("history")
+    if fast is not None:
+        workflow.add_node("route", route)
+        workflow.add_edge("history", "route")
+        workflow.add_edge("route", "chatbot")
+    else:
+        workflow.add_edge("history", "chatbot")
 
     workflow.add_conditional_edges(
         "chatbot",
         tools_condition,
     )
-    workflow.add_edge("tools", "chatbot")
+    workflow.add_edge("tools", "media")
+    workflow.add_edge("media", "chatbot")
 
     # Compile the graph
-    # We use MemorySaver for simple in-memory checkpointing during a session
-    checkpointer = MemorySaver()
-    app = workflow.compile(checkpointer=checkpointer)
+    # Checkpoints go to SQLite behind a bounded LRU tier (see src/checkpoint.py)
+    app = workflow.compile(checkpointer=create_checkpointer())
 
     return app
+
+
+def bind_personality(graph: Any, personality: Personality) -> Any:
+    """Return a lightweight view of ``graph`` that always runs as ``personality``.
+
+    The view shares the compiled nodes, LLM client and checkpointer of ``graph``.
+    """
+    # A plain RunnableBinding deep-merges ``configurable`` with the per-call config
+    # (thread_id), unlike CompiledStateGraph.with_config which replaces it.
+    return RunnableBinding(
+        bound=graph, config={"configurable": {"personality": personality}}
+    )
+
+
+def create_agent(personality: Personality) -> Any:
+    return bind_personality(create_graph(), personality)
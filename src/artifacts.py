@@ -0,0 +1,121 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import IO, Callable, Dict, Iterator, Literal, Optional, TypedDict
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class MediaArtifact(TypedDict):
+    """Structured tool result pointing at media waiting in the store."""
+
+    kind: Literal["voice", "photo"]
+    artifact_id: str
+
+
+@dataclass
+class Artifact:
+    kind: str
+    filename: str
+    created: float
+    buffer: IO[bytes]
+
+
+class ArtifactStore:
+    """Holds media produced by tools until it has been sent.
+
+    Payloads live in ``SpooledTemporaryFile`` buffers: in memory up to
+    ``spill_bytes``, then in an anonymous temp file that the OS reclaims even
+    if the process dies. Artifacts are released after sending; anything left
+    behind (failed sends, CLI runs) is swept once older than ``ttl`` seconds.
+    """
+
+    def __init__(
+        self,
+        spill_bytes: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.spill_bytes = spill_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.swept = 0
+        self._lock = threading.Lock()
+        self._artifacts: Dict[str, Artifact] = {}
+
+    def put(self, kind: str, filename: str, data: bytes) -> str:
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.spill_bytes)
+        buffer.write(data)
+        return self._add(Artifact(kind, filename, self.clock(), buffer))
+
+    def put_file(self, kind: str, path: str) -> str:
+        """Copy an existing file in, e.g. a cache entry that may be evicted
+        before the artifact is sent. The file itself is left untouched."""
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.spill_bytes)
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, buffer)
+        return self._add(Artifact(kind, os.path.basename(path), self.clock(), buffer))
+
+    def get(self, artifact_id: str) -> Optional[Artifact]:
+        with self._lock:
+            return self._artifacts.get(artifact_id)
+
+    @contextmanager
+    def open(self, artifact_id: str) -> Iterator[IO[bytes]]:
+        artifact = self.get(artifact_id)
+        if artifact is None:
+            raise KeyError(f"Unknown or expired artifact: {artifact_id}")
+        artifact.buffer.seek(0)
+        yield artifact.buffer
+
+    def release(self, artifact_id: str) -> None:
+        with self._lock:
+            artifact = self._artifacts.pop(artifact_id, None)
+        if artifact is not None:
+            artifact.buffer.close()
+
+    def sweep(self) -> int:
+        cutoff = self.clock() - self.ttl
+        with self._lock:
+            expired = [
+                artifact_id
+                for artifact_id, artifact in self._artifacts.items()
+                if artifact.created < cutoff
+            ]
+        for artifact_id in expired:
+            self.release(artifact_id)
+        if expired:
+            self.swept += len(expired)
+            logger.info(f"Swept {len(expired)} unsent media artifacts")
+        return len(expired)
+
+    def _add(self, artifact: Artifact) -> str:
+        # Sweeping on write keeps leftovers bounded without a background task.
+        self.sweep()
+        artifact_id = uuid.uuid4().hex
+        with self._lock:
+            self._artifacts[artifact_id] = artifact
+        return artifact_id
+
+    def __len__(self) -> int:
+        return len(self._artifacts)
+
+
+_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    global _store
+    if _store is None:
+        _store = ArtifactStore(
+            Config.ARTIFACT_SPILL_KB * 1024, Config.ARTIFACT_TTL_SECONDS
+        )
+    return _store
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class DiskCache:
+    """Size-bounded, content-addressed file cache with LRU eviction.
+
+    Entries are files named after a hash of their key parts. Writers produce a
+    temp file inside the cache directory (``reserve``) and publish it with an
+    atomic rename (``commit``), so readers never see a partial file. Recency is
+    tracked in memory and persisted through file mtimes across restarts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = "") -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+
+        files = sorted(
+            self.directory.glob(f"*{suffix}"), key=lambda p: p.stat().st_mtime
+        )
+        for file_path in files:
+            if file_path.name.startswith("."):
+                continue
+            size = file_path.stat().st_size
+            self._entries[file_path.name[: len(file_path.name) - len(suffix)]] = size
+            self._size += size
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        with self._lock:
+            if key not in self._entries or not path.exists():
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        os.utime(path)
+        return str(path)
+
+    def reserve(self) -> str:
+        """Return a fresh temp path in the cache directory for a writer."""
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        os.close(fd)
+        return path
+
+    def commit(self, key: str, temp_path: str) -> str:
+        """Atomically publish ``temp_path`` under ``key`` and enforce the size cap."""
+        path = self.path_for(key)
+        os.replace(temp_path, path)
+        size = path.stat().st_size
+        with self._lock:
+            self._size += size - self._entries.get(key, 0)
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            # Never evict the entry that was just written.
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                self.path_for(old_key).unlink(missing_ok=True)
+        return str(path)
+
+    def put_bytes(self, key: str, data: bytes) -> str:
+        temp_path = self.reserve()
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return self.commit(key, temp_path)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,528 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+CacheKey = Tuple[str, str]
+
+
+def _parent_config(
+    thread_id: str, checkpoint_ns: str, parent_id: Optional[str]
+) -> Optional[RunnableConfig]:
+    if not parent_id:
+        return None
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": parent_id,
+        }
+    }
+
+
+class SQLiteSaver(BaseCheckpointSaver[int]):
+    """Checkpointer that stores LangGraph checkpoints in a SQLite database.
+
+    File databases run in WAL mode so reads never wait on the writer. Only the
+    newest ``keep_versions`` checkpoints of each thread are kept; older versions
+    and their pending writes are pruned on every put. With ``max_threads``, a
+    put that starts a thread beyond the cap also deletes the threads written
+    least recently, so the database cannot grow with every chat ever seen.
+    """
+
+    def __init__(
+        self, path: str = ":memory:", keep_versions: int = 3, max_threads: int = 0
+    ) -> None:
+        super().__init__()
+        self.keep_versions = max(1, keep_versions)
+        self.max_threads = max(0, max_threads)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Stored threads, counted only when capped
+        self.threads = 0
+        if self.max_threads:
+            self.threads = self.conn.execute(
+                "SELECT COUNT(DISTINCT thread_id) FROM checkpoints"
+            ).fetchone()[0]
+
+    def _load_tuple(self, row: Tuple[Any, ...]) -> CheckpointTuple:
+        (thread_id, ns, checkpoint_id, parent_id, type_, blob, meta_type, meta) = row
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+            "ORDER BY task_id, idx",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((type_, blob)),
+            metadata=self.serde.loads_typed((meta_type, meta)),
+            parent_config=_parent_config(thread_id, ns, parent_id),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((w_type, value)))
+                for task_id, channel, w_type, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params: List[Any] = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        query += " ORDER BY checkpoint_id DESC LIMIT 1"
+
+        with self.lock:
+            row = self.conn.execute(query, params).fetchone()
+            return self._load_tuple(row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (
+                checkpoint_ns := config["configurable"].get("checkpoint_ns")
+            ) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+
+        query = "SELECT * FROM checkpoints"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results: List[CheckpointTuple] = []
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                item = self._load_tuple(row)
+                if filter and not all(
+                    item.metadata.get(key) == value for key, value in filter.items()
+                ):
+                    continue
+                results.append(item)
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        meta_type, meta = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        key = (thread_id, checkpoint_ns)
+
+        with self.lock, self.conn:
+            new_thread = self.max_threads and not self._stored(thread_id)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    blob,
+                    meta_type,
+                    meta,
+                ),
+            )
+            # Prune old versions so each thread's footprint stays constant.
+            self.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND checkpoint_id NOT IN (SELECT checkpoint_id FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT ?)",
+                (*key, *key, self.keep_versions),
+            )
+            self.conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND checkpoint_id < (SELECT MIN(checkpoint_id) FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ?)",
+                (*key, *key),
+            )
+            if new_thread:
+                self.threads += 1
+                self._drop_oldest_threads()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        with self.lock, self.conn:
+            for idx, (channel, value) in enumerate(writes):
+                write_idx = WRITES_IDX_MAP.get(channel, idx)
+                # Regular writes are idempotent; special channels overwrite.
+                verb = "INSERT OR IGNORE" if write_idx >= 0 else "INSERT OR REPLACE"
+                type_, blob = self.serde.dumps_typed(value)
+                self.conn.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint_id,
+                        task_id,
+                        write_idx,
+                        channel,
+                        type_,
+                        blob,
+                        task_path,
+                    ),
+                )
+
+    def _stored(self, thread_id: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM checkpoints WHERE thread_id = ? LIMIT 1", (thread_id,)
+        ).fetchone()
+        return row is not None
+
+    def _delete(self, thread_id: str) -> None:
+        deleted = self.conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,)
+        ).rowcount
+        self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        if deleted and self.max_threads:
+            self.threads -= 1
+
+    def _drop_oldest_threads(self) -> None:
+        excess = self.threads - self.max_threads
+        if excess <= 0:
+            return
+        # Checkpoint ids grow with time, so a thread's newest one dates its
+        # last write.
+        rows = self.conn.execute(
+            "SELECT thread_id FROM checkpoints GROUP BY thread_id "
+            "ORDER BY MAX(checkpoint_id) LIMIT ?",
+            (excess,),
+        ).fetchall()
+        for (thread_id,) in rows:
+            self._delete(thread_id)
+        logger.debug(f"Dropped {len(rows)} least recently active thread(s)")
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock, self.conn:
+            self._delete(thread_id)
+
+    # SQLite calls are short but still touch disk, so the async API runs them
+    # in a worker thread to keep the event loop free.
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+class LRUCheckpointSaver(BaseCheckpointSaver[int]):
+    """In-memory LRU tier in front of a persistent checkpointer.
+
+    The latest checkpoint of the ``max_threads`` most recently active threads is
+    served from memory; everything is written through to ``backend``, where
+    evicted threads are reloaded from.
+    """
+
+    def __init__(self, backend: BaseCheckpointSaver[Any], max_threads: int) -> None:
+        super().__init__(serde=backend.serde)
+        self.backend = backend
+        self.max_threads = max(1, max_threads)
+        self.cache: OrderedDict[CacheKey, CheckpointTuple] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(config: RunnableConfig) -> CacheKey:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", "")
+
+    def _lookup(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if get_checkpoint_id(config):
+            return None
+        with self.lock:
+            item = self.cache.get(self._key(config))
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.cache.move_to_end(self._key(config))
+        # The graph mutates the checkpoint it resumes from, so hand out a copy.
+        return item._replace(checkpoint=copy_checkpoint(item.checkpoint))
+
+    def _remember(self, key: CacheKey, item: CheckpointTuple) -> None:
+        evicted = 0
+        with self.lock:
+            self.cache[key] = item
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_threads:
+                self.cache.popitem(last=False)
+                evicted += 1
+        if evicted:
+            logger.debug(f"Evicted {evicted} thread(s) from checkpoint cache")
+
+    def _forget(self, config: RunnableConfig) -> None:
+        with self.lock:
+            self.cache.pop(self._key(config), None)
+
+    def _saved(
+        self,
+        config: RunnableConfig,
+        new_config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+    ) -> None:
+        thread_id, checkpoint_ns = self._key(config)
+        self._remember(
+            (thread_id, checkpoint_ns),
+            CheckpointTuple(
+                config=new_config,
+                checkpoint=checkpoint,
+                metadata=get_checkpoint_metadata(config, metadata),
+                parent_config=_parent_config(
+                    thread_id, checkpoint_ns, get_checkpoint_id(config)
+                ),
+                pending_writes=[],
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if item := self._lookup(config):
+            return item
+        item = self.backend.get_tuple(config)
+        if item and not get_checkpoint_id(config):
+            self._remember(self._key(config), item)
+        return item
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        return self.backend.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        new_config = self.backend.put(config, checkpoint, metadata, new_versions)
+        self._saved(config, new_config, checkpoint, metadata)
+        return new_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        # Pending writes are rare and short-lived; let the next read reload them.
+        self._forget(config)
+        self.backend.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            for key in [key for key in self.cache if key[0] == thread_id]:
+                del self.cache[key]
+        self.backend.delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if item := self._lookup(config):
+            return item
+        item = await self.backend.aget_tuple(config)
+        if item and not get_checkpoint_id(config):
+            self._remember(self._key(config), item)
+        return item
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.backend.alist(
+            config, filter=filter, before=before, limit=limit
+        ):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        new_config = await self.backend.aput(config, checkpoint, metadata, new_versions)
+        self._saved(config, new_config, checkpoint, metadata)
+        return new_config
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self._forget(config)
+        await self.backend.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            for key in [key for key in self.cache if key[0] == thread_id]:
+                del self.cache[key]
+        await self.backend.adelete_thread(thread_id)
+
+
+def create_checkpointer() -> LRUCheckpointSaver:
+    """Build the checkpointer configured by the CHECKPOINT_* settings.
+
+    Without CHECKPOINT_DB the backing store is an in-memory SQLite database
+    holding at most CHECKPOINT_MEMORY_MAX_THREADS chats (the least recently
+    active are forgotten beyond that), and never fewer than the LRU tier.
+    """
+    max_stored = 0
+    if not Config.CHECKPOINT_DB and Config.CHECKPOINT_MEMORY_MAX_THREADS:
+        max_stored = max(
+            Config.CHECKPOINT_MEMORY_MAX_THREADS, Config.CHECKPOINT_MAX_THREADS
+        )
+    backend = SQLiteSaver(
+        Config.CHECKPOINT_DB or ":memory:",
+        keep_versions=Config.CHECKPOINT_KEEP_VERSIONS,
+        max_threads=max_stored,
+    )
+    return LRUCheckpointSaver(backend, max_threads=Config.CHECKPOINT_MAX_THREADS)
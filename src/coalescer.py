@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Batch(Generic[T]):
+    items: List[T] = field(default_factory=list)
+    done: "asyncio.Future[None]" = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class MessageCoalescer(Generic[T]):
+    """Serializes work per key and merges bursts into a single batch.
+
+    The first item for a key opens a batch that stays open for ``debounce``
+    seconds; everything submitted for that key in the meantime is handed to
+    ``handler`` together. Items that arrive while a batch is being handled go
+    into the next batch, so batches for one key never overlap, while different
+    keys are processed concurrently.
+    """
+
+    def __init__(
+        self, handler: Callable[[List[T]], Awaitable[None]], debounce: float = 0.0
+    ) -> None:
+        self.handler = handler
+        self.debounce = debounce
+        self._pending: Dict[Hashable, _Batch[T]] = {}
+        self._workers: Dict[Hashable, "asyncio.Task[None]"] = {}
+        self.items = 0
+        self.batches = 0
+
+    async def submit(self, key: Hashable, item: T) -> None:
+        """Queue ``item`` and wait until the batch containing it was handled."""
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch()
+        batch.items.append(item)
+        self.items += 1
+
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        # Shield so a cancelled submitter doesn't cancel the shared batch.
+        await asyncio.shield(batch.done)
+
+    async def _drain(self, key: Hashable) -> None:
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self.debounce)
+                batch = self._pending.pop(key)
+                self.batches += 1
+                if len(batch.items) > 1:
+                    logger.info(f"Coalesced {len(batch.items)} messages for {key}")
+                try:
+                    await self.handler(batch.items)
+                except Exception as e:
+                    batch.done.set_exception(e)
+                else:
+                    batch.done.set_result(None)
+                finally:
+                    # Cancelled mid-batch (shutdown): release its submitters.
+                    if not batch.done.done():
+                        batch.done.cancel()
+        finally:
+            self._workers.pop(key, None)
+            # Cancelled while debouncing: the batch that was filling up will
+            # not be handled either.
+            if (pending := self._pending.pop(key, None)) is not None:
+                pending.done.cancel()
+
+    def queue_depth(self) -> int:
+        return sum(len(batch.items) for batch in self._pending.values())
@@ -1,7 +1,7 @@
-import json
 import os
+import tempfile
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import List, Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -22,6 +22,21 @@ class Config:
     TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     EDGE_TTS_VOICE = os.getenv("EDGE_TTS_VOICE", "en-US-AriaNeural")
+    EDGE_TTS_RATE = os.getenv("EDGE_TTS_RATE", "+0%")
+    EDGE_TTS_PITCH = os.getenv("EDGE_TTS_PITCH", "+0Hz")
+    # On-disk cache of synthesized voice clips
+    TTS_CACHE_DIR = os.getenv(
+        "TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "girlfriendgpt-tts")
+    )
+    TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "100"))
+    # Sentences of a voice reply synthesized at once (the rest wait their turn)
+    TTS_PIPELINE_DEPTH = int(os.getenv("TTS_PIPELINE_DEPTH", "3"))
+    # Voice note format: 'mp3' (as edge-tts makes it) or 'ogg' (Opus, a third of
+    # the bytes but transcoded on the MEDIA_WORKERS threads, which costs CPU)
+    VOICE_FORMAT = os.getenv("VOICE_FORMAT", "mp3").lower()
+    VOICE_OPUS_BITRATE = int(os.getenv("VOICE_OPUS_BITRATE", "24000"))
+    # Threads for CPU-bound media encoding (voice transcoding, selfie processing)
+    MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "1"))
 
     # New configuration for LLM provider
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google")  # 'google' or 'ollama'
@@ -29,30 +44,140 @@ class Config:
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")  # Default model for Ollama
 
-    CURRENT_YEAR = 2026  # Updated for 2026 timeline
+    # LLM requests are abandoned after LLM_TIMEOUT_SECONDS (0: never) and then
+    # sent to LLM_FALLBACK_PROVIDER ('google', 'ollama' or empty for none). A
+    # provider failing LLM_BREAKER_FAILURES times in a row is skipped for
+    # LLM_BREAKER_RESET_SECONDS before it is tried again.
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER", "").lower()
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+    LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+    # Hedging: also ask the fallback provider when the primary has not replied
+    # within its p95 latency (LLM_HEDGE_DELAY_SECONDS until that is known)
+    LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+    LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "5"))
 
-    @staticmethod
-    def load_personalities(
-        personalities_dir: str = "src/personalities",
-    ) -> Dict[str, Personality]:
-        personalities: Dict[str, Personality] = {}
-        path = Path(personalities_dir)
-        if not path.exists():
-            return personalities
-
-        for file_path in path.glob("*.json"):
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    personality = Personality(**data)
-                    personalities[personality.name.lower()] = personality
-            except Exception as e:
-                print(f"Error loading personality from {file_path}: {e}")
-
-        return personalities
+    # Model cascade: user turns of small talk up to CASCADE_MAX_CHARS go to a
+    # fast model without tools, and its reply is redone by the models above
+    # (with tools) when it is empty or talks about sending media
+    MODEL_CASCADE = os.getenv("MODEL_CASCADE", "false").lower() == "true"
+    GOOGLE_FAST_MODEL = os.getenv("GOOGLE_FAST_MODEL", "gemini-3.0-flash")
+    OLLAMA_FAST_MODEL = os.getenv("OLLAMA_FAST_MODEL", "llama3.2")
+    CASCADE_MAX_CHARS = int(os.getenv("CASCADE_MAX_CHARS", "80"))
+
+    # Conversation window sent to the model (and kept in the checkpoint)
+    HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "20"))
+    HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "4000"))
+    # Dropped turns are summarized in the background; a later turn swaps them
+    # for the summary once it is ready
+    HISTORY_SUMMARIZE = os.getenv("HISTORY_SUMMARIZE", "false").lower() == "true"
+    # Once over a limit, the window is cut to this fraction of both limits, so
+    # old turns are dropped (and summarized) in batches rather than every turn
+    HISTORY_LOW_WATERMARK = float(os.getenv("HISTORY_LOW_WATERMARK", "0.5"))
+
+    # Checkpoint storage: SQLite file (empty = in-memory) behind an LRU tier of
+    # CHECKPOINT_MAX_THREADS chats. The in-memory store keeps the history of
+    # CHECKPOINT_MEMORY_MAX_THREADS chats and forgets the least recently
+    # active beyond that (0: never, so memory grows with every chat).
+    CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "")
+    CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+    CHECKPOINT_MEMORY_MAX_THREADS = int(
+        os.getenv("CHECKPOINT_MEMORY_MAX_THREADS", "10000")
+    )
+    CHECKPOINT_KEEP_VERSIONS = int(os.getenv("CHECKPOINT_KEEP_VERSIONS", "3"))
+
+    # Personality JSON files (by default the bundled ones, wherever the bot is
+    # started from); edits are picked up after at most this many seconds
+    PERSONALITIES_DIR = os.getenv(
+        "PERSONALITIES_DIR", str(Path(__file__).resolve().parent / "personalities")
+    )
+    PERSONALITY_RELOAD_SECONDS = float(os.getenv("PERSONALITY_RELOAD_SECONDS", "2"))
+
+    # Maximum number of personality-bound agents kept in the registry
+    AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "32"))
+
+    # Messages from one chat arriving within this window are merged into one turn
+    CHAT_DEBOUNCE_SECONDS = float(os.getenv("CHAT_DEBOUNCE_SECONDS", "0.3"))
+
+    # Stream replies token by token (Telegram message edits / CLI printout)
+    STREAM_REPLIES = os.getenv("STREAM_REPLIES", "false").lower() == "true"
+    STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+    # Calls of one tool allowed to run at once across all chats (edge-tts
+    # quota); "Name=N" pairs, unlisted tools are not limited. Selfies are
+    # bounded by the SELFIE_* settings below instead.
+    TOOL_CONCURRENCY = os.getenv("TOOL_CONCURRENCY", "VoiceTool=8")
+
+    # Selfie generation: concurrent Imagen calls, extra requests allowed to
+    # wait, per-chat rate limit, and an on-disk cache of recent selfies
+    SELFIE_WORKERS = int(os.getenv("SELFIE_WORKERS", "2"))
+    SELFIE_QUEUE_SIZE = int(os.getenv("SELFIE_QUEUE_SIZE", "16"))
+    SELFIE_RATE_LIMIT = int(os.getenv("SELFIE_RATE_LIMIT", "10"))
+    SELFIE_RATE_WINDOW_SECONDS = float(os.getenv("SELFIE_RATE_WINDOW_SECONDS", "3600"))
+    SELFIE_CACHE_DIR = os.getenv(
+        "SELFIE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "girlfriendgpt-selfies")
+    )
+    SELFIE_CACHE_MAX_MB = int(os.getenv("SELFIE_CACHE_MAX_MB", "200"))
+    # Selfies are sent downscaled to SELFIE_MAX_SIDE pixels and re-encoded
+    # as 'jpeg' or 'webp'; SELFIE_MAX_KB (0: none) lowers the quality to fit
+    SELFIE_MAX_SIDE = int(os.getenv("SELFIE_MAX_SIDE", "1280"))
+    SELFIE_FORMAT = os.getenv("SELFIE_FORMAT", "jpeg").lower()
+    SELFIE_QUALITY = int(os.getenv("SELFIE_QUALITY", "85"))
+    SELFIE_MAX_KB = int(os.getenv("SELFIE_MAX_KB", "0"))
+    SELFIE_STRIP_METADATA = os.getenv("SELFIE_STRIP_METADATA", "true").lower() == "true"
+
+    # Telegram file_id reuse for media already uploaded once (empty: memory only)
+    MEDIA_INDEX_PATH = os.getenv("MEDIA_INDEX_PATH", "")
+
+    # Generated media is kept in memory up to this size, then spilled to disk;
+    # artifacts that were never sent are dropped after the TTL
+    ARTIFACT_SPILL_KB = int(os.getenv("ARTIFACT_SPILL_KB", "1024"))
+    ARTIFACT_TTL_SECONDS = float(os.getenv("ARTIFACT_TTL_SECONDS", "600"))
+
+    # Telegram delivery: max updates processed at once, and webhook mode
+    # (--webhook) settings; WEBHOOK_URL is the public HTTPS base URL
+    CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    # Bot processes (> 1 runs a supervisor sharding chats across workers)
+    WORKERS = int(os.getenv("WORKERS", "1"))
+
+    # Prometheus-style /metrics (and /traces) on this local port; 0 disables it.
+    # Supervised workers serve theirs on METRICS_PORT + shard.
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
+    # Gemini only: upload each persona's system prompt and tool declarations
+    # once as a context cache and reference it on every turn
+    GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+    GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+    # Reuse replies to short, near-identical turns ("oi", "boa noite") per
+    # persona instead of calling the LLM, in chats of at most
+    # RESPONSE_CACHE_CONTEXT_TURNS earlier turns that match exactly (user text
+    # and replies, normalized). Longer chats always reach the LLM, so a reply
+    # never carries another chat's history. "ngram" matches by a local character
+    # n-gram embedding, "exact" only by normalized text
+    RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "false").lower() == "true"
+    RESPONSE_CACHE_EMBEDDING = os.getenv("RESPONSE_CACHE_EMBEDDING", "ngram")
+    RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.85"))
+    RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    RESPONSE_CACHE_MAX_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_CHARS", "40"))
+    RESPONSE_CACHE_CONTEXT_TURNS = int(os.getenv("RESPONSE_CACHE_CONTEXT_TURNS", "1"))
+
+    CURRENT_YEAR = 2026  # Updated for 2026 timeline
 
     @staticmethod
     def validate() -> None:
-        if Config.LLM_PROVIDER == "google" and not Config.GOOGLE_API_KEY:
+        uses_google = "google" in (Config.LLM_PROVIDER, Config.LLM_FALLBACK_PROVIDER)
+        if uses_google and not Config.GOOGLE_API_KEY:
             raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+        if Config.VOICE_FORMAT not in ("mp3", "ogg"):
+            raise ValueError(
+                f"VOICE_FORMAT must be 'mp3' or 'ogg', not {Config.VOICE_FORMAT!r}."
+            )
         # Telegram token is optional for CLI mode, but generally required for the bot
@@ -0,0 +1,144 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from google.genai import types
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+logger = logging.getLogger(__name__)
+
+
+def genai_tools(tools: Sequence[Any]) -> List[types.Tool]:
+    """Declare LangChain tools to Gemini through their JSON schemas."""
+    functions = [convert_to_openai_tool(tool)["function"] for tool in tools]
+    if not functions:
+        return []
+    declarations = [
+        types.FunctionDeclaration(
+            name=function["name"],
+            description=function.get("description", ""),
+            parameters_json_schema=function.get("parameters"),
+        )
+        for function in functions
+    ]
+    return [types.Tool(function_declarations=declarations)]
+
+
+class GeminiContextCache:
+    """Gemini cached contents holding each persona's static request prefix.
+
+    The system prompt and the tool declarations are uploaded once per distinct
+    prompt and then referenced by name, so they are not resent (or billed at
+    the full input rate) on every turn. Gemini refuses requests that combine a
+    cache with their own system instruction or tools, which is why both live
+    in the cache. If creation fails, for example because the prompt is below
+    the model's minimum cacheable size, ``None`` is returned (and remembered
+    for one TTL) so callers fall back to a regular request. Concurrent
+    requests for a prompt without a cache share one creation, as
+    ``SelfieService`` does for selfies, so it is created (and billed) once.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        model: str,
+        tools: Sequence[Any],
+        ttl_seconds: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.client = client
+        self.model = model
+        self.tools = genai_tools(tools)
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.created = 0
+        self.failures = 0
+        self.deduplicated = 0
+        # prompt -> (cache name or None, refresh deadline)
+        self._entries: Dict[str, Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future[Optional[str]]] = {}
+
+    def _config(self, prompt: str) -> types.CreateCachedContentConfig:
+        return types.CreateCachedContentConfig(
+            system_instruction=prompt,
+            tools=self.tools,
+            ttl=f"{self.ttl_seconds}s",
+        )
+
+    def _claim(
+        self, prompt: str
+    ) -> Tuple[bool, "concurrent.futures.Future[Optional[str]]"]:
+        """(owner, future) for ``prompt``: the owner creates the cache and
+        resolves the future, which everyone else waits for."""
+        with self._lock:
+            entry = self._entries.get(prompt)
+            if entry is not None and self.clock() < entry[1]:
+                future: concurrent.futures.Future[Optional[str]]
+                future = concurrent.futures.Future()
+                future.set_result(entry[0])
+                return False, future
+            if prompt in self._inflight:
+                self.deduplicated += 1
+                return False, self._inflight[prompt]
+            future = self._inflight[prompt] = concurrent.futures.Future()
+            # A waiter that gives up cannot cancel the shared creation.
+            future.set_running_or_notify_cancel()
+            return True, future
+
+    def _finish(
+        self,
+        prompt: str,
+        future: "concurrent.futures.Future[Optional[str]]",
+        name: Optional[str],
+        remember: bool = True,
+    ) -> Optional[str]:
+        with self._lock:
+            if remember:
+                # Refresh a little before Gemini expires the cache server-side.
+                deadline = self.clock() + self.ttl_seconds * 0.9
+                self._entries[prompt] = (name, deadline)
+            del self._inflight[prompt]
+        future.set_result(name)
+        return name
+
+    def _failed(self, error: Exception) -> None:
+        self.failures += 1
+        logger.warning(
+            f"Gemini context cache unavailable, sending full prompt: {error}"
+        )
+
+    def get(self, prompt: str) -> Optional[str]:
+        owner, future = self._claim(prompt)
+        if not owner:
+            return future.result()
+        try:
+            cache = self.client.caches.create(
+                model=self.model, config=self._config(prompt)
+            )
+        except Exception as e:
+            self._failed(e)
+            return self._finish(prompt, future, None)
+        self.created += 1
+        return self._finish(prompt, future, cache.name)
+
+    async def aget(self, prompt: str) -> Optional[str]:
+        owner, future = self._claim(prompt)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            cache = await self.client.aio.caches.create(
+                model=self.model, config=self._config(prompt)
+            )
+        except Exception as e:
+            self._failed(e)
+            return self._finish(prompt, future, None)
+        except BaseException:
+            # Cancelled: waiters send the full prompt, the next turn retries.
+            self._finish(prompt, future, None, remember=False)
+            raise
+        self.created += 1
+        return self._finish(prompt, future, cache.name)
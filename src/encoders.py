@@ -0,0 +1,104 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Lowest quality tried when shrinking an image to fit ``max_bytes``
+MIN_QUALITY = 40
+# Image metadata carried over when it is not stripped
+KEPT_METADATA = ("exif", "icc_profile")
+
+_encoder: Optional[ThreadPoolExecutor] = None
+
+
+def get_encoder() -> ThreadPoolExecutor:
+    """Threads for CPU-bound media encoding.
+
+    Kept apart from asyncio's default executor and small, so a burst of
+    encodes cannot starve the event loop of CPU on a small host. Pillow and
+    FFmpeg release the GIL while they work, so threads suffice.
+    """
+    global _encoder
+    if _encoder is None:
+        _encoder = ThreadPoolExecutor(
+            max(1, Config.MEDIA_WORKERS), thread_name_prefix="encoder"
+        )
+    return _encoder
+
+
+@dataclass(frozen=True)
+class ImageOptions:
+    # Longest side kept; Telegram shows photos at up to 1280 pixels
+    max_side: int = 1280
+    # "jpeg" or "webp"
+    format: str = "jpeg"
+    quality: int = 85
+    # Lower the quality until the image fits (0: no size target)
+    max_bytes: int = 0
+    strip_metadata: bool = True
+
+    @property
+    def suffix(self) -> str:
+        return ".webp" if self.format == "webp" else ".jpg"
+
+    def key(self) -> str:
+        """Identifies the options, for caching processed images."""
+        return (
+            f"{self.max_side}:{self.format}:{self.quality}:"
+            f"{self.max_bytes}:{self.strip_metadata}"
+        )
+
+
+def _encode(
+    picture: Image.Image, options: ImageOptions, quality: int, metadata: Dict[str, Any]
+) -> bytes:
+    output = io.BytesIO()
+    if options.format == "webp":
+        picture.save(output, "WEBP", quality=quality, method=4, **metadata)
+    else:
+        picture.save(output, "JPEG", quality=quality, optimize=True, **metadata)
+    return output.getvalue()
+
+
+def process_image(image: bytes, options: ImageOptions) -> Optional[bytes]:
+    """Downscale ``image`` to ``options.max_side`` and re-encode it.
+
+    With a ``max_bytes`` target, the highest quality between MIN_QUALITY and
+    ``options.quality`` that fits is found by bisection; if none fits, the
+    smallest encoding is returned. Returns None for data Pillow cannot
+    decode. CPU-bound: run it on ``get_encoder()``.
+    """
+    try:
+        with Image.open(io.BytesIO(image)) as source:
+            picture = source.convert("RGB")
+            metadata = {
+                name: source.info[name]
+                for name in KEPT_METADATA
+                if not options.strip_metadata and source.info.get(name)
+            }
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not decode generated image: {e}")
+        return None
+    picture.thumbnail((options.max_side, options.max_side))
+
+    data = _encode(picture, options, options.quality, metadata)
+    if not options.max_bytes or len(data) <= options.max_bytes:
+        return data
+    low, high = MIN_QUALITY, options.quality - 1
+    best: Optional[bytes] = None
+    while low <= high:
+        quality = (low + high) // 2
+        candidate = _encode(picture, options, quality, metadata)
+        if len(candidate) <= options.max_bytes:
+            best, low = candidate, quality + 1
+        else:
+            data = min(data, candidate, key=len)
+            high = quality - 1
+    return best if best is not None else data
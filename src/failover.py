@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+from langchain_core.runnables import RunnableConfig
+
+from src.telemetry import LabelValues, metrics, span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Latencies kept per provider, and how many are needed before their p95
+# replaces the configured hedge delay
+LATENCY_WINDOW = 100
+MIN_LATENCY_SAMPLES = 20
+# Config for a hedged backup request: its tokens are not streamed (the
+# primary's may already be on screen) and only its final reply is used.
+UNSTREAMED: RunnableConfig = {"callbacks": []}
+
+
+class ProvidersUnavailable(Exception):
+    """Every provider failed or has its circuit open."""
+
+
+class CircuitBreaker:
+    """Stops calling a provider after ``threshold`` consecutive failures.
+
+    While open, calls are refused for ``reset_seconds``; then a single trial
+    call is let through (half-open), which closes the circuit on success or
+    opens it again on failure.
+    """
+
+    def __init__(
+        self,
+        threshold: int,
+        reset_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.threshold = max(1, threshold)
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a call may be made now; reserves the half-open trial."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "open" or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self._trial = False
+
+    def release(self) -> None:
+        """Give back a trial whose call was abandoned without an outcome."""
+        with self._lock:
+            self._trial = False
+
+
+@dataclass
+class Provider:
+    name: str
+    # The chat model, and the same model with the tools bound
+    llm: Any
+    with_tools: Any
+    breaker: CircuitBreaker
+    latencies: Deque[float] = field(
+        default_factory=lambda: deque(maxlen=LATENCY_WINDOW)
+    )
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+# Makes one request to the provider; the config is None or UNSTREAMED.
+Call = Callable[[Provider, Optional[RunnableConfig]], T]
+
+
+class Failover:
+    """Sends each LLM request to the first provider that answers.
+
+    Providers are tried in order, skipping those whose circuit is open. A
+    request that fails or outlives ``timeout`` seconds counts against its
+    provider and moves on to the next one. With ``hedge``, an async request
+    still unanswered after the primary's p95 latency (``hedge_delay`` until
+    enough replies were seen) is also sent to the next provider, and the
+    first reply wins; the other request is cancelled.
+
+    The sync path cannot abandon a call, so there it relies on the clients'
+    own timeouts and does not hedge.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[Provider],
+        timeout: Optional[float],
+        hedge: bool = False,
+        hedge_delay: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.providers = list(providers)
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.clock = clock
+        _failovers.add(self)
+
+    def _succeeded(self, provider: Provider, started: float) -> None:
+        elapsed = self.clock() - started
+        provider.breaker.success()
+        provider.latencies.append(elapsed)
+        llm_latency.observe(elapsed, provider=provider.name)
+
+    def _failed(self, provider: Provider, started: float, error: Exception) -> None:
+        provider.breaker.failure()
+        reason = "timeout" if isinstance(error, TimeoutError) else "error"
+        llm_failures.inc(provider=provider.name, reason=reason)
+        logger.warning(
+            f"LLM provider {provider.name} failed after "
+            f"{self.clock() - started:.1f}s ({reason}): {error!r}"
+        )
+
+    def _unavailable(self) -> ProvidersUnavailable:
+        names = ", ".join(p.name for p in self.providers)
+        return ProvidersUnavailable(f"No LLM provider answered ({names})")
+
+    def invoke(self, call: Call[T]) -> T:
+        errors: List[Exception] = []
+        for provider in self.providers:
+            if not provider.breaker.allow():
+                continue
+            started = self.clock()
+            try:
+                with span("llm", provider=provider.name):
+                    result = call(provider, None)
+            except Exception as e:
+                self._failed(provider, started, e)
+                errors.append(e)
+                continue
+            self._succeeded(provider, started)
+            return result
+        raise self._unavailable() from (errors[-1] if errors else None)
+
+    async def _attempt(
+        self,
+        provider: Provider,
+        call: Call[Awaitable[T]],
+        config: Optional[RunnableConfig],
+    ) -> T:
+        started = self.clock()
+        try:
+            with span("llm", provider=provider.name, hedged=config is not None):
+                result = await asyncio.wait_for(call(provider, config), self.timeout)
+        except asyncio.CancelledError:
+            # The loser of a race: its latency is at least this long.
+            provider.latencies.append(self.clock() - started)
+            provider.breaker.release()
+            raise
+        except Exception as e:
+            self._failed(provider, started, e)
+            raise
+        self._succeeded(provider, started)
+        return result
+
+    async def _race(
+        self,
+        provider: Provider,
+        backups: List[Provider],
+        call: Call[Awaitable[T]],
+    ) -> T:
+        """Run ``call`` on ``provider``, hedged with the first backup allowed."""
+        primary = asyncio.ensure_future(self._attempt(provider, call, None))
+        tasks = {primary}
+        try:
+            delay = provider.p95() or self.hedge_delay
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            while backups:
+                backup = backups.pop(0)
+                if backup.breaker.allow():
+                    break
+            else:
+                return await primary
+            logger.info(
+                f"No reply from {provider.name} after {delay:.1f}s, "
+                f"also asking {backup.name}"
+            )
+            llm_hedges.inc(provider=backup.name)
+            tasks.add(asyncio.ensure_future(self._attempt(backup, call, UNSTREAMED)))
+            while True:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            llm_hedges_won.inc(provider=backup.name)
+                        return task.result()
+                if not tasks:
+                    # Both failed: re-raise the last failure
+                    return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def ainvoke(self, call: Call[Awaitable[T]], hedge: bool = True) -> T:
+        """Like ``invoke``, with deadlines and (if enabled and ``hedge``)
+        hedging."""
+        errors: List[Exception] = []
+        remaining = list(self.providers)
+        while remaining:
+            provider = remaining.pop(0)
+            if not provider.breaker.allow():
+                continue
+            try:
+                if hedge and self.hedge and remaining:
+                    return await self._race(provider, remaining, call)
+                return await self._attempt(provider, call, None)
+            except Exception as e:
+                errors.append(e)
+        raise self._unavailable() from (errors[-1] if errors else None)
+
+
+_failovers: "weakref.WeakSet[Failover]" = weakref.WeakSet()
+
+
+def _circuits() -> Dict[LabelValues, float]:
+    circuits: Dict[LabelValues, float] = {}
+    for failover in list(_failovers):
+        for p in failover.providers:
+            key = (p.name,)
+            circuits[key] = max(
+                circuits.get(key, 0.0), float(p.breaker.state == "open")
+            )
+    return circuits
+
+
+llm_latency = metrics.histogram(
+    "llm_request_seconds", "Latency of successful LLM requests", ("provider",)
+)
+llm_failures = metrics.counter(
+    "llm_failures_total",
+    "LLM requests that failed or timed out",
+    ("provider", "reason"),
+)
+llm_hedges = metrics.counter(
+    "llm_hedges_total", "Backup LLM requests sent by hedging", ("provider",)
+)
+llm_hedges_won = metrics.counter(
+    "llm_hedges_won_total", "Hedged LLM requests answered by the backup", ("provider",)
+)
+metrics.callback(
+    "llm_circuit_open",
+    "1 while an LLM provider's circuit breaker refuses calls",
+    "gauge",
+    _circuits,
+    ("provider",),
+)
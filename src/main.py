@@ -1,11 +1,11 @@
 import argparse
 import asyncio
 import logging
-import os
-from typing import Any, Dict
+import threading
+from typing import Any, Awaitable, List, Mapping, NamedTuple, Tuple
 
-from langchain_core.messages import HumanMessage, ToolMessage
-from telegram import Update
+from langchain_core.messages import HumanMessage
+from telegram import Bot, Update
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,9 +13,23 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
+from telegram.request import HTTPXRequest
 
-from src.agent import create_agent
+from src.agent import bind_personality, create_graph
+from src.coalescer import MessageCoalescer
 from src.config import Config, Personality
+from src.media import deliver
+from src.registry import AgentRegistry, PersonalityRegistry
+from src.streaming import ConsolePrinter, TelegramStreamer, stream_reply
+from src.supervisor import Supervisor, supervise
+from src.telemetry import (
+    TracedRequest,
+    metrics,
+    span,
+    start_metrics_server,
+    track_cache,
+)
+from src.webhook import serve_webhook
 
 # Configure logging
 logging.basicConfig(
@@ -23,35 +37,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global agents cache: personality_name -> compiled_graph
-agents: Dict[str, Any] = {}
-# Global personalities
-personalities: Dict[str, Personality] = {}
+# Compiled graph shared by all personalities (built on first use)
+graph: Any = None
+graph_lock = threading.Lock()
+# Global personalities, read lazily and reloaded when their files change
+personalities: Mapping[str, Personality] = PersonalityRegistry(
+    Config.PERSONALITIES_DIR, Config.PERSONALITY_RELOAD_SECONDS
+)
+
 
+def get_graph() -> Any:
+    global graph
+    if graph is None:
+        with graph_lock:
+            if graph is None:
+                graph = create_graph()
+    return graph
+
+
+def build_agent(personality: Personality) -> Any:
+    return bind_personality(get_graph(), personality)
+
+
+# Global agents cache: canonical personality name -> graph bound to it (rebuilt
+# when the personality's file is reloaded)
+agents = AgentRegistry(build_agent, max_size=Config.AGENT_CACHE_SIZE)
+track_cache("agents", lambda: agents)
+turns_in_progress = metrics.gauge(
+    "turns_in_progress", "Chat turns currently being answered"
+)
 
-def get_agent_for_user(personality_name: str) -> Any:
-    if personality_name not in agents:
-        p = personalities.get(personality_name.lower())
-        if not p:
-            # Fallback to first available or Sacha
-            if "sacha" in personalities:
-                p = personalities["sacha"]
-            elif personalities:
-                p = next(iter(personalities.values()))
-            else:
-                raise ValueError("No personalities found!")
 
-        agents[personality_name] = create_agent(p)
-    return agents[personality_name]
+def resolve_personality(personality_name: str) -> Tuple[str, Personality]:
+    """Map a user-supplied name to (canonical key, personality), with fallbacks."""
+    key = personality_name.strip().lower()
+    if key in personalities:
+        return key, personalities[key]
+    # Fallback to first available or Sacha
+    if "sacha" in personalities:
+        return "sacha", personalities["sacha"]
+    if personalities:
+        return next(iter(personalities.items()))
+    raise ValueError("No personalities found!")
+
+
+def get_agent_for_user(personality_name: str) -> Any:
+    # Resolve fallbacks first so "Sacha", "sacha" and unknown names all share
+    # one cache entry instead of growing the cache with every new spelling.
+    return agents.get(*resolve_personality(personality_name))
 
 
 async def cli_loop() -> None:
     print("Starting CLI mode...")
-    # Load personalities
-    global personalities
-    personalities = Config.load_personalities()
     if not personalities:
-        print("No personalities found in src/personalities/")
+        print(f"No personalities found in {Config.PERSONALITIES_DIR}")
         return
 
     # Select personality
@@ -76,7 +115,16 @@ async def cli_loop() -> None:
         # We need to stream or invoke
         try:
             input_message = HumanMessage(content=user_input)
-            response = await agent.ainvoke({"messages": [input_message]}, config=config)
+            inputs = {"messages": [input_message]}
+            if Config.STREAM_REPLIES:
+                printer = ConsolePrinter(p_name)
+                with span("turn", mode="cli"):
+                    response = await stream_reply(agent, inputs, config, printer.push)
+                printer.finish(str(response["messages"][-1].content))
+                continue
+
+            with span("turn", mode="cli"):
+                response = await agent.ainvoke(inputs, config=config)
 
             # Extract last AI message
             last_msg = response["messages"][-1]
@@ -103,12 +151,39 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
+class IncomingMessage(NamedTuple):
+    chat_id: int
+    text: str
+    update: Update
+    context: ContextTypes.DEFAULT_TYPE
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.effective_chat or not update.message or not update.message.text:
         return
 
     chat_id = update.effective_chat.id
-    text = update.message.text
+    # Messages from one chat are serialized and quick bursts are merged into a
+    # single turn; different chats are processed concurrently.
+    await chat_queue.submit(
+        chat_id, IncomingMessage(chat_id, update.message.text, update, context)
+    )
+
+
+async def process_messages(batch: List[IncomingMessage]) -> None:
+    # Everything this turn does (graph nodes, tools, Bot API calls) is traced
+    # as children of one span, so a slow reply can be attributed to its cause.
+    turns_in_progress.inc()
+    try:
+        with span("turn", mode="telegram", messages=len(batch)):
+            await answer(batch)
+    finally:
+        turns_in_progress.dec()
+
+
+async def answer(batch: List[IncomingMessage]) -> None:
+    chat_id, _, update, context = batch[-1]
+    text = "\n".join(message.text for message in batch)
 
     # Determine personality. For now, hardcoded or stored in user_data
     # We could allow user to switch personalities.
@@ -126,70 +201,28 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # Show typing status
         await context.bot.send_chat_action(chat_id=chat_id, action="typing")
 
-        response = await agent.ainvoke({"messages": [input_message]}, config=config)
+        inputs = {"messages": [input_message]}
+        sends: List[Awaitable[Any]] = []
+        if Config.STREAM_REPLIES and update.message:
+            # Send the first tokens right away and edit the message as more arrive
+            streamer = TelegramStreamer(update.message, Config.STREAM_EDIT_INTERVAL)
+            response = await stream_reply(agent, inputs, config, streamer.push)
+            sends.append(streamer.finish(str(response["messages"][-1].content)))
+        else:
+            response = await agent.ainvoke(inputs, config=config)
 
-        last_msg = response["messages"][-1]
-        response_text = last_msg.content
+            last_msg = response["messages"][-1]
+            response_text = last_msg.content
 
-        if update.message:
-            await update.message.reply_text(response_text)
-
-        # Handle media from tools
-        messages = response["messages"]
-        last_human_idx = -1
-        # Find the last HumanMessage to scope our search
-        for i, msg in enumerate(reversed(messages)):
-            if isinstance(msg, HumanMessage):
-                last_human_idx = len(messages) - 1 - i
-                break
-
-        if last_human_idx != -1:
-            for msg in messages[last_human_idx + 1 :]:
-                if isinstance(msg, ToolMessage):
-                    content = str(msg.content)
-                    if "AUDIO_GENERATED:" in content:
-                        try:
-                            path = content.split("AUDIO_GENERATED:")[1].strip()
-                            await context.bot.send_chat_action(
-                                chat_id=chat_id, action="upload_voice"
-                            )
-                            with open(path, "rb") as audio:
-                                await context.bot.send_voice(
-                                    chat_id=chat_id, voice=audio
-                                )
-
-                            # Cleanup
-                            try:
-                                os.remove(path)
-                            except Exception as e:
-                                logger.warning(
-                                    f"Failed to remove temp file {path}: {e}"
-                                )
-
-                        except Exception as e:
-                            logger.error(f"Failed to send voice: {e}")
-
-                    if "IMAGE_GENERATED:" in content:
-                        try:
-                            path = content.split("IMAGE_GENERATED:")[1].strip()
-                            await context.bot.send_chat_action(
-                                chat_id=chat_id, action="upload_photo"
-                            )
-                            with open(path, "rb") as photo:
-                                await context.bot.send_photo(
-                                    chat_id=chat_id, photo=photo
-                                )
-
-                            # Cleanup
-                            try:
-                                os.remove(path)
-                            except Exception as e:
-                                logger.warning(
-                                    f"Failed to remove temp file {path}: {e}"
-                                )
-
-                        except Exception as e:
-                            logger.error(f"Failed to send photo: {e}")
+            if update.message:
+                sends.append(update.message.reply_text(response_text))
+
+        # Media produced by tools during this turn (see AgentState.media) is
+        # uploaded alongside the text, so the turn ends with its slowest send.
+        # deliver() handles its own errors and always releases its artifact.
+        for media in response.get("media", []):
+            sends.append(deliver(context.bot, chat_id, media))
+        await asyncio.gather(*sends)
 
     except Exception as e:
         logger.error(f"Error processing message: {e}")
@@ -197,21 +230,95 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await update.message.reply_text("I'm having trouble thinking right now.")
 
 
-def bot_loop() -> None:
-    if not Config.TELEGRAM_TOKEN:
-        print("Error: TELEGRAM_TOKEN not set.")
-        return
+chat_queue: MessageCoalescer[IncomingMessage] = MessageCoalescer(
+    process_messages, debounce=Config.CHAT_DEBOUNCE_SECONDS
+)
+metrics.callback(
+    "chat_queue_depth",
+    "Messages waiting for their chat's previous turn to finish",
+    "gauge",
+    lambda: {(): chat_queue.queue_depth()},
+)
 
-    # Load personalities
-    global personalities
-    personalities = Config.load_personalities()
 
-    application = Application.builder().token(Config.TELEGRAM_TOKEN).build()
+def build_application(updater: bool = True) -> Application:  # type: ignore[type-arg]
+    """Build the PTB application with the bot's handlers.
+
+    Supervised workers pass ``updater=False``: their updates are fed in by the
+    supervisor instead of being fetched from Telegram.
+    """
+    # Concurrent updates let different chats run in parallel; per-chat ordering
+    # is handled by chat_queue.
+    builder = (
+        Application.builder()
+        .token(Config.TELEGRAM_TOKEN or "")
+        .concurrent_updates(Config.CONCURRENT_UPDATES)
+    )
+    if not updater:
+        builder = builder.updater(None)
+    if Config.METRICS_PORT:
+        # Same pool size PTB uses for an application's default request
+        request = HTTPXRequest(connection_pool_size=256)
+        builder = builder.request(TracedRequest(request))
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)
     )
+    return application
+
+
+def bot_loop(webhook: bool = False, workers: int = 1) -> None:
+    if not Config.TELEGRAM_TOKEN:
+        print("Error: TELEGRAM_TOKEN not set.")
+        return
+    if webhook and not Config.WEBHOOK_URL:
+        print("Error: WEBHOOK_URL not set.")
+        return
+
+    # Supervised workers are restarted one by one (SIGHUP); in-memory
+    # checkpoints would lose every conversation of the restarted shard.
+    if workers > 1 and not Config.CHECKPOINT_DB:
+        print("Error: CHECKPOINT_DB must be set to run more than one worker.")
+        return
+
+    if workers > 1:
+        # Each worker process builds its own application, agents and
+        # checkpoints; the supervisor only routes updates by chat_id.
+        print(f"Starting Telegram Bot supervisor with {workers} workers...")
+        asyncio.run(
+            supervise(
+                Supervisor(workers, build_application),
+                Bot(Config.TELEGRAM_TOKEN),
+                webhook,
+                Config.WEBHOOK_LISTEN,
+                Config.WEBHOOK_PORT,
+                Config.WEBHOOK_URL,
+                Config.WEBHOOK_PATH,
+                Config.WEBHOOK_SECRET or None,
+            )
+        )
+        return
+
+    application = build_application()
+
+    if webhook:
+        print(
+            f"Starting Telegram Bot webhook on "
+            f"{Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}..."
+        )
+        asyncio.run(
+            serve_webhook(
+                application,
+                Config.WEBHOOK_LISTEN,
+                Config.WEBHOOK_PORT,
+                Config.WEBHOOK_URL,
+                Config.WEBHOOK_PATH,
+                Config.WEBHOOK_SECRET or None,
+            )
+        )
+        return
 
     print("Starting Telegram Bot polling...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -220,8 +327,25 @@ def bot_loop() -> None:
 def main() -> None:
     parser = argparse.ArgumentParser(description=f"GirlfriendGPT {Config.CURRENT_YEAR}")
     parser.add_argument("--cli", action="store_true", help="Run in CLI mode")
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="Receive Telegram updates through a webhook instead of polling",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=Config.WORKERS,
+        help="Number of bot processes; chats are sharded across them by chat_id",
+    )
     args = parser.parse_args()
 
+    try:
+        Config.validate()
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
     print("---------------------------------------")
     print(f"GirlfriendGPT - {Config.CURRENT_YEAR} Edition")
     provider = Config.LLM_PROVIDER
@@ -229,12 +353,16 @@ def main() -> None:
     print(f"Powered by {provider.title()} ({model})")
     print("---------------------------------------")
 
+    # Supervised workers start their own endpoints (see serve_shard)
+    if Config.METRICS_PORT and (args.cli or args.workers <= 1):
+        start_metrics_server(Config.METRICS_LISTEN, Config.METRICS_PORT)
+
     # Run async loop
     try:
         if args.cli:
             asyncio.run(cli_loop())
         else:
-            bot_loop()
+            bot_loop(webhook=args.webhook, workers=args.workers)
     except KeyboardInterrupt:
         pass
 
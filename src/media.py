@@ -0,0 +1,210 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import IO, Any, Awaitable, Callable, Dict, Optional, Set
+
+from telegram import Bot, InputFile, Message
+from telegram.error import BadRequest
+
+from src.artifacts import MediaArtifact, get_artifact_store
+from src.config import Config
+from src.telemetry import span, track_cache
+
+logger = logging.getLogger(__name__)
+
+
+class MediaIndex:
+    """Maps media content hashes to Telegram ``file_id``s.
+
+    Telegram lets a bot resend any file it uploaded before by its ``file_id``
+    at no upload cost, so identical clips and images only travel once. The
+    index is an LRU bounded by ``max_entries`` and is optionally persisted as
+    JSON so ids survive restarts.
+
+    Changes are written at most every ``save_delay`` seconds, in a worker
+    thread, when made on an event loop (immediately otherwise). Each write
+    merges in the entries other processes saved to the same file, so
+    supervised workers sharing MEDIA_INDEX_PATH keep each other's ids.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 10000,
+        save_delay: float = 1.0,
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.max_entries = max(1, max_entries)
+        self.save_delay = save_delay
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._ids: OrderedDict[str, str] = OrderedDict(self._read())
+        self._dirty = False
+        self._forgotten: Set[str] = set()
+        self._pending: Optional["asyncio.Task[None]"] = None
+
+    def _read(self) -> Dict[str, str]:
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            return dict(json.loads(self.path.read_text(encoding="utf-8")))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable media index {self.path}: {e}")
+            return {}
+
+    @staticmethod
+    def key_for(kind: str, media: IO[bytes]) -> str:
+        digest = hashlib.sha256(kind.encode("utf-8"))
+        for block in iter(lambda: media.read(65536), b""):
+            digest.update(block)
+        media.seek(0)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            file_id = self._ids.get(key)
+            if file_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._ids.move_to_end(key)
+            return file_id
+
+    def put(self, key: str, file_id: str) -> None:
+        with self._lock:
+            self._ids[key] = file_id
+            self._ids.move_to_end(key)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+            self._forgotten.discard(key)
+            self._dirty = True
+        self._changed()
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            if self._ids.pop(key, None) is None:
+                return
+            self._forgotten.add(key)
+            self._dirty = True
+        self._changed()
+
+    def _changed(self) -> None:
+        if not self.path:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        # One write per save_delay, however many changes it covers
+        if self._pending is None or self._pending.done():
+            self._pending = loop.create_task(self._save_later())
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(self.save_delay)
+        await asyncio.to_thread(self.save)
+
+    def save(self) -> None:
+        """Write pending changes, merged with the file's current entries."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                forgotten, self._forgotten = self._forgotten, set()
+                self._dirty = False
+            on_disk = self._read()
+            with self._lock:
+                merged: OrderedDict[str, str] = OrderedDict(
+                    (key, file_id)
+                    for key, file_id in on_disk.items()
+                    if key not in forgotten and key not in self._ids
+                )
+                merged.update(self._ids)
+                while len(merged) > self.max_entries:
+                    merged.popitem(last=False)
+                self._ids = merged
+                entries = dict(merged)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+media_index = MediaIndex(Config.MEDIA_INDEX_PATH or None)
+# Changes still waiting for their debounced write
+atexit.register(media_index.save)
+track_cache("media_index", lambda: media_index)
+
+
+async def _send_cached(
+    kind: str,
+    artifact_id: str,
+    send: Callable[[Any], Awaitable[Message]],
+    file_id_of: Callable[[Message], Optional[str]],
+) -> None:
+    store = get_artifact_store()
+    with store.open(artifact_id) as media:
+        key = MediaIndex.key_for(kind, media)
+        if file_id := media_index.get(key):
+            try:
+                await send(file_id)
+                return
+            except BadRequest as e:
+                # The id expired or belongs to another bot token: upload again.
+                logger.warning(f"Cached {kind} file_id rejected, re-uploading: {e}")
+                media_index.forget(key)
+
+        artifact = store.get(artifact_id)
+        filename = artifact.filename if artifact else None
+        # PTB buffers uploads in full anyway, and in-memory buffers have no name.
+        message = await send(InputFile(media.read(), filename=filename))
+    if new_id := file_id_of(message):
+        media_index.put(key, new_id)
+
+
+async def send_voice(bot: Bot, chat_id: int, artifact_id: str) -> None:
+    await _send_cached(
+        "voice",
+        artifact_id,
+        lambda voice: bot.send_voice(chat_id=chat_id, voice=voice),
+        lambda message: message.voice.file_id if message.voice else None,
+    )
+
+
+async def send_photo(bot: Bot, chat_id: int, artifact_id: str) -> None:
+    await _send_cached(
+        "photo",
+        artifact_id,
+        lambda photo: bot.send_photo(chat_id=chat_id, photo=photo),
+        # Telegram returns several sizes; the last one is the original.
+        lambda message: message.photo[-1].file_id if message.photo else None,
+    )
+
+
+async def deliver(bot: Bot, chat_id: int, media: MediaArtifact) -> None:
+    """Send one tool-produced artifact to the chat, then release it."""
+    kind, artifact_id = media["kind"], media["artifact_id"]
+    send = send_voice if kind == "voice" else send_photo
+    try:
+        with span(f"deliver.{kind}"):
+            await bot.send_chat_action(chat_id=chat_id, action=f"upload_{kind}")
+            await send(bot, chat_id, artifact_id)
+    except Exception as e:
+        logger.error(f"Failed to send {kind}: {e}")
+    finally:
+        get_artifact_store().release(artifact_id)
@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Tuple
+
+from src.config import Personality
+
+logger = logging.getLogger(__name__)
+
+
+class AgentRegistry:
+    """Bounded LRU cache of agents keyed by canonical (lowercase) personality name.
+
+    Construction happens under a lock, so concurrent first requests for the same
+    personality build its agent exactly once. An entry built for a different
+    ``Personality`` object than the one requested (the file was reloaded) is
+    rebuilt, counting as a miss.
+    """
+
+    def __init__(self, factory: Callable[[Personality], Any], max_size: int) -> None:
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        # key -> (personality the agent was built for, agent)
+        self._agents: OrderedDict[str, Tuple[Personality, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, personality: Personality) -> Any:
+        with self._lock:
+            entry = self._agents.get(key)
+            if entry is not None and entry[0] is personality:
+                self.hits += 1
+                self._agents.move_to_end(key)
+                return entry[1]
+
+            self.misses += 1
+            agent = self.factory(personality)
+            self._agents[key] = (personality, agent)
+            self._agents.move_to_end(key)
+            while len(self._agents) > self.max_size:
+                evicted, _ = self._agents.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Evicted agent for personality '{evicted}'")
+            return agent
+
+    def clear(self) -> None:
+        with self._lock:
+            self._agents.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._agents),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.strip().lower() in self._agents
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+
+# (mtime_ns, size) of a personality file
+Signature = Tuple[int, int]
+
+
+class PersonalityRegistry(Mapping[str, Personality]):
+    """Personalities read from a directory of JSON files, kept in sync with it.
+
+    Nothing is read until the first lookup, which parses only the file named
+    after the requested key ("alix_earle.json" for "alix earle"); the other
+    files are parsed when a name does not match its file or when the registry
+    is listed. At most every ``reload_interval`` seconds a lookup re-checks
+    the files' mtime and size: only changed files are parsed again and only
+    their ``Personality`` objects are replaced, so the agents and prompts
+    cached for the others stay warm. A file that fails validation keeps
+    serving its last good version.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        reload_interval: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.directory = Path(directory)
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self.parses = 0
+        self.reloads = 0
+        self._files: Dict[Path, Signature] = {}
+        # Signature of the version last parsed (successfully or not)
+        self._seen: Dict[Path, Signature] = {}
+        self._loaded: Dict[Path, Personality] = {}
+        self._names: Dict[str, Path] = {}
+        self._scanned_at: Optional[float] = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key_for(path: Path) -> str:
+        return path.stem.replace("_", " ").lower()
+
+    def _scan(self) -> None:
+        now = self.clock()
+        if self._scanned_at is not None and now - self._scanned_at < (
+            self.reload_interval
+        ):
+            return
+        self._scanned_at = now
+        files: Dict[Path, Signature] = {}
+        for path in sorted(self.directory.glob("*.json")):
+            try:
+                stat = path.stat()
+            except OSError:  # removed between glob and stat
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+        self._files = files
+
+        for path in [p for p in self._seen if p not in files]:
+            logger.info(f"Personality file {path.name} removed")
+            self._forget(path)
+            del self._seen[path]
+        for path, signature in files.items():
+            if path in self._seen and self._seen[path] != signature:
+                self.reloads += 1
+                logger.info(f"Reloading personality from {path.name}")
+                self._load(path)
+
+    def _forget(self, path: Path) -> None:
+        self._loaded.pop(path, None)
+        for name in [n for n, p in self._names.items() if p == path]:
+            del self._names[name]
+
+    def _load(self, path: Path) -> None:
+        self._seen[path] = self._files[path]
+        self.parses += 1
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                personality = Personality(**json.load(f))
+        except Exception as e:
+            logger.warning(f"Error loading personality from {path}: {e}")
+            return
+        self._forget(path)
+        self._loaded[path] = personality
+        self._names[personality.name.lower()] = path
+
+    def _load_all(self) -> None:
+        for path in self._files:
+            if path not in self._seen:
+                self._load(path)
+
+    def __getitem__(self, key: str) -> Personality:
+        with self._lock:
+            self._scan()
+            if key not in self._names:
+                for path in self._files:
+                    if path not in self._seen and self.key_for(path) == key:
+                        self._load(path)
+            if key not in self._names:
+                self._load_all()
+            if key not in self._names:
+                raise KeyError(key)
+            return self._loaded[self._names[key]]
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            self._scan()
+            self._load_all()
+            return iter(list(self._names))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._scan()
+            self._load_all()
+            return len(self._names)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "files": len(self._files),
+            "loaded": len(self._loaded),
+            "parses": self.parses,
+            "reloads": self.reloads,
+        }
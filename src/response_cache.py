@@ -0,0 +1,181 @@
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.config import Config
+from src.telemetry import track_cache
+
+logger = logging.getLogger(__name__)
+
+# Sparse vector: feature -> weight, L2-normalized so a dot product is the cosine
+Vector = Dict[str, float]
+Embedder = Callable[[str], Vector]
+
+
+def normalize(text: str) -> str:
+    """Fold case, accents, punctuation, emoji and stretched letters ("oiii")."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = re.sub(r"(\w)\1{2,}", r"\1", text)
+    return " ".join(text.split())
+
+
+def exact_embedding(text: str) -> Vector:
+    # Only identical normalized texts are similar.
+    return {text: 1.0}
+
+
+def ngram_embedding(text: str, n: int = 3) -> Vector:
+    """Character n-gram vector: a cheap local embedding, no model or network.
+
+    Typos and small rewordings ("how are you" / "how r you") still share most
+    of their n-grams, which is what short small-talk turns need.
+    """
+    padded = f" {text} "
+    grams = Counter(padded[i : i + n] for i in range(max(1, len(padded) - n + 1)))
+    norm = math.sqrt(sum(count * count for count in grams.values()))
+    return {gram: count / norm for gram, count in grams.items()}
+
+
+EMBEDDERS: Dict[str, Embedder] = {"exact": exact_embedding, "ngram": ngram_embedding}
+
+
+def cosine(a: Vector, b: Vector) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(feature, 0.0) for feature, weight in a.items())
+
+
+@dataclass
+class CachedReply:
+    vector: Vector
+    reply: str
+    latency: float
+    expires: float
+
+
+class ResponseCache:
+    """Replies to short, repeated turns, reused without calling the LLM.
+
+    Entries are scoped (one scope per persona prompt) and matched by the
+    cosine similarity of the embedded, normalized user text, so "oi!!" and
+    "Oi" hit the same entry. Entries expire after ``ttl`` seconds and the
+    least recently used ones are evicted beyond ``max_entries``. Each hit adds
+    the latency of the LLM call that produced the reply to ``latency_saved``.
+    """
+
+    def __init__(
+        self,
+        embed: Embedder,
+        threshold: float,
+        ttl: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.latency_saved = 0.0
+        self._entries: OrderedDict[Tuple[str, str], CachedReply] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _match(self, scope: str, text: str) -> Tuple[Optional[CachedReply], float]:
+        now = self.clock()
+        exact = self._entries.get((scope, text))
+        if exact is not None and exact.expires > now:
+            self._entries.move_to_end((scope, text))
+            return exact, 1.0
+
+        vector = self.embed(text)
+        best: Optional[Tuple[str, str]] = None
+        best_score = self.threshold
+        for key, entry in list(self._entries.items()):
+            if entry.expires <= now:
+                del self._entries[key]
+            elif key[0] == scope:
+                score = cosine(vector, entry.vector)
+                if score >= best_score:
+                    best, best_score = key, score
+        if best is None:
+            return None, 0.0
+        self._entries.move_to_end(best)
+        return self._entries[best], best_score
+
+    def lookup(self, scope: str, text: str) -> Optional[str]:
+        text = normalize(text)
+        if not text:
+            return None
+        with self._lock:
+            entry, score = self._match(scope, text)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.latency_saved += entry.latency
+        logger.info(
+            f"Response cache hit for {text!r} (similarity {score:.2f}, "
+            f"hit rate {self.hit_rate():.0%}, {self.latency_saved:.1f}s saved)"
+        )
+        return entry.reply
+
+    def store(self, scope: str, text: str, reply: str, latency: float) -> None:
+        text = normalize(text)
+        if not text or not reply:
+            return
+        entry = CachedReply(self.embed(text), reply, latency, self.clock() + self.ttl)
+        with self._lock:
+            self._entries[(scope, text)] = entry
+            self._entries.move_to_end((scope, text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate(), 3),
+            "latency_saved": round(self.latency_saved, 3),
+            "evictions": self.evictions,
+        }
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        embed = EMBEDDERS.get(Config.RESPONSE_CACHE_EMBEDDING)
+        if embed is None:
+            raise ValueError(
+                f"Unknown RESPONSE_CACHE_EMBEDDING "
+                f"{Config.RESPONSE_CACHE_EMBEDDING!r}; use one of {sorted(EMBEDDERS)}"
+            )
+        _cache = ResponseCache(
+            embed,
+            Config.RESPONSE_CACHE_THRESHOLD,
+            Config.RESPONSE_CACHE_TTL_SECONDS,
+            Config.RESPONSE_CACHE_MAX_ENTRIES,
+        )
+    return _cache
+
+
+track_cache("response", lambda: _cache)
@@ -0,0 +1,55 @@
+import re
+from dataclasses import dataclass
+
+from src.response_cache import normalize
+
+# Words (accents folded) about selfies or voice notes, in English and
+# Portuguese: turns mentioning them need the tools
+MEDIA_WORDS = re.compile(
+    r"\b(selfies?|fotos?|fotinhas?|photos?|pics?|pictures?|imagem|imagens|"
+    r"images?|audios?|voz|voice|falar|speak|ouvir|hear)\b"
+)
+# Turns asking for explanations or advice, or sharing trouble, deserve the
+# flagship model
+HARD_WORDS = re.compile(
+    r"\b(why|explain|explica|por ?que|ajuda|help|conselho|advice|should|"
+    r"devo|problema|problem|triste|sad)\b"
+)
+
+
+@dataclass(frozen=True)
+class Route:
+    # "fast" (the fast model, without tools) or "flagship" (with tools)
+    tier: str
+    # Why, for the logs
+    reason: str
+
+
+FLAGSHIP = Route("flagship", "default")
+
+
+def route_text(text: str, max_chars: int) -> Route:
+    """Pick the model for a user turn, by a cheap local heuristic.
+
+    Short small talk ("lol ok 😂", "boa noite") goes to the fast model
+    without tools; turns that ask for media, reasoning or advice, or that
+    are longer than ``max_chars``, go to the flagship model with tools.
+    """
+    folded = normalize(text)
+    if MEDIA_WORDS.search(folded):
+        return Route("flagship", "media")
+    if len(text) > max_chars:
+        return Route("flagship", "long")
+    if text.count("?") > 1 or HARD_WORDS.search(folded):
+        return Route("flagship", "hard")
+    return Route("fast", "small talk")
+
+
+def needs_escalation(reply: str) -> bool:
+    """Whether a fast, tool-less reply should be redone by the flagship.
+
+    Empty replies, and replies that talk about sending a photo or a voice
+    note (which only the tools can do), are escalated.
+    """
+    folded = normalize(reply)
+    return not folded or MEDIA_WORDS.search(folded) is not None
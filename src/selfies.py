@@ -0,0 +1,258 @@
+import asyncio
+import concurrent.futures
+import logging
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Iterator, Optional
+
+from src.cache import DiskCache
+from src.config import Config
+from src.encoders import ImageOptions, get_encoder, process_image
+from src.telemetry import LabelValues, metrics, span, track_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SelfieUnavailable(Exception):
+    """The request was refused before generating; the message is for the model."""
+
+
+@dataclass
+class Selfie:
+    # Cached display-size image, or the raw output when it could not be decoded
+    path: Optional[str] = None
+    image: Optional[bytes] = None
+
+
+class SelfieService:
+    """Front door to image generation for every chat in the process.
+
+    Requests are served, in order of preference:
+
+    1. from the on-disk cache of recent selfies, keyed by (persona, prompt);
+    2. by joining a generation of the same key that is already in flight;
+    3. by a new generation, if the user is within ``rate_limit`` requests
+       per ``rate_window`` seconds and the backlog has room.
+
+    At most ``workers`` generations run at once and ``queue_size`` more may
+    wait; beyond that requests are refused instead of piling up against the
+    Imagen quota. Outputs are downscaled and re-encoded as set by ``image``
+    (Telegram recompresses multi-megabyte PNGs anyway), on the shared encoder
+    threads, before they are cached, so cached selfies are also quick to send.
+    """
+
+    def __init__(
+        self,
+        cache: DiskCache,
+        workers: int,
+        queue_size: int,
+        rate_limit: int,
+        rate_window: float,
+        image: ImageOptions,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.image = image
+        self.clock = clock
+        self.generated = 0
+        self.deduplicated = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.pending = 0
+        self._lock = threading.Lock()
+        # Futures are loop-agnostic, so the sync tool path can share them.
+        self._inflight: Dict[str, concurrent.futures.Future[Selfie]] = {}
+        self._requests: Dict[str, Deque[float]] = {}
+        self._swept_at = clock()
+        self._slots: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = weakref.WeakKeyDictionary()
+        self._threads = threading.BoundedSemaphore(self.workers)
+
+    def _slot(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._slots.get(loop)
+        if semaphore is None:
+            semaphore = self._slots[loop] = asyncio.Semaphore(self.workers)
+        return semaphore
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """Hold one of the ``workers`` slots from a blocking thread."""
+        with self._threads:
+            yield
+
+    def _admit(self, user: str) -> None:
+        """Reserve a backlog slot for ``user`` or raise ``SelfieUnavailable``."""
+        now = self.clock()
+        if now - self._swept_at >= self.rate_window:
+            self._swept_at = now
+            # Forget users whose requests have all left the window
+            for stale in [
+                u for u, r in self._requests.items() if now - r[-1] >= self.rate_window
+            ]:
+                del self._requests[stale]
+        recent = self._requests.setdefault(user, deque())
+        while recent and now - recent[0] >= self.rate_window:
+            recent.popleft()
+        if len(recent) >= self.rate_limit:
+            self.rate_limited += 1
+            minutes = math.ceil((self.rate_window - (now - recent[0])) / 60)
+            raise SelfieUnavailable(
+                f"Selfie limit reached for this chat; try again in {minutes} min."
+            )
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise SelfieUnavailable(
+                "Too many selfies are being generated right now; try again soon."
+            )
+        recent.append(now)
+        self.pending += 1
+
+    async def get(
+        self,
+        user: str,
+        scope: str,
+        prompt: str,
+        generate: Callable[[str], Awaitable[bytes]],
+    ) -> Selfie:
+        """Return the selfie for ``prompt`` as ``scope``, generating it if needed.
+
+        ``generate`` produces the raw image; its exceptions propagate to every
+        request sharing the generation.
+        """
+        key = DiskCache.make_key(scope, prompt, self.image.key())
+        path = self.cache.get(key)
+        if path is not None:
+            return Selfie(path=path)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            joined = future is not None
+            if future is None:
+                self._admit(user)
+                future = self._inflight[key] = concurrent.futures.Future()
+                # Running futures cannot be cancelled, so a joiner that gives
+                # up (wrap_future propagates its cancellation) leaves the
+                # generation to the owner and the other joiners.
+                future.set_running_or_notify_cancel()
+            else:
+                self.deduplicated += 1
+        if joined:
+            return await asyncio.wrap_future(future)
+
+        try:
+            selfie = await self._generate(key, prompt, generate)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(selfie)
+            return selfie
+        finally:
+            with self._lock:
+                self.pending -= 1
+                del self._inflight[key]
+
+    async def _generate(
+        self, key: str, prompt: str, generate: Callable[[str], Awaitable[bytes]]
+    ) -> Selfie:
+        async with self._slot():
+            image = await generate(prompt)
+        self.generated += 1
+        with span("selfie.process", generated_bytes=len(image)) as processing:
+            processed = await asyncio.get_running_loop().run_in_executor(
+                get_encoder(), process_image, image, self.image
+            )
+            if processed is not None:
+                processing.set(processed_bytes=len(processed))
+        image_bytes.observe(len(image), stage="generated")
+        if processed is None:
+            return Selfie(image=image)
+        image_bytes.observe(len(processed), stage="processed")
+        logger.info(
+            f"Selfie recompressed from {len(image) // 1024} KiB to "
+            f"{len(processed) // 1024} KiB ({self.image.format})"
+        )
+        path = await asyncio.to_thread(self.cache.put_bytes, key, processed)
+        return Selfie(path=path)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "generated": self.generated,
+            "deduplicated": self.deduplicated,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+        }
+
+
+_service: Optional[SelfieService] = None
+
+
+def image_options() -> ImageOptions:
+    """How selfies are processed, from the SELFIE_* settings."""
+    return ImageOptions(
+        max_side=Config.SELFIE_MAX_SIDE,
+        format=Config.SELFIE_FORMAT,
+        quality=Config.SELFIE_QUALITY,
+        max_bytes=Config.SELFIE_MAX_KB * 1024,
+        strip_metadata=Config.SELFIE_STRIP_METADATA,
+    )
+
+
+def get_selfie_service() -> SelfieService:
+    global _service
+    if _service is None:
+        image = image_options()
+        _service = SelfieService(
+            DiskCache(
+                Config.SELFIE_CACHE_DIR,
+                Config.SELFIE_CACHE_MAX_MB * 1024 * 1024,
+                suffix=image.suffix,
+            ),
+            workers=Config.SELFIE_WORKERS,
+            queue_size=Config.SELFIE_QUEUE_SIZE,
+            rate_limit=Config.SELFIE_RATE_LIMIT,
+            rate_window=Config.SELFIE_RATE_WINDOW_SECONDS,
+            image=image,
+        )
+    return _service
+
+
+def _selfie_requests() -> Dict[LabelValues, float]:
+    if _service is None:
+        return {}
+    stats = _service.stats()
+    return {(result,): stats[result] for result in stats if result != "pending"}
+
+
+image_bytes = metrics.histogram(
+    "selfie_image_bytes",
+    "Size of selfies as generated and as uploaded after processing",
+    ("stage",),
+    buckets=(16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304),
+)
+track_cache("selfies", lambda: _service.cache if _service else None)
+metrics.callback(
+    "selfie_requests_total",
+    "Selfie requests not served from the cache, by outcome",
+    "counter",
+    _selfie_requests,
+    ("result",),
+)
+metrics.callback(
+    "selfies_pending",
+    "Selfie generations running or queued",
+    "gauge",
+    lambda: {(): _service.pending} if _service else {},
+)
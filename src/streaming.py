@@ -0,0 +1,138 @@
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from langchain_core.messages import AIMessageChunk
+from telegram import Message
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects an edit that leaves the text unchanged, and the 4096
+# character limit applies to edits as well as to new messages.
+TELEGRAM_MAX_TEXT = 4096
+
+
+async def stream_reply(
+    agent: Any,
+    inputs: Dict[str, Any],
+    config: Dict[str, Any],
+    on_text: Callable[[str], Awaitable[None]],
+) -> Dict[str, Any]:
+    """Run the graph, calling ``on_text`` with the reply as it is generated.
+
+    ``on_text`` receives the full text of the model message being streamed so
+    far (not just the new token). Returns the final graph state, exactly like
+    ``ainvoke`` would.
+    """
+    final: Dict[str, Any] = {}
+    message_id: Optional[str] = None
+    text = ""
+    async for mode, payload in agent.astream(
+        inputs, config=config, stream_mode=["messages", "values"]
+    ):
+        if mode == "values":
+            final = payload
+            continue
+        chunk, metadata = payload
+        if metadata.get("langgraph_node") != "chatbot":
+            continue
+        if not isinstance(chunk, AIMessageChunk) or not chunk.text:
+            continue
+        # A tool loop produces several model messages; show only the latest.
+        if chunk.id != message_id:
+            message_id, text = chunk.id, ""
+        text += chunk.text
+        await on_text(text)
+    return final
+
+
+class TelegramStreamer:
+    """Shows a reply progressively by editing one Telegram message.
+
+    The first chunk is sent as a reply right away; later chunks are batched
+    into at most one edit per ``min_interval`` seconds to stay within
+    Telegram's edit rate limits.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        min_interval: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.message = message
+        self.min_interval = min_interval
+        self.clock = clock
+        self.started = clock()
+        self.sent: Optional[Message] = None
+        self.shown = ""
+        self.next_edit = 0.0
+        self.edits = 0
+        self.time_to_first_token: Optional[float] = None
+
+    async def push(self, text: str) -> None:
+        text = text[:TELEGRAM_MAX_TEXT]
+        if not text.strip():
+            return
+        if self.sent is None:
+            self.time_to_first_token = self.clock() - self.started
+            logger.info(f"First token after {self.time_to_first_token:.2f}s")
+            self.sent = await self.message.reply_text(text)
+            self.shown = text
+            self.next_edit = self.clock() + self.min_interval
+        elif self.clock() >= self.next_edit:
+            await self._edit(text)
+
+    async def finish(self, text: str) -> None:
+        text = text[:TELEGRAM_MAX_TEXT]
+        if self.sent is None:
+            await self.message.reply_text(text)
+        else:
+            await self._edit(text)
+
+    async def _edit(self, text: str) -> None:
+        if self.sent is None or text == self.shown:
+            return
+        try:
+            await self.sent.edit_text(text)
+            self.shown = text
+            self.edits += 1
+            self.next_edit = self.clock() + self.min_interval
+        except RetryAfter as e:
+            delay = e.retry_after
+            seconds = (
+                delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+            )
+            logger.warning(f"Telegram asked to slow down edits for {seconds}s")
+            self.next_edit = self.clock() + seconds
+
+
+class ConsolePrinter:
+    """Prints a streamed reply to stdout as it grows."""
+
+    def __init__(self, name: str, clock: Callable[[], float] = time.monotonic) -> None:
+        self.name = name
+        self.clock = clock
+        self.started = clock()
+        self.shown = ""
+        self.time_to_first_token: Optional[float] = None
+
+    async def push(self, text: str) -> None:
+        if self.time_to_first_token is None:
+            self.time_to_first_token = self.clock() - self.started
+            print(f"{self.name}: ", end="")
+        if text.startswith(self.shown):
+            print(text[len(self.shown) :], end="", flush=True)
+        else:
+            print(f"\n{self.name}: {text}", end="", flush=True)
+        self.shown = text
+
+    def finish(self, text: str) -> None:
+        if self.time_to_first_token is None:
+            print(f"{self.name}: {text}")
+        elif text.startswith(self.shown):
+            print(text[len(self.shown) :])
+        else:
+            print(f"\n{self.name}: {text}")
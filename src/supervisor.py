@@ -0,0 +1,301 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+from src.config import Config
+from src.telemetry import start_metrics_server
+from src.webhook import create_ingress_app
+
+logger = logging.getLogger(__name__)
+
+# Builds a worker's PTB application; must be a picklable module-level function.
+AppFactory = Callable[..., Application]  # type: ignore[type-arg]
+
+
+def chat_id_of(data: Dict[str, Any]) -> Optional[int]:
+    """Find the chat (or user) an update belongs to without parsing it.
+
+    None for updates about neither, such as polls.
+    """
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or value.get("message", {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+        user = value.get("from")
+        if isinstance(user, dict) and "id" in user:
+            return int(user["id"])
+    return None
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    # Python's % is never negative, so group chats (negative ids) map fine.
+    return chat_id % workers
+
+
+async def serve_shard(
+    shard: int, inbox: Any, received: Any, factory: AppFactory
+) -> None:
+    """Feed updates from ``inbox`` into a local application until ``None``."""
+    # Each worker indexes and evicts its disk caches on its own, so sharing a
+    # directory would let one delete files another still counts on.
+    Config.TTS_CACHE_DIR = os.path.join(Config.TTS_CACHE_DIR, f"shard-{shard}")
+    Config.SELFIE_CACHE_DIR = os.path.join(Config.SELFIE_CACHE_DIR, f"shard-{shard}")
+    application = factory(updater=False)
+    loop = asyncio.get_running_loop()
+    if Config.METRICS_PORT:
+        # Each worker has its own metrics, so each gets its own port.
+        start_metrics_server(Config.METRICS_LISTEN, Config.METRICS_PORT + shard)
+    async with application:
+        await application.start()
+        logger.info(f"Worker {shard} ready (pid {os.getpid()})")
+        while (data := await loop.run_in_executor(None, inbox.get)) is not None:
+            await application.update_queue.put(Update.de_json(data, application.bot))
+            with received.get_lock():
+                received.value += 1
+        # stop() lets the updates already queued finish before returning.
+        await application.stop()
+    logger.info(f"Worker {shard} stopped")
+
+
+def run_worker(shard: int, inbox: Any, received: Any, factory: AppFactory) -> None:
+    asyncio.run(serve_shard(shard, inbox, received, factory))
+
+
+class Supervisor:
+    """Runs one bot process per shard and routes updates by ``chat_id``.
+
+    Each chat always lands on the same worker, so its agent, checkpoints and
+    per-chat queue stay local to one process while different chats use all
+    cores. Every shard has a long-lived inbox queue that outlives its worker,
+    which lets a worker be restarted gracefully: it drains what was queued
+    before the stop signal and its replacement picks up the rest.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        factory: AppFactory,
+        context: Optional[BaseContext] = None,
+        stop_timeout: float = 30.0,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.factory = factory
+        self.context: Any = context or multiprocessing.get_context("spawn")
+        self.stop_timeout = stop_timeout
+        self.inboxes = [self.context.Queue() for _ in range(self.workers)]
+        self.received = [self.context.Value("L", 0) for _ in range(self.workers)]
+        self.dispatched = [0] * self.workers
+        self.restarts = [0] * self.workers
+        self.started_at = [0.0] * self.workers
+        self.processes: List[Optional[BaseProcess]] = [None] * self.workers
+        # Held while a shard's worker is being replaced, so a restart and a
+        # crash check can never both spawn one for the same inbox.
+        self._shard_locks = [threading.Lock() for _ in range(self.workers)]
+        self._spread = itertools.count()
+
+    def start(self) -> None:
+        for shard in range(self.workers):
+            self._spawn(shard)
+
+    def _spawn(self, shard: int) -> None:
+        process = self.context.Process(
+            target=run_worker,
+            args=(shard, self.inboxes[shard], self.received[shard], self.factory),
+            name=f"bot-worker-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[shard] = process
+        self.started_at[shard] = time.monotonic()
+        logger.info(f"Started worker {shard} (pid {process.pid})")
+
+    def dispatch(self, data: Dict[str, Any]) -> int:
+        chat_id = chat_id_of(data)
+        if chat_id is None:
+            # No chat state to keep local, so spread them instead of piling
+            # them all on one shard.
+            shard = next(self._spread) % self.workers
+        else:
+            shard = shard_for(chat_id, self.workers)
+        self.inboxes[shard].put(data)
+        self.dispatched[shard] += 1
+        return shard
+
+    def _stop_worker(self, shard: int) -> None:
+        process = self.processes[shard]
+        if process is None or not process.is_alive():
+            return
+        self.inboxes[shard].put(None)
+        process.join(self.stop_timeout)
+        if process.is_alive():
+            logger.warning(f"Worker {shard} did not stop in time, terminating")
+            process.terminate()
+            process.join()
+
+    def restart(self, shard: int) -> None:
+        """Gracefully replace one worker; its queued updates are not lost."""
+        with self._shard_locks[shard]:
+            self._stop_worker(shard)
+            self._spawn(shard)
+            self.restarts[shard] += 1
+
+    def rolling_restart(self) -> None:
+        # One shard at a time, so the other chats keep being served.
+        for shard in range(self.workers):
+            self.restart(shard)
+
+    def check(self) -> List[int]:
+        """Respawn workers that died unexpectedly; return their shards."""
+        crashed = []
+        for shard, lock in enumerate(self._shard_locks):
+            # A shard being restarted gets its new worker from restart()
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                process = self.processes[shard]
+                if process is not None and not process.is_alive():
+                    logger.warning(
+                        f"Worker {shard} exited with code {process.exitcode}, "
+                        "restarting"
+                    )
+                    self._spawn(shard)
+                    self.restarts[shard] += 1
+                    crashed.append(shard)
+            finally:
+                lock.release()
+        return crashed
+
+    def stop(self) -> None:
+        for shard in range(self.workers):
+            self._stop_worker(shard)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        stats = []
+        for shard, process in enumerate(self.processes):
+            try:
+                backlog: Optional[int] = self.inboxes[shard].qsize()
+            except NotImplementedError:  # pragma: no cover - macOS
+                backlog = None
+            stats.append(
+                {
+                    "shard": shard,
+                    "pid": process.pid if process else None,
+                    "alive": bool(process and process.is_alive()),
+                    "uptime": round(now - self.started_at[shard], 1),
+                    "restarts": self.restarts[shard],
+                    "dispatched": self.dispatched[shard],
+                    "received": self.received[shard].value,
+                    "backlog": backlog,
+                }
+            )
+        return stats
+
+    def health(self) -> Tuple[bool, Dict[str, Any]]:
+        stats = self.stats()
+        return all(worker["alive"] for worker in stats), {"workers": stats}
+
+
+async def poll_updates(
+    bot: Bot, supervisor: Supervisor, timeout: int = 30, retry_delay: float = 1.0
+) -> None:
+    """Long-poll Telegram from the supervisor and hand updates to workers."""
+    offset: Optional[int] = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=timeout, allowed_updates=Update.ALL_TYPES
+            )
+        except TelegramError as e:
+            logger.warning(f"getUpdates failed: {e}")
+            await asyncio.sleep(retry_delay)
+            continue
+        for update in updates:
+            supervisor.dispatch(update.to_dict())
+            offset = update.update_id + 1
+
+
+async def supervise(
+    supervisor: Supervisor,
+    bot: Bot,
+    webhook: bool,
+    listen: str,
+    port: int,
+    url: str = "",
+    path: str = "/telegram",
+    secret_token: Optional[str] = None,
+    stop: Optional[asyncio.Event] = None,
+    check_interval: float = 1.0,
+) -> None:
+    """Run the workers and the update ingress until ``stop`` is set.
+
+    ``GET /healthz`` on ``listen:port`` reports per-worker metrics in both
+    modes; SIGHUP triggers a rolling restart of the workers.
+    """
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    supervisor.start()
+
+    async def dispatch(data: Dict[str, Any]) -> None:
+        supervisor.dispatch(data)
+
+    runner = web.AppRunner(
+        create_ingress_app(dispatch, supervisor.health, path, secret_token)
+    )
+    restarts: Set[asyncio.Future[None]] = set()
+
+    def request_restart() -> None:
+        logger.info("Rolling restart requested")
+        future = asyncio.ensure_future(asyncio.to_thread(supervisor.rolling_restart))
+        restarts.add(future)
+        future.add_done_callback(restarts.discard)
+
+    if hasattr(signal, "SIGHUP"):
+        loop.add_signal_handler(signal.SIGHUP, request_restart)
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        async with bot:
+            polling: Optional[asyncio.Task[None]] = None
+            if webhook:
+                await bot.set_webhook(
+                    url=url.rstrip("/") + path,
+                    secret_token=secret_token,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            else:
+                await bot.delete_webhook()
+                polling = asyncio.create_task(poll_updates(bot, supervisor))
+            try:
+                while not stop.is_set():
+                    try:
+                        await asyncio.wait_for(stop.wait(), check_interval)
+                    except asyncio.TimeoutError:
+                        await asyncio.to_thread(supervisor.check)
+            finally:
+                if polling is not None:
+                    polling.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await polling
+    finally:
+        if hasattr(signal, "SIGHUP"):
+            loop.remove_signal_handler(signal.SIGHUP)
+        await runner.cleanup()
+        await asyncio.gather(*restarts)
+        await asyncio.to_thread(supervisor.stop)
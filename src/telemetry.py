@@ -0,0 +1,460 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from telegram.request import BaseRequest, RequestData
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# Latency buckets in seconds, from a cached reply to a slow Imagen call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric rendered in the Prometheus text exposition format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Mapping[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {list(self.labelnames)}, "
+                f"got {sorted(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        return []
+
+    def render(self) -> List[str]:
+        header = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return header + self._samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError(f"{self.name} is a counter and cannot decrease")
+        self._add(amount, labels)
+
+    def _add(self, amount: float, labels: Mapping[str, Any]) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        self._add(amount, labels)
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self._add(-amount, labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: observations per bucket (the last one is +Inf), sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: Any) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def sum(self, **labels: Any) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(
+                (k, list(c), self._sums[k]) for k, c in self._counts.items()
+            )
+        names = self.labelnames + ("le",)
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _labels(names, key + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """Metric whose samples are read from ``function`` at scrape time.
+
+    Used for values other components already track (cache hit counts, queue
+    lengths), so the hot path does no extra bookkeeping.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        function: Callable[[], Mapping[LabelValues, float]],
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.function = function
+
+    def _samples(self) -> List[str]:
+        try:
+            values = sorted(self.function().items())
+        except Exception as e:
+            logger.warning(f"Could not collect metric {self.name}: {e}")
+            return []
+        return [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in values
+        ]
+
+
+class MetricsRegistry:
+    """The process's metrics, by name. Asking twice for a name returns the same one."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric, replace: bool = False) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is None or replace:
+                self._metrics[metric.name] = metric
+                return metric
+        if type(existing) is not type(metric) or (
+            existing.labelnames != metric.labelnames
+        ):
+            raise ValueError(f"Metric {metric.name} is already registered differently")
+        return existing
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        result: Counter = self._register(Counter(name, help, labelnames))
+        return result
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        result: Gauge = self._register(Gauge(name, help, labelnames))
+        return result
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        result: Histogram = self._register(Histogram(name, help, labelnames, buckets))
+        return result
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        function: Callable[[], Mapping[LabelValues, float]],
+        labelnames: Sequence[str] = (),
+    ) -> CallbackMetric:
+        # Re-registering replaces the callback (e.g. a rebuilt queue).
+        metric = CallbackMetric(name, help, kind, function, labelnames)
+        result: CallbackMetric = self._register(metric, replace=True)
+        return result
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            registered = sorted(self._metrics.items())
+        lines: List[str] = []
+        for _, metric in registered:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class Span:
+    """One timed operation; spans started inside it share its ``trace_id``."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    duration: float = 0.0
+    status: str = "ok"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class Tracer:
+    """Records spans in memory, in the spirit of OpenTelemetry but collector-free.
+
+    The active span lives in a ``ContextVar``, so it follows asyncio tasks and
+    the executor threads LangGraph runs sync nodes in; a span opened there
+    becomes a child of the turn that caused it. Each finished span feeds the
+    ``span_duration_seconds`` histogram (and ``span_errors_total`` when it
+    raised), is logged at DEBUG and kept in a ring of the last ``max_spans``.
+    """
+
+    def __init__(self, registry: MetricsRegistry, max_spans: int = 1000) -> None:
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self.durations = registry.histogram(
+            "span_duration_seconds", "Duration of traced operations", ("span",)
+        )
+        self.errors = registry.counter(
+            "span_errors_total", "Traced operations that raised", ("span",)
+        )
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start=time.time(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.status = "error"
+            span.attributes["error"] = repr(e)
+            self.errors.inc(span=name)
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self.durations.observe(span.duration, span=name)
+            self.spans.append(span)
+            logger.debug(
+                f"span {name} {span.duration * 1000:.1f}ms {span.status} "
+                f"trace={span.trace_id} {span.attributes}"
+            )
+
+    def recent(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return [asdict(span) for span in list(self.spans)[-limit:]]
+
+
+metrics = MetricsRegistry()
+tracer = Tracer(metrics)
+span = tracer.span
+
+# name -> getter of a cache object with ``hits`` and ``misses`` counters
+_caches: Dict[str, Callable[[], Any]] = {}
+
+
+def track_cache(name: str, source: Callable[[], Any]) -> None:
+    """Export the hit/miss counts of the cache ``source()`` returns, if any.
+
+    ``source`` is called at scrape time, so lazily created caches work.
+    """
+    _caches[name] = source
+
+
+def _cache_requests() -> Dict[LabelValues, float]:
+    samples: Dict[LabelValues, float] = {}
+    for name, source in sorted(_caches.items()):
+        cache = source()
+        if cache is not None:
+            samples[(name, "hit")] = cache.hits
+            samples[(name, "miss")] = cache.misses
+    return samples
+
+
+metrics.callback(
+    "cache_requests_total",
+    "Cache lookups by cache and result",
+    "counter",
+    _cache_requests,
+    ("cache", "result"),
+)
+
+
+class TracedRequest(BaseRequest):
+    """Wraps a PTB request so every Bot API call becomes a ``telegram.*`` span.
+
+    Only the API method name is recorded: the URL contains the bot token.
+    """
+
+    def __init__(self, inner: BaseRequest) -> None:
+        self.inner = inner
+
+    async def initialize(self) -> None:
+        await self.inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self.inner.shutdown()
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.inner.read_timeout
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout: Any = BaseRequest.DEFAULT_NONE,
+        write_timeout: Any = BaseRequest.DEFAULT_NONE,
+        connect_timeout: Any = BaseRequest.DEFAULT_NONE,
+        pool_timeout: Any = BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        with span(f"telegram.{url.rsplit('/', 1)[-1]}") as current:
+            status, payload = await self.inner.do_request(
+                url,
+                method,
+                request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )
+            current.set(status=status, bytes=len(payload))
+            return status, payload
+
+
+def start_metrics_server(
+    listen: str,
+    port: int,
+    registry: MetricsRegistry = metrics,
+    traces: Tracer = tracer,
+) -> ThreadingHTTPServer:
+    """Serve ``GET /metrics`` (Prometheus text) and ``GET /traces`` (recent spans).
+
+    Runs in a daemon thread, independent of the bot's event loop, so it keeps
+    answering while the loop is busy and works in polling, webhook and CLI
+    mode alike.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body = registry.render().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/traces":
+                body = json.dumps(traces.recent()).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((listen, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Metrics on http://{listen}:{server.server_port}/metrics")
+    return server
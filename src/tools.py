@@ -1,20 +1,163 @@
 import asyncio
-import tempfile
-from typing import Any, Optional, Type
+import threading
+import time
+import weakref
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Literal,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+)
 
-import edge_tts
 from google import genai
 from google.genai import types
+from langchain_core.runnables import ensure_config
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field, PrivateAttr
 
-from src.config import Config
+from src.artifacts import MediaArtifact, get_artifact_store
+from src.cache import DiskCache
+from src.config import Config, Personality
+from src.encoders import get_encoder
+from src.selfies import SelfieUnavailable, get_selfie_service
+from src.speech import (
+    edge_tts_synthesizer,
+    split_sentences,
+    stream_speech,
+    to_ogg_opus,
+)
+from src.telemetry import metrics, span, track_cache
+
+# Tools return (content for the model, media for the bot) and use
+# response_format="content_and_artifact", so the media never has to be parsed
+# back out of the message text.
+ToolResult = Tuple[str, Optional[MediaArtifact]]
+
+SELFIE_SENT = "Selfie generated; it will be sent along with your reply."
+VOICE_SENT = "Voice message generated; it will be sent along with your reply."
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parse "SelfieTool=4,VoiceTool=8" into {"SelfieTool": 4, "VoiceTool": 8}."""
+    limits: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if not name.strip() or limit < 1:
+            raise ValueError(
+                f"Invalid TOOL_CONCURRENCY entry {item!r}; expected Name=N with N >= 1"
+            )
+        limits[name.strip()] = limit
+    return limits
+
+
+tool_calls_waiting = metrics.gauge(
+    "tool_calls_waiting",
+    "Tool calls queued behind the tool's concurrency cap",
+    ("tool",),
+)
+
+
+class ToolLimits:
+    """Per-tool caps on concurrent calls, shared by every chat in the process.
+
+    The tool calls of one AI message run concurrently (ToolNode gathers them);
+    this only stops a burst of chats from firing more Imagen or TTS requests at
+    once than the backend's quota allows. Async callers wait on a semaphore of
+    their own event loop, sync callers (executor threads) on a thread one,
+    which a thread already holding it passes straight through.
+    """
+
+    def __init__(self, limits: Mapping[str, int]) -> None:
+        self.limits = dict(limits)
+        self._loops: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]
+        ] = weakref.WeakKeyDictionary()
+        self._threads = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in self.limits.items()
+        }
+        self._held = threading.local()
+
+    def _semaphore(self, name: str) -> Optional[asyncio.Semaphore]:
+        if name not in self.limits:
+            return None
+        semaphores = self._loops.setdefault(asyncio.get_running_loop(), {})
+        if name not in semaphores:
+            semaphores[name] = asyncio.Semaphore(self.limits[name])
+        return semaphores[name]
+
+    @asynccontextmanager
+    async def acquire(self, name: str) -> AsyncIterator[float]:
+        """Hold one of ``name``'s slots; yields the seconds spent waiting."""
+        semaphore = self._semaphore(name)
+        if semaphore is None:
+            yield 0.0
+            return
+        started = time.perf_counter()
+        tool_calls_waiting.inc(tool=name)
+        try:
+            await semaphore.acquire()
+        finally:
+            tool_calls_waiting.dec(tool=name)
+        try:
+            yield time.perf_counter() - started
+        finally:
+            semaphore.release()
+
+    @contextmanager
+    def hold(self, name: str) -> Iterator[float]:
+        semaphore = self._threads.get(name)
+        # Both the tool node and the tool's own sync path hold the slot.
+        held = self._held.__dict__.setdefault("names", set())
+        if semaphore is None or name in held:
+            yield 0.0
+            return
+        started = time.perf_counter()
+        tool_calls_waiting.inc(tool=name)
+        try:
+            semaphore.acquire()
+        finally:
+            tool_calls_waiting.dec(tool=name)
+        held.add(name)
+        try:
+            yield time.perf_counter() - started
+        finally:
+            held.discard(name)
+            semaphore.release()
+
+
+tool_limits = ToolLimits(parse_limits(Config.TOOL_CONCURRENCY))
 
 
 class SelfieToolInput(BaseModel):
     description: str = Field(description="A description of the selfie to generate.")
 
 
+class NoImageError(Exception):
+    """Imagen answered without an image."""
+
+
+def image_bytes(response: Any) -> bytes:
+    if response.generated_images and response.generated_images[0].image:
+        data = response.generated_images[0].image.image_bytes
+        if data:
+            return bytes(data)
+        raise NoImageError("no image bytes")
+    raise NoImageError("no images returned")
+
+
 class SelfieTool(BaseTool):
     name: str = "SelfieTool"
     description: str = (
@@ -22,6 +165,7 @@ class SelfieTool(BaseTool):
         "Use this when the user asks for a photo or selfie."
     )
     args_schema: Type[BaseModel] = SelfieToolInput
+    response_format: Literal["content", "content_and_artifact"] = "content_and_artifact"
     _client: Optional[Any] = PrivateAttr(default=None)
 
     def _get_client(self) -> Optional[Any]:
@@ -30,70 +174,113 @@ class SelfieTool(BaseTool):
                 self._client = genai.Client(api_key=Config.GOOGLE_API_KEY)
         return self._client
 
-    def _run(self, description: str) -> str:
-        client = self._get_client()
-        if not client:
-            return "Image generation is not configured (missing GOOGLE_API_KEY)."
+    async def _selfie(
+        self, description: str, generate: Callable[[str], Awaitable[bytes]]
+    ) -> ToolResult:
+        # Rate limits apply per chat (the thread) and the cache per persona.
+        configurable = ensure_config().get("configurable", {})
+        personality = configurable.get("personality")
+        scope = personality.name if isinstance(personality, Personality) else ""
+        try:
+            selfie = await get_selfie_service().get(
+                str(configurable.get("thread_id", "")), scope, description, generate
+            )
+        except SelfieUnavailable as e:
+            return str(e), None
+        except NoImageError as e:
+            return f"Failed to generate image ({e}).", None
+        except Exception as e:
+            return f"Error generating selfie: {str(e)}", None
 
-        print(f"[SelfieTool] Generating selfie for: {description}")
+        store = get_artifact_store()
+        if selfie.path:
+            # Copied, as the cache may evict the entry before it is sent.
+            artifact_id = store.put_file("image", selfie.path)
+        else:
+            artifact_id = store.put("image", "selfie.png", selfie.image or b"")
+        return SELFIE_SENT, {"kind": "photo", "artifact_id": artifact_id}
 
+    def _run(self, description: str) -> ToolResult:
+        # Fallback for sync execution (executor threads): Imagen's blocking
+        # client runs in a worker thread, never on an event loop.
+        client = self._get_client()
+        if not client:
+            return "Image generation is not configured (missing GOOGLE_API_KEY).", None
         try:
-            # Use 'imagen-3.0-generate-001' (Imagen 3) for high fidelity "2026" results.
-            response = client.models.generate_images(
-                model="imagen-3.0-generate-001",
-                prompt=description,
-                config=types.GenerateImagesConfig(
-                    number_of_images=1,
-                ),
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            return (
+                "Error: Async event loop already running, cannot call synchronous "
+                "_run. Please ensure the agent uses ainvoke.",
+                None,
             )
 
-            if response.generated_images and response.generated_images[0].image:
-                image_bytes = response.generated_images[0].image.image_bytes
+        print(f"[SelfieTool] Generating selfie for: {description}")
+        service = get_selfie_service()
 
-                if image_bytes:
-                    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
-                        f.write(image_bytes)
-                        return f"IMAGE_GENERATED:{f.name}"
-                else:
-                    return "Failed to generate image (no image bytes)."
-            else:
-                return "Failed to generate image (no images returned)."
+        def generate_blocking(prompt: str) -> bytes:
+            # Every sync call runs its own event loop, so the service's
+            # async slots cannot bound the threads.
+            with service.hold():
+                return image_bytes(
+                    client.models.generate_images(
+                        model="imagen-3.0-generate-001",
+                        prompt=prompt,
+                        config=types.GenerateImagesConfig(number_of_images=1),
+                    )
+                )
 
-        except Exception as e:
-            return f"Error generating selfie: {str(e)}"
+        async def generate(prompt: str) -> bytes:
+            return await asyncio.to_thread(generate_blocking, prompt)
 
-    async def _arun(self, description: str) -> str:
+        with tool_limits.hold(self.name):
+            return asyncio.run(self._selfie(description, generate))
+
+    async def _arun(self, description: str) -> ToolResult:
         client = self._get_client()
         if not client:
-            return "Image generation is not configured (missing GOOGLE_API_KEY)."
+            return "Image generation is not configured (missing GOOGLE_API_KEY).", None
 
         print(f"[SelfieTool] Generating selfie for: {description}")
 
-        try:
+        async def generate(prompt: str) -> bytes:
             # Use 'imagen-3.0-generate-001' for high fidelity "2026" results.
-            # Using client.aio for async execution
             response = await client.aio.models.generate_images(
                 model="imagen-3.0-generate-001",
-                prompt=description,
-                config=types.GenerateImagesConfig(
-                    number_of_images=1,
-                ),
+                prompt=prompt,
+                config=types.GenerateImagesConfig(number_of_images=1),
             )
+            return image_bytes(response)
 
-            if response.generated_images and response.generated_images[0].image:
-                image_bytes = response.generated_images[0].image.image_bytes
+        return await self._selfie(description, generate)
 
-                if image_bytes:
-                    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
-                        f.write(image_bytes)
-                        return f"IMAGE_GENERATED:{f.name}"
-                else:
-                    return "Failed to generate image (no image bytes)."
-            else:
-                return "Failed to generate image (no images returned)."
 
-        except Exception as e:
-            return f"Error generating selfie: {str(e)}"
+_tts_cache: Optional[DiskCache] = None
+
+
+def get_tts_cache() -> DiskCache:
+    global _tts_cache
+    if _tts_cache is None:
+        _tts_cache = DiskCache(
+            Config.TTS_CACHE_DIR,
+            Config.TTS_CACHE_MAX_MB * 1024 * 1024,
+            suffix=".mp3" if Config.VOICE_FORMAT == "mp3" else ".ogg",
+        )
+    return _tts_cache
+
+
+track_cache("tts", lambda: _tts_cache)
+tts_first_audio = metrics.histogram(
+    "tts_first_audio_seconds",
+    "Time from starting a voice synthesis to its first audio chunk",
+)
+voice_bytes = metrics.histogram(
+    "voice_message_bytes",
+    "Size of synthesized voice messages, as uploaded",
+    buckets=(4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288),
+)
 
 
 class VoiceToolInput(BaseModel):
@@ -106,26 +293,68 @@ class VoiceTool(BaseTool):
         "Generates spoken audio from text. Use this to send a voice message."
     )
     args_schema: Type[BaseModel] = VoiceToolInput
+    response_format: Literal["content", "content_and_artifact"] = "content_and_artifact"
 
-    async def _arun(self, text: str) -> str:
+    async def _arun(self, text: str) -> ToolResult:
         if not Config.EDGE_TTS_VOICE:
-            return "Voice generation is not configured (missing EDGE_TTS_VOICE)."
+            return "Voice generation is not configured (missing EDGE_TTS_VOICE).", None
 
         print(f"[VoiceTool] Generating voice for: {text}")
 
         try:
-            communicate = edge_tts.Communicate(text, Config.EDGE_TTS_VOICE)
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
-                temp_filename = f.name
-
-            # edge-tts save is async
-            await communicate.save(temp_filename)
-            return f"AUDIO_GENERATED:{temp_filename}"
+            # Identical (voice, text, rate, pitch, format) always yields the
+            # same audio, so repeated phrases are served from the on-disk cache.
+            cache = get_tts_cache()
+            key = cache.make_key(
+                Config.EDGE_TTS_VOICE,
+                text,
+                Config.EDGE_TTS_RATE,
+                Config.EDGE_TTS_PITCH,
+                Config.VOICE_FORMAT,
+                str(Config.VOICE_OPUS_BITRATE),
+            )
+            path = cache.get(key)
+            if path is None:
+                path = await self._synthesize(cache, key, text)
+            # Copied, as the cache may evict the clip before it is sent.
+            artifact_id = get_artifact_store().put_file("audio", path)
+            return VOICE_SENT, {"kind": "voice", "artifact_id": artifact_id}
 
         except Exception as e:
-            return f"Error generating voice: {str(e)}"
+            return f"Error generating voice: {str(e)}", None
+
+    async def _synthesize(self, cache: DiskCache, key: str, text: str) -> str:
+        """Synthesize ``text`` sentence by sentence and cache the whole clip.
+
+        edge-tts only produces MP3, so unless VOICE_FORMAT is "mp3" the clip
+        is transcoded to OGG/Opus, Telegram's voice note format.
+        """
+        synthesize = edge_tts_synthesizer(
+            str(Config.EDGE_TTS_VOICE), Config.EDGE_TTS_RATE, Config.EDGE_TTS_PITCH
+        )
+        audio = bytearray()
+        started = time.perf_counter()
+        with span("tts", sentences=len(split_sentences(text))):
+            async with aclosing(
+                stream_speech(text, synthesize, Config.TTS_PIPELINE_DEPTH)
+            ) as chunks:
+                async for data in chunks:
+                    if not audio:
+                        tts_first_audio.observe(time.perf_counter() - started)
+                    audio += data
+        if not audio:
+            raise ValueError("no audio received")
+        data = bytes(audio)
+        if Config.VOICE_FORMAT != "mp3":
+            with span("tts.transcode", mp3_bytes=len(data)) as transcode:
+                data = await asyncio.get_running_loop().run_in_executor(
+                    get_encoder(), to_ogg_opus, data, Config.VOICE_OPUS_BITRATE
+                )
+                transcode.set(ogg_bytes=len(data))
+        voice_bytes.observe(len(data))
+        return await asyncio.to_thread(cache.put_bytes, key, data)
 
-    def _run(self, text: str) -> str:
+    def _run(self, text: str) -> ToolResult:
         # Fallback for sync execution, though not recommended in async app
         try:
             try:
@@ -136,9 +365,12 @@ class VoiceTool(BaseTool):
             if loop and loop.is_running():
                 return (
                     "Error: Async event loop already running, cannot call synchronous "
-                    "_run. Please ensure the agent uses ainvoke."
+                    "_run. Please ensure the agent uses ainvoke.",
+                    None,
                 )
 
-            return asyncio.run(self._arun(text))
+            # A fresh event loop per call, so only the thread limit applies.
+            with tool_limits.hold(self.name):
+                return asyncio.run(self._arun(text))
         except Exception as e:
-            return f"Error: {e}"
+            return f"Error: {e}", None
@@ -0,0 +1,102 @@
+import asyncio
+import hmac
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+
+Dispatch = Callable[[Dict[str, Any]], Awaitable[None]]
+Health = Callable[[], Tuple[bool, Dict[str, Any]]]
+
+
+def create_ingress_app(
+    dispatch: Dispatch,
+    health: Health,
+    path: str = "/telegram",
+    secret_token: Optional[str] = None,
+) -> web.Application:
+    """Build the aiohttp app that receives Telegram updates.
+
+    ``dispatch`` gets each raw update and should only queue it, so Telegram
+    gets its 200 right away. ``GET /healthz`` returns ``health()``'s details,
+    with status 503 while it reports not ready.
+    """
+
+    async def receive_update(request: web.Request) -> web.Response:
+        if secret_token and not hmac.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret_token
+        ):
+            return web.Response(status=403)
+        try:
+            await dispatch(await request.json())
+        except Exception as e:
+            logger.warning(f"Rejected malformed webhook payload: {e}")
+            return web.Response(status=400)
+        return web.Response()
+
+    async def healthz(request: web.Request) -> web.Response:
+        ready, details = health()
+        return web.json_response(
+            {"status": "ok" if ready else "starting", **details},
+            status=200 if ready else 503,
+        )
+
+    app = web.Application()
+    app.router.add_post(path, receive_update)
+    app.router.add_get("/healthz", healthz)
+    return app
+
+
+def create_webhook_app(
+    application: Application,  # type: ignore[type-arg]
+    path: str = "/telegram",
+    secret_token: Optional[str] = None,
+) -> web.Application:
+    """Ingress app that feeds updates straight into one PTB application.
+
+    The application processes them with its own concurrency limit.
+    """
+
+    async def dispatch(data: Dict[str, Any]) -> None:
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    def health() -> Tuple[bool, Dict[str, Any]]:
+        return application.running, {
+            "pending_updates": application.update_queue.qsize(),
+            "concurrent_updates": application.concurrent_updates,
+        }
+
+    return create_ingress_app(dispatch, health, path, secret_token)
+
+
+async def serve_webhook(
+    application: Application,  # type: ignore[type-arg]
+    listen: str,
+    port: int,
+    url: str,
+    path: str = "/telegram",
+    secret_token: Optional[str] = None,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    """Register the webhook with Telegram and serve updates until ``stop`` is set."""
+    runner = web.AppRunner(create_webhook_app(application, path, secret_token))
+    async with application:
+        await application.start()
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, listen, port).start()
+            await application.bot.set_webhook(
+                url=url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Webhook listening on {listen}:{port}{path}")
+            await (stop or asyncio.Event()).wait()
+        finally:
+            await runner.cleanup()
+            await application.stop()
@@ -0,0 +1,49 @@
+from contextlib import ExitStack
+from typing import Any, Callable, Optional
+from unittest.mock import patch
+
+import pytest
+
+from src.agent import create_agent
+from src.config import Config, Personality
+
+# --- Fixtures shared by the tests ---
+
+
+class FakeClock:
+    """Stands in for ``time.monotonic``; tests move time by setting ``now``."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def build_app() -> Callable[..., Any]:
+    """Compile the agent around a fake chat model.
+
+    Keyword arguments override ``Config`` attributes while the graph is built.
+    """
+
+    def build(
+        llm: Any, personality: Optional[Personality] = None, **settings: Any
+    ) -> Any:
+        if personality is None:
+            personality = Personality(name="Sacha", byline="", identity=[], behavior=[])
+        with ExitStack() as stack:
+            stack.enter_context(patch.object(Config, "LLM_PROVIDER", "google"))
+            for name, value in settings.items():
+                stack.enter_context(patch.object(Config, name, value))
+            stack.enter_context(
+                patch("src.agent.ChatGoogleGenerativeAI", return_value=llm)
+            )
+            return create_agent(personality)
+
+    return build
@@ -3,7 +3,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
-from src.agent import create_agent
+from src.agent import create_agent, create_graph
 from src.config import Config, Personality
 
 # --- Tests for src/agent.py ---
@@ -22,20 +22,18 @@ def mock_personality():
 def test_create_agent_ollama(mock_personality):
     with patch.object(Config, "LLM_PROVIDER", "ollama"):
         with patch("src.agent.ChatOllama") as MockOllama:
-            with patch("src.agent.StateGraph"):
-                create_agent(mock_personality)
-                MockOllama.assert_called_once()
-                # We can check if args were passed correctly
-                assert MockOllama.call_args[1]["model"] == Config.OLLAMA_MODEL
+            create_agent(mock_personality)
+            MockOllama.assert_called_once()
+            # We can check if args were passed correctly
+            assert MockOllama.call_args[1]["model"] == Config.OLLAMA_MODEL
 
 
 def test_create_agent_google(mock_personality):
     with patch.object(Config, "LLM_PROVIDER", "google"):
         with patch("src.agent.ChatGoogleGenerativeAI") as MockGoogle:
-            with patch("src.agent.StateGraph"):
-                create_agent(mock_personality)
-                MockGoogle.assert_called_once()
-                assert MockGoogle.call_args[1]["model"] == "gemini-3.0-pro"
+            create_agent(mock_personality)
+            MockGoogle.assert_called_once()
+            assert MockGoogle.call_args[1]["model"] == "gemini-3.0-pro"
 
 
 def test_chatbot_node_logic(mock_personality):
@@ -71,3 +69,15 @@ def test_chatbot_node_logic(mock_personality):
             messages_passed = args[0]
             assert isinstance(messages_passed[0], SystemMessage)
             assert "2026" in messages_passed[0].content
+
+
+def test_graph_requires_personality():
+    with patch.object(Config, "LLM_PROVIDER", "google"):
+        with patch("src.agent.ChatGoogleGenerativeAI"):
+            graph = create_graph()
+
+    with pytest.raises(ValueError, match="No personality configured"):
+        graph.invoke(
+            {"messages": [HumanMessage(content="Hi")]},
+            config={"configurable": {"thread_id": "1"}},
+        )
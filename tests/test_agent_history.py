@@ -0,0 +1,344 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from src.agent import select_window, split_turns, summary_request
+from src.config import Config, Personality
+
+# --- Tests for the conversation window in src/agent.py ---
+
+
+class RecordingLLM:
+    """Fake chat model that records the size of every prompt it receives."""
+
+    def __init__(self) -> None:
+        self.prompts: list[list] = []
+
+    def bind_tools(self, tools):
+        return self
+
+    def _respond(self, messages):
+        self.prompts.append(messages)
+        if isinstance(messages[-1], HumanMessage) and messages[-1].content.startswith(
+            "Update the running summary"
+        ):
+            return AIMessage(content=f"summary #{len(self.prompts)}")
+        return AIMessage(content="ok")
+
+    def invoke(self, messages, config=None):
+        return self._respond(messages)
+
+    async def ainvoke(self, messages, config=None):
+        return self._respond(messages)
+
+
+class SlowSummaryLLM(RecordingLLM):
+    """Holds every summary request until ``release`` is set; fails the first
+    ``failures`` of them."""
+
+    def __init__(self, failures: int = 0) -> None:
+        super().__init__()
+        self.release = asyncio.Event()
+        self.failures = failures
+
+    async def ainvoke(self, messages, config=None):
+        if messages[-1].content.startswith("Update the running summary"):
+            await self.release.wait()
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("summary failed")
+        return self._respond(messages)
+
+
+async def settle():
+    """Wait for the background tasks started by the previous turn."""
+    await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}))
+
+
+@pytest.fixture
+def personality():
+    return Personality(name="Window", byline="", identity=[], behavior=[])
+
+
+def tool_turn():
+    return [
+        HumanMessage(content="selfie?", id="h"),
+        AIMessage(
+            content="",
+            id="a1",
+            tool_calls=[{"name": "SelfieTool", "args": {}, "id": "call-1"}],
+        ),
+        ToolMessage(content="IMAGE_GENERATED:x.png", tool_call_id="call-1", id="t"),
+        AIMessage(content="here you go", id="a2"),
+    ]
+
+
+def test_split_turns_keeps_tool_pairs_together():
+    messages = [AIMessage(content="welcome")] + tool_turn()
+    turns = split_turns(messages)
+    assert len(turns) == 2
+    assert [type(m) for m in turns[1]] == [
+        HumanMessage,
+        AIMessage,
+        ToolMessage,
+        AIMessage,
+    ]
+
+
+def test_select_window_by_turns():
+    messages = []
+    for i in range(5):
+        messages += [HumanMessage(content=f"q{i}"), AIMessage(content=f"a{i}")]
+    messages += tool_turn()
+
+    dropped, kept = select_window(messages, max_turns=2, max_tokens=10_000)
+
+    assert len(dropped) == 8
+    assert kept[0].content == "q4"
+    assert isinstance(kept[-2], ToolMessage)
+
+
+def test_select_window_by_tokens_keeps_latest_turn():
+    messages = [
+        HumanMessage(content="x " * 500),
+        AIMessage(content="y " * 500),
+        HumanMessage(content="z " * 500),
+    ]
+    dropped, kept = select_window(messages, max_turns=10, max_tokens=10)
+    assert len(dropped) == 2
+    assert kept == messages[2:]
+
+
+def test_summary_request_includes_previous_summary():
+    dropped = [HumanMessage(content="old")]
+    request = summary_request("", dropped)
+    assert "Current summary" not in request[-1].content
+    request = summary_request("likes cats", dropped)
+    assert request[0] is dropped[0]
+    assert "likes cats" in request[-1].content
+
+
+def test_prompt_size_stays_bounded(personality, build_app):
+    llm = RecordingLLM()
+    app = build_app(llm, personality)
+    config = {"configurable": {"thread_id": "long"}}
+
+    with patch.object(Config, "HISTORY_MAX_TURNS", 3):
+        for i in range(40):
+            app.invoke({"messages": [HumanMessage(content=f"msg {i}")]}, config)
+
+    sizes = [len(prompt) for prompt in llm.prompts]
+    # system prompt + 2 full previous turns + the new human message
+    assert max(sizes) == 1 + 2 * 2 + 1
+    # Past the limit the window drops to the low watermark (1 turn), then
+    # grows back: one trim every 3 turns
+    assert sizes == ([2, 4, 6] * 14)[:40]
+    assert len(app.get_state(config).values["messages"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_summaries_are_batched_by_the_low_watermark(personality, build_app):
+    llm = RecordingLLM()
+    app = build_app(llm, personality)
+    config = {"configurable": {"thread_id": "batched"}}
+
+    with (
+        patch.object(Config, "HISTORY_MAX_TURNS", 4),
+        patch.object(Config, "HISTORY_SUMMARIZE", True),
+    ):
+        for i in range(12):
+            await app.ainvoke({"messages": [HumanMessage(content=f"msg {i}")]}, config)
+
+    summaries = [p for p in llm.prompts if p[-1].content.startswith("Update")]
+    # Trimmed to 2 turns at turns 5, 8 and 11, instead of at every turn from 5
+    assert len(summaries) == 3
+    # Each summary folds in the 3 turns dropped since the previous one
+    assert [len(p) - 1 for p in summaries] == [3 * 2] * 3
+    state = app.get_state(config).values
+    assert [m.content for m in state["messages"][::2]] == ["msg 9", "msg 10", "msg 11"]
+
+
+@pytest.mark.asyncio
+async def test_rolling_summary_async(personality, build_app):
+    llm = RecordingLLM()
+    app = build_app(llm, personality)
+    config = {"configurable": {"thread_id": "summary"}}
+
+    with patch.object(Config, "HISTORY_MAX_TURNS", 1):
+        with patch.object(Config, "HISTORY_SUMMARIZE", True):
+            for text in ["I'm Ana", "hi", "bye"]:
+                await app.ainvoke({"messages": [HumanMessage(content=text)]}, config)
+                await settle()
+
+    # Requested in the background by "hi", swapped in for its turns by "bye"
+    state = app.get_state(config).values
+    assert state["summary"].startswith("summary #")
+    assert [m.content for m in state["messages"]] == ["hi", "ok", "bye", "ok"]
+
+    # The summary is folded into the system prompt of the next model call.
+    prompt = next(p for p in reversed(llm.prompts) if p[-1].content == "bye")
+    assert isinstance(prompt[0], SystemMessage)
+    assert state["summary"] in prompt[0].content
+
+
+@pytest.mark.asyncio
+async def test_turns_do_not_wait_for_the_summary(personality, build_app):
+    llm = SlowSummaryLLM()
+    app = build_app(llm, personality)
+    config = {"configurable": {"thread_id": "slow-summary"}}
+
+    async def say(text):
+        # Would time out if the turn waited for the held summary request
+        await asyncio.wait_for(
+            app.ainvoke({"messages": [HumanMessage(content=text)]}, config), 1
+        )
+        return app.get_state(config).values
+
+    with patch.object(Config, "HISTORY_MAX_TURNS", 1):
+        with patch.object(Config, "HISTORY_SUMMARIZE", True):
+            await say("I'm Ana")
+            await say("hi")
+            # Until the summary is ready, nothing is dropped from the prompt
+            state = await say("still there?")
+            assert "summary" not in state
+            assert len(state["messages"]) == 6
+            assert llm.prompts[-1][1].content == "I'm Ana"
+
+            llm.release.set()
+            await settle()
+            state = await say("yes")
+
+    assert state["summary"].startswith("summary #")
+    assert [m.content for m in state["messages"]][0] == "hi"
+
+
+@pytest.mark.asyncio
+async def test_failed_summary_is_retried(personality, build_app):
+    llm = SlowSummaryLLM(failures=1)
+    llm.release.set()
+    app = build_app(llm, personality)
+    config = {"configurable": {"thread_id": "failed-summary"}}
+
+    with patch.object(Config, "HISTORY_MAX_TURNS", 1):
+        with patch.object(Config, "HISTORY_SUMMARIZE", True):
+            for text in ["one", "two", "three"]:
+                await app.ainvoke({"messages": [HumanMessage(content=text)]}, config)
+                await settle()
+            # The failure kept every turn; "three" asked again
+            assert "summary" not in app.get_state(config).values
+            await app.ainvoke({"messages": [HumanMessage(content="four")]}, config)
+
+    state = app.get_state(config).values
+    assert state["summary"].startswith("summary #")
+    assert [m.content for m in state["messages"]] == ["three", "ok", "four", "ok"]
+
+
+@pytest.mark.asyncio
+async def test_pending_summaries_are_bounded(personality, build_app):
+    llm = SlowSummaryLLM()
+    app = build_app(llm, personality)
+
+    async def say(thread, text):
+        config = {"configurable": {"thread_id": thread}}
+        await app.ainvoke({"messages": [HumanMessage(content=text)]}, config)
+        return app.get_state(config).values
+
+    with (
+        patch.object(Config, "HISTORY_MAX_TURNS", 1),
+        patch.object(Config, "HISTORY_SUMMARIZE", True),
+        patch.object(Config, "CHECKPOINT_MAX_THREADS", 1),
+    ):
+        for thread in ("quiet", "busy"):
+            await say(thread, "one")
+            await say(thread, "two")
+        # The summary requested by "busy" evicted (and cancelled) the one of
+        # "quiet", so its next turn asks again
+        llm.release.set()
+        await settle()
+        assert "summary" not in await say("quiet", "three")
+        await settle()
+        state = await say("quiet", "four")
+
+    assert state["summary"].startswith("summary #")
+    assert [m.content for m in state["messages"]] == ["three", "ok", "four", "ok"]
+    summaries = [p for p in llm.prompts if p[-1].content.startswith("Update")]
+    assert len(summaries) == 3
+
+
+@pytest.mark.asyncio
+async def test_evicted_failed_summary_is_dropped(personality, build_app):
+    llm = SlowSummaryLLM(failures=1)
+    llm.release.set()
+    app = build_app(llm, personality)
+
+    with (
+        patch.object(Config, "HISTORY_MAX_TURNS", 1),
+        patch.object(Config, "HISTORY_SUMMARIZE", True),
+        patch.object(Config, "CHECKPOINT_MAX_THREADS", 1),
+    ):
+        for thread in ("failed", "next"):
+            config = {"configurable": {"thread_id": thread}}
+            for text in ["one", "two"]:
+                await app.ainvoke({"messages": [HumanMessage(content=text)]}, config)
+                await settle()
+
+    # The failure of "failed" was dropped with it, never applied anywhere
+    assert "summary" not in app.get_state(config).values
+
+
+@pytest.mark.asyncio
+async def test_background_summary_is_detached_from_the_turn(personality, build_app):
+    configs = []
+
+    class ConfigRecordingLLM(RecordingLLM):
+        async def ainvoke(self, messages, config=None):
+            if messages[-1].content.startswith("Update the running summary"):
+                configs.append(config)
+            return self._respond(messages)
+
+    app = build_app(ConfigRecordingLLM(), personality)
+    config = {"configurable": {"thread_id": "detached"}}
+
+    with patch.object(Config, "HISTORY_MAX_TURNS", 1):
+        with patch.object(Config, "HISTORY_SUMMARIZE", True):
+            for text in ["one", "two"]:
+                await app.ainvoke({"messages": [HumanMessage(content=text)]}, config)
+            await settle()
+
+    # No callbacks: neither the turn's tracing nor its token stream see it
+    assert configs == [{"callbacks": []}]
+
+
+def test_rolling_summary_sync(personality, build_app):
+    llm = RecordingLLM()
+    app = build_app(llm, personality)
+    config = {"configurable": {"thread_id": "summary-sync"}}
+
+    with patch.object(Config, "HISTORY_MAX_TURNS", 1):
+        with patch.object(Config, "HISTORY_SUMMARIZE", True):
+            app.invoke({"messages": [HumanMessage(content="one")]}, config)
+            app.invoke({"messages": [HumanMessage(content="two")]}, config)
+
+    assert app.get_state(config).values["summary"] == "summary #2"
+
+
+@pytest.mark.asyncio
+async def test_async_trim_without_summary(personality, build_app):
+    llm = RecordingLLM()
+    app = build_app(llm, personality)
+    config = {"configurable": {"thread_id": "trim"}}
+
+    with patch.object(Config, "HISTORY_MAX_TURNS", 1):
+        await app.ainvoke({"messages": [HumanMessage(content="one")]}, config)
+        await app.ainvoke({"messages": [HumanMessage(content="two")]}, config)
+
+    state = app.get_state(config).values
+    assert state["summary"] == ""
+    assert [m.content for m in state["messages"]] == ["two", "ok"]
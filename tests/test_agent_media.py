@@ -0,0 +1,64 @@
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.agent import collect_media, create_agent, merge_media
+from src.config import Config, Personality
+
+# --- Tests for the per-turn media channel in src/agent.py ---
+
+
+class ScriptedLLM(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def photo(artifact_id):
+    return {"kind": "photo", "artifact_id": artifact_id}
+
+
+def test_merge_media_appends_and_resets():
+    assert merge_media([photo("a")], [photo("b")]) == [photo("a"), photo("b")]
+    assert merge_media([photo("a")], None) == []
+
+
+def test_collect_media_only_reads_trailing_tool_results():
+    messages = [
+        HumanMessage(content="old"),
+        ToolMessage(content="x", tool_call_id="0", artifact=photo("old")),
+        AIMessage(content="", tool_calls=[]),
+        ToolMessage(content="x", tool_call_id="1", artifact=photo("a")),
+        ToolMessage(content="error", tool_call_id="2"),
+        ToolMessage(content="x", tool_call_id="3", artifact=photo("b")),
+    ]
+    assert collect_media(messages) == [photo("a"), photo("b")]
+    assert collect_media([HumanMessage(content="hi")]) == []
+
+
+@pytest.mark.asyncio
+async def test_graph_exposes_only_current_turn_media():
+    selfie_call = AIMessage(
+        content="",
+        tool_calls=[{"name": "SelfieTool", "args": {"description": "x"}, "id": "c1"}],
+    )
+    llm = ScriptedLLM(
+        messages=iter([selfie_call, AIMessage(content="cute?"), AIMessage("bye")])
+    )
+    personality = Personality(name="Media", byline="", identity=[], behavior=[])
+    with patch.object(Config, "LLM_PROVIDER", "google"):
+        with patch("src.agent.ChatGoogleGenerativeAI", return_value=llm):
+            app = create_agent(personality)
+
+    async def fake_selfie(self, description):
+        return "sent", photo("selfie-1")
+
+    config = {"configurable": {"thread_id": "media"}}
+    with patch("src.tools.SelfieTool._arun", fake_selfie):
+        first = await app.ainvoke({"messages": [HumanMessage("pic?")]}, config)
+        second = await app.ainvoke({"messages": [HumanMessage("ok")]}, config)
+
+    assert first["media"] == [photo("selfie-1")]
+    assert first["messages"][-2].content == "sent"
+    assert second["media"] == []
@@ -40,6 +40,7 @@ class TestAgentOllama(unittest.TestCase):
             model="llama3-test",
             base_url=Config.OLLAMA_BASE_URL,
             temperature=0.8,
+            client_kwargs={"timeout": Config.LLM_TIMEOUT_SECONDS},
         )
 
         # Verify tools are bound
@@ -68,7 +69,7 @@ class TestAgentOllama(unittest.TestCase):
             api_key="fake_key",
             temperature=0.8,
             max_tokens=None,
-            timeout=None,
+            timeout=Config.LLM_TIMEOUT_SECONDS,
             max_retries=2,
         )
 
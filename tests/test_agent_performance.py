@@ -0,0 +1,92 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from telegram import Update
+
+from src.agent import create_agent
+from src.config import Config, Personality
+from src.main import chat_queue, handle_message
+
+LLM_LATENCY = 0.5
+CONCURRENT_CHATS = 20
+
+
+class StubLLM:
+    """Fake chat model that answers after a fixed delay without blocking."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+
+    def bind_tools(self, tools):
+        return self
+
+    def invoke(self, messages, config=None):
+        raise AssertionError("sync invoke must not be used on the async path")
+
+    async def ainvoke(self, messages, config=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return AIMessage(content="hey")
+
+
+def make_update(chat_id: int) -> MagicMock:
+    update = MagicMock(spec=Update)
+    update.effective_chat.id = chat_id
+    update.message.text = "hi"
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+def make_context() -> MagicMock:
+    context = MagicMock()
+    context.user_data = {}
+    context.bot.send_chat_action = AsyncMock()
+    return context
+
+
+@pytest.mark.asyncio
+async def test_async_chatbot_node_uses_ainvoke():
+    stub = StubLLM(latency=0)
+    personality = Personality(name="Perf", byline="", identity=[], behavior=[])
+    with patch.object(Config, "LLM_PROVIDER", "google"):
+        with patch("src.agent.ChatGoogleGenerativeAI", return_value=stub):
+            app = create_agent(personality)
+
+    result = await app.ainvoke(
+        {"messages": [HumanMessage(content="hi")]},
+        config={"configurable": {"thread_id": "perf"}},
+    )
+    assert result["messages"][-1].content == "hey"
+    assert stub.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_handle_message_overlaps_llm_latency():
+    stub = StubLLM(latency=LLM_LATENCY)
+    personality = Personality(name="Perf", byline="", identity=[], behavior=[])
+    with patch.object(Config, "LLM_PROVIDER", "google"):
+        with patch("src.agent.ChatGoogleGenerativeAI", return_value=stub):
+            app = create_agent(personality)
+
+    updates = [make_update(chat_id) for chat_id in range(CONCURRENT_CHATS)]
+    with (
+        patch("src.main.get_agent_for_user", return_value=app),
+        patch.object(chat_queue, "debounce", 0),
+    ):
+        start = time.perf_counter()
+        await asyncio.gather(*(handle_message(u, make_context()) for u in updates))
+        elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{CONCURRENT_CHATS} chats finished in {elapsed:.3f}s "
+        f"(LLM latency {LLM_LATENCY}s)"
+    )
+    assert stub.calls == CONCURRENT_CHATS
+    for update in updates:
+        update.message.reply_text.assert_called_with("hey")
+    # Serialized execution would take CONCURRENT_CHATS * LLM_LATENCY seconds.
+    assert elapsed < 3 * LLM_LATENCY
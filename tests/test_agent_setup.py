@@ -38,7 +38,7 @@ class TestAgentSetup(unittest.TestCase):
             api_key="fake_key",
             temperature=0.8,
             max_tokens=None,
-            timeout=None,
+            timeout=Config.LLM_TIMEOUT_SECONDS,
             max_retries=2,
         )
 
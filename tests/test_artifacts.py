@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.artifacts import ArtifactStore, get_artifact_store
+from src.config import Config
+
+# --- Tests for src/artifacts.py ---
+
+
+def test_small_payloads_stay_in_memory():
+    store = ArtifactStore(spill_bytes=16, ttl=60)
+    artifact_id = store.put("image", "selfie.png", b"tiny")
+    artifact = store.get(artifact_id)
+    assert not artifact.buffer._rolled
+    with store.open(artifact_id) as f:
+        assert f.read() == b"tiny"
+    # Every open starts from the beginning.
+    with store.open(artifact_id) as f:
+        assert f.read() == b"tiny"
+
+
+def test_large_payloads_spill_to_disk():
+    store = ArtifactStore(spill_bytes=16, ttl=60)
+    artifact_id = store.put("image", "selfie.png", b"x" * 64)
+    assert store.get(artifact_id).buffer._rolled
+    with store.open(artifact_id) as f:
+        assert f.read() == b"x" * 64
+
+
+def test_files_are_copied_and_never_deleted(tmp_path):
+    clip = tmp_path / "clip.mp3"
+    clip.write_bytes(b"audio")
+    store = ArtifactStore(spill_bytes=16, ttl=60)
+    artifact_id = store.put_file("audio", str(clip))
+    assert store.get(artifact_id).filename == "clip.mp3"
+
+    store.release(artifact_id)
+    store.release(artifact_id)
+    assert clip.exists()
+    assert len(store) == 0
+
+
+def test_file_copies_outlive_the_file(tmp_path):
+    clip = tmp_path / "clip.mp3"
+    clip.write_bytes(b"audio")
+    store = ArtifactStore(spill_bytes=16, ttl=60)
+    artifact_id = store.put_file("audio", str(clip))
+    # e.g. the cache evicted the entry before the artifact was sent
+    clip.unlink()
+    with store.open(artifact_id) as f:
+        assert f.read() == b"audio"
+
+
+def test_release_closes_buffer():
+    store = ArtifactStore(spill_bytes=16, ttl=60)
+    artifact_id = store.put("audio", "voice.mp3", b"audio")
+    buffer = store.get(artifact_id).buffer
+    store.release(artifact_id)
+    assert buffer.closed
+    with pytest.raises(KeyError):
+        with store.open(artifact_id):
+            pass
+
+
+def test_unsent_artifacts_are_swept_on_write(clock):
+    store = ArtifactStore(spill_bytes=16, ttl=10, clock=clock)
+    old = store.put("image", "a.png", b"a")
+    clock.now = 5
+    recent = store.put("image", "b.png", b"b")
+    clock.now = 12
+    store.put("image", "c.png", b"c")
+
+    assert store.get(old) is None
+    assert store.get(recent) is not None
+    assert store.swept == 1
+    assert store.sweep() == 0
+
+
+def test_get_artifact_store_is_lazy_singleton():
+    with patch("src.artifacts._store", None):
+        with patch.object(Config, "ARTIFACT_SPILL_KB", 2):
+            store = get_artifact_store()
+            assert get_artifact_store() is store
+            assert store.spill_bytes == 2048
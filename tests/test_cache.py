@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from src.cache import DiskCache
+
+# --- Tests for src/cache.py ---
+
+
+def test_put_and_get(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100, suffix=".mp3")
+    key = cache.make_key("voice", "hello")
+    assert cache.get(key) is None
+
+    path = cache.put_bytes(key, b"abc")
+    assert path.endswith(f"{key}.mp3")
+    assert cache.get(key) == path
+    assert cache.stats() == {
+        "entries": 1,
+        "bytes": 3,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+    }
+
+
+def test_keys_are_content_addressed():
+    assert DiskCache.make_key("a", "b") == DiskCache.make_key("a", "b")
+    assert DiskCache.make_key("a", "b") != DiskCache.make_key("ab", "")
+
+
+def test_commit_is_atomic_rename(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    temp_path = cache.reserve()
+    assert os.path.basename(temp_path).startswith(".")
+    with open(temp_path, "wb") as f:
+        f.write(b"data")
+
+    path = cache.commit("k", temp_path)
+    assert not os.path.exists(temp_path)
+    assert open(path, "rb").read() == b"data"
+
+
+def test_lru_eviction_by_size(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    cache.put_bytes("a", b"1234")
+    cache.put_bytes("b", b"1234")
+    cache.get("a")  # "b" becomes least recently used
+    cache.put_bytes("c", b"1234")
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.evictions == 1
+    assert not (tmp_path / "b").exists()
+
+
+def test_oversized_entry_is_kept_until_next_write(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=2)
+    cache.put_bytes("a", b"1")
+    path = cache.put_bytes("big", b"123456")
+    assert cache.get("big") == path
+    assert cache.get("a") is None
+
+
+def test_overwrite_same_key_updates_size(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    cache.put_bytes("a", b"1234")
+    cache.put_bytes("a", b"12")
+    assert cache.stats()["bytes"] == 2
+
+
+def test_reload_from_disk_keeps_recency(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100, suffix=".mp3")
+    cache.put_bytes("old", b"12")
+    cache.put_bytes("new", b"12")
+    os.utime(cache.path_for("old"), (1, 1))
+    (tmp_path / ".partial.tmp.mp3").write_bytes(b"x")
+
+    reloaded = DiskCache(str(tmp_path), max_bytes=5, suffix=".mp3")
+    assert reloaded.stats()["entries"] == 2
+    reloaded.put_bytes("third", b"12")
+    assert reloaded.get("old") is None
+    assert reloaded.get("new") is not None
+
+
+def test_get_detects_deleted_file(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    path = cache.put_bytes("a", b"1")
+    os.remove(path)
+    assert cache.get("a") is None
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    with pytest.raises(TypeError):
+        cache.put_bytes("a", "not bytes")
+    assert list(tmp_path.iterdir()) == []
+    assert cache.get("a") is None
@@ -0,0 +1,278 @@
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import StateGraph
+
+from src.agent import AgentState
+from src.checkpoint import LRUCheckpointSaver, SQLiteSaver, create_checkpointer
+from src.config import Config
+
+# --- Tests for src/checkpoint.py ---
+
+
+def build_graph(checkpointer):
+    def reply(state: AgentState):
+        return {"messages": [AIMessage(content=f"echo {len(state['messages'])}")]}
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("reply", reply)
+    workflow.set_entry_point("reply")
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def cfg(thread_id: str, **extra):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", **extra}}
+
+
+def count_rows(saver: SQLiteSaver, table: str) -> int:
+    return saver.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_sqlite_file_uses_wal_and_survives_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteSaver(path)
+    mode = saver.conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+
+    build_graph(saver).invoke({"messages": [HumanMessage(content="hi")]}, cfg("1"))
+    saver.conn.close()
+
+    # A fresh process sees the conversation again.
+    state = build_graph(SQLiteSaver(path)).get_state(cfg("1")).values
+    assert [m.content for m in state["messages"]] == ["hi", "echo 1"]
+
+
+def test_sqlite_prunes_old_versions():
+    saver = SQLiteSaver(keep_versions=2)
+    graph = build_graph(saver)
+    for i in range(10):
+        graph.invoke({"messages": [HumanMessage(content=str(i))]}, cfg("1"))
+
+    assert count_rows(saver, "checkpoints") == 2
+    assert len(graph.get_state(cfg("1")).values["messages"]) == 20
+
+
+def test_sqlite_get_and_list_filters():
+    saver = SQLiteSaver(keep_versions=10)
+    graph = build_graph(saver)
+    graph.invoke({"messages": [HumanMessage(content="a")]}, cfg("1"))
+    graph.invoke({"messages": [HumanMessage(content="b")]}, cfg("2"))
+
+    history = list(saver.list(cfg("1")))
+    assert len(history) == 3
+    latest, oldest = history[0], history[-1]
+    assert latest.parent_config is not None
+    assert oldest.parent_config is None
+
+    by_id = saver.get_tuple(latest.config)
+    assert by_id.checkpoint["id"] == latest.checkpoint["id"]
+    assert saver.get_tuple(cfg("missing")) is None
+
+    assert len(list(saver.list(None))) == 6
+    assert len(list(saver.list(cfg("1"), limit=1))) == 1
+    assert len(list(saver.list(cfg("1"), before=latest.config))) == 2
+    assert len(list(saver.list(latest.config))) == 1
+    assert len(list(saver.list(cfg("1"), filter={"source": "input"}))) == 1
+    assert len(list(saver.list({"configurable": {"thread_id": "1"}}))) == 3
+
+
+def test_sqlite_put_writes_semantics():
+    saver = SQLiteSaver()
+    graph = build_graph(saver)
+    graph.invoke({"messages": [HumanMessage(content="a")]}, cfg("1"))
+    config = saver.get_tuple(cfg("1")).config
+
+    saver.put_writes(config, [("messages", "first")], "task")
+    saver.put_writes(config, [("messages", "second")], "task")
+    saver.put_writes(config, [("__error__", "boom")], "task")
+    saver.put_writes(config, [("__error__", "bang")], "task")
+
+    writes = saver.get_tuple(cfg("1")).pending_writes
+    assert ("task", "messages", "first") in writes
+    assert ("task", "messages", "second") not in writes
+    assert ("task", "__error__", "bang") in writes
+    assert ("task", "__error__", "boom") not in writes
+
+    saver.delete_thread("1")
+    assert saver.get_tuple(cfg("1")) is None
+    assert count_rows(saver, "writes") == 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_async_api():
+    saver = SQLiteSaver()
+    graph = build_graph(saver)
+    await graph.ainvoke({"messages": [HumanMessage(content="a")]}, cfg("1"))
+
+    item = await saver.aget_tuple(cfg("1"))
+    assert item.checkpoint["channel_values"]["messages"][-1].content == "echo 1"
+    await saver.aput_writes(item.config, [("messages", "w")], "task")
+    assert [i async for i in saver.alist(cfg("1"), limit=2)][0].pending_writes
+
+    await saver.adelete_thread("1")
+    assert await saver.aget_tuple(cfg("1")) is None
+
+
+def test_lru_serves_hot_threads_from_memory():
+    backend = SQLiteSaver()
+    saver = LRUCheckpointSaver(backend, max_threads=10)
+    graph = build_graph(saver)
+
+    graph.invoke({"messages": [HumanMessage(content="a")]}, cfg("1"))
+    graph.invoke({"messages": [HumanMessage(content="b")]}, cfg("1"))
+    assert saver.hits >= 1
+
+    state = graph.get_state(cfg("1")).values
+    assert [m.content for m in state["messages"]] == ["a", "echo 1", "b", "echo 3"]
+
+    # Explicit checkpoint ids and history listing go to the backend.
+    history = list(saver.list(cfg("1")))
+    assert (
+        saver.get_tuple(history[-1].config).checkpoint["id"]
+        == (history[-1].checkpoint["id"])
+    )
+
+
+def test_lru_cache_miss_loads_from_backend():
+    backend = SQLiteSaver()
+    build_graph(backend).invoke({"messages": [HumanMessage(content="a")]}, cfg("1"))
+
+    saver = LRUCheckpointSaver(backend, max_threads=10)
+    assert saver.get_tuple(cfg("1")) is not None
+    assert saver.misses == 1
+    assert saver.get_tuple(cfg("1")) is not None
+    assert saver.hits == 1
+    assert saver.get_tuple(cfg("missing")) is None
+
+
+def test_lru_eviction_keeps_persistent_backend():
+    backend = SQLiteSaver()
+    saver = LRUCheckpointSaver(backend, max_threads=2)
+    graph = build_graph(saver)
+    for thread in ("1", "2", "3"):
+        graph.invoke({"messages": [HumanMessage(content=thread)]}, cfg(thread))
+
+    assert list(saver.cache) == [("2", ""), ("3", "")]
+    # Evicted thread is reloaded from the persistent backend.
+    assert graph.get_state(cfg("1")).values["messages"][0].content == "1"
+
+
+def test_sqlite_thread_cap_forgets_least_recently_active(tmp_path):
+    path = str(tmp_path / "capped.sqlite")
+    saver = SQLiteSaver(path, max_threads=2)
+    graph = build_graph(saver)
+    for thread in ("1", "2", "1", "3"):
+        graph.invoke({"messages": [HumanMessage(content=thread)]}, cfg(thread))
+
+    # "2" was written least recently when "3" went over the cap
+    assert graph.get_state(cfg("2")).values == {}
+    assert len(graph.get_state(cfg("1")).values["messages"]) == 4
+    assert saver.threads == 2
+    writes = saver.conn.execute(
+        "SELECT COUNT(*) FROM writes WHERE thread_id = '2'"
+    ).fetchone()[0]
+    assert writes == 0
+
+    saver.delete_thread("1")
+    saver.delete_thread("missing")
+    assert saver.threads == 1
+    saver.conn.close()
+
+    # A restart counts the threads already stored
+    assert SQLiteSaver(path, max_threads=2).threads == 1
+    assert SQLiteSaver(path).threads == 0
+
+
+def test_lru_memory_only_mode_bounds_resident_threads():
+    backend = SQLiteSaver(max_threads=5)
+    saver = LRUCheckpointSaver(backend, max_threads=3)
+    graph = build_graph(saver)
+    for thread in range(50):
+        graph.invoke({"messages": [HumanMessage(content="hi")]}, cfg(str(thread)))
+
+    threads = backend.conn.execute(
+        "SELECT COUNT(DISTINCT thread_id) FROM checkpoints"
+    ).fetchone()[0]
+    assert threads == 5
+    assert len(saver.cache) == 3
+
+
+def test_lru_eviction_on_read_and_delete():
+    backend = SQLiteSaver()
+    for thread in ("1", "2"):
+        build_graph(backend).invoke(
+            {"messages": [HumanMessage(content=thread)]}, cfg(thread)
+        )
+    saver = LRUCheckpointSaver(backend, max_threads=1)
+    saver.get_tuple(cfg("1"))
+    saver.get_tuple(cfg("2"))
+    assert list(saver.cache) == [("2", "")]
+    assert backend.get_tuple(cfg("1")) is not None
+
+    saver.put_writes(saver.get_tuple(cfg("2")).config, [("messages", "w")], "t")
+    assert list(saver.cache) == []
+    saver.get_tuple(cfg("2"))
+    saver.delete_thread("2")
+    assert list(saver.cache) == []
+    assert backend.get_tuple(cfg("2")) is None
+
+
+@pytest.mark.asyncio
+async def test_lru_async_api():
+    backend = SQLiteSaver()
+    for thread in ("1", "2"):
+        await build_graph(backend).ainvoke(
+            {"messages": [HumanMessage(content=thread)]}, cfg(thread)
+        )
+    saver = LRUCheckpointSaver(backend, max_threads=1)
+    assert await saver.aget_tuple(cfg("1")) is not None
+    assert await saver.aget_tuple(cfg("1")) is not None
+    assert await saver.aget_tuple(cfg("2")) is not None
+    assert list(saver.cache) == [("2", "")]
+    assert await saver.aget_tuple(cfg("missing")) is None
+
+    graph = build_graph(saver)
+    await graph.ainvoke({"messages": [HumanMessage(content="x")]}, cfg("3"))
+    assert list(saver.cache) == [("3", "")]
+    assert await backend.aget_tuple(cfg("2")) is not None
+    assert len([i async for i in saver.alist(cfg("3"))]) == 3
+
+    await saver.adelete_thread("3")
+    assert await saver.aget_tuple(cfg("3")) is None
+
+
+def test_create_checkpointer_memory_only():
+    with patch.object(Config, "CHECKPOINT_DB", ""):
+        with patch.object(Config, "CHECKPOINT_MAX_THREADS", 7):
+            saver = create_checkpointer()
+            with patch.object(Config, "CHECKPOINT_MEMORY_MAX_THREADS", 3):
+                small = create_checkpointer()
+            with patch.object(Config, "CHECKPOINT_MEMORY_MAX_THREADS", 0):
+                unbounded = create_checkpointer()
+    assert saver.max_threads == 7
+    assert saver.backend.max_threads == Config.CHECKPOINT_MEMORY_MAX_THREADS
+    # Never below the LRU tier, which would serve chats already forgotten
+    assert small.backend.max_threads == 7
+    assert unbounded.backend.max_threads == 0
+
+
+def test_evicted_chat_keeps_its_history_by_default():
+    with (
+        patch.object(Config, "CHECKPOINT_DB", ""),
+        patch.object(Config, "CHECKPOINT_MAX_THREADS", 1),
+    ):
+        graph = build_graph(create_checkpointer())
+    graph.invoke({"messages": [HumanMessage(content="I'm Ana")]}, cfg("ana"))
+    graph.invoke({"messages": [HumanMessage(content="hi")]}, cfg("bruno"))
+
+    # Ana's chat was evicted from the LRU tier but not forgotten
+    messages = graph.get_state(cfg("ana")).values["messages"]
+    assert [m.content for m in messages] == ["I'm Ana", "echo 1"]
+
+
+def test_create_checkpointer_with_database(tmp_path):
+    with patch.object(Config, "CHECKPOINT_DB", str(tmp_path / "db.sqlite")):
+        saver = create_checkpointer()
+    assert saver.backend.max_threads == 0
+    assert isinstance(saver.backend, SQLiteSaver)
@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage
+from telegram import Update
+
+from src.coalescer import MessageCoalescer
+from src.main import chat_queue, handle_message
+
+# --- Tests for src/coalescer.py ---
+
+
+@pytest.mark.asyncio
+async def test_burst_is_merged_into_one_batch():
+    batches = []
+
+    async def handler(items):
+        batches.append(items)
+
+    queue = MessageCoalescer(handler, debounce=0.05)
+    await asyncio.gather(*(queue.submit("chat", i) for i in range(5)))
+
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert queue.items == 5
+    assert queue.batches == 1
+    assert queue.queue_depth() == 0
+
+
+@pytest.mark.asyncio
+async def test_batches_for_one_key_never_overlap():
+    running = 0
+    overlaps = 0
+    batches = []
+
+    async def handler(items):
+        nonlocal running, overlaps
+        running += 1
+        overlaps += running > 1
+        batches.append(items)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    queue = MessageCoalescer(handler, debounce=0)
+    first = asyncio.create_task(queue.submit("chat", "a"))
+    await asyncio.sleep(0.01)  # "a" is being handled now
+    assert queue.queue_depth() == 0
+    await asyncio.gather(first, queue.submit("chat", "b"), queue.submit("chat", "c"))
+
+    assert overlaps == 0
+    assert batches == [["a"], ["b", "c"]]
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_concurrently():
+    async def handler(items):
+        await asyncio.sleep(0.1)
+
+    queue = MessageCoalescer(handler, debounce=0)
+    start = asyncio.get_running_loop().time()
+    await asyncio.gather(*(queue.submit(chat, "hi") for chat in range(10)))
+    elapsed = asyncio.get_running_loop().time() - start
+
+    assert queue.batches == 10
+    assert elapsed < 0.5
+
+
+@pytest.mark.asyncio
+async def test_handler_errors_reach_submitters():
+    async def handler(items):
+        raise RuntimeError("boom")
+
+    queue = MessageCoalescer(handler, debounce=0)
+    with pytest.raises(RuntimeError, match="boom"):
+        await queue.submit("chat", 1)
+    # The worker is gone, so the next submission starts a fresh one.
+    with pytest.raises(RuntimeError, match="boom"):
+        await queue.submit("chat", 2)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_worker_releases_every_submitter():
+    started = asyncio.Event()
+
+    async def handler(items):
+        started.set()
+        await asyncio.Event().wait()
+
+    queue = MessageCoalescer(handler, debounce=0)
+    handled = asyncio.create_task(queue.submit("chat", "a"))
+    await started.wait()
+    waiting = asyncio.create_task(queue.submit("chat", "b"))  # the next batch
+    await asyncio.sleep(0)
+
+    queue._workers["chat"].cancel()  # e.g. shutdown, mid-batch
+    for submitter in (handled, waiting):
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(submitter, 1)
+    assert queue.queue_depth() == 0 and not queue._workers
+
+
+@pytest.mark.asyncio
+async def test_handle_message_coalesces_telegram_burst():
+    agent = AsyncMock()
+    agent.ainvoke.return_value = {"messages": [AIMessage(content="all answered")]}
+    context = MagicMock()
+    context.user_data = {}
+    context.bot.send_chat_action = AsyncMock()
+
+    updates = []
+    for text in ("hey", "you there?", "miss you"):
+        update = MagicMock(spec=Update)
+        update.effective_chat.id = 99
+        update.message.text = text
+        update.message.reply_text = AsyncMock()
+        updates.append(update)
+
+    with patch("src.main.get_agent_for_user", return_value=agent):
+        with patch.object(chat_queue, "debounce", 0.05):
+            await asyncio.gather(*(handle_message(u, context) for u in updates))
+
+    agent.ainvoke.assert_awaited_once()
+    (state,), _ = agent.ainvoke.await_args
+    assert state["messages"][0].content == "hey\nyou there?\nmiss you"
+    updates[-1].message.reply_text.assert_awaited_once_with("all answered")
+    updates[0].message.reply_text.assert_not_called()
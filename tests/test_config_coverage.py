@@ -1,9 +1,9 @@
-import json
 from unittest.mock import patch
 
 import pytest
 
 from src.config import Config, Personality
+from src.registry import PersonalityRegistry
 
 # --- Tests for src/config.py ---
 
@@ -19,42 +19,6 @@ def test_personality_model():
     assert p.profile_image is None
 
 
-def test_config_load_personalities_no_dir():
-    with patch("pathlib.Path.exists", return_value=False):
-        personalities = Config.load_personalities("dummy_path")
-        assert personalities == {}
-
-
-def test_config_load_personalities_valid(tmp_path):
-    p_dir = tmp_path / "personalities"
-    p_dir.mkdir()
-    p_file = p_dir / "test.json"
-    data = {
-        "name": "Sacha",
-        "byline": "AI",
-        "identity": ["I am AI"],
-        "behavior": ["Helpful"],
-    }
-    p_file.write_text(json.dumps(data), encoding="utf-8")
-
-    personalities = Config.load_personalities(str(p_dir))
-    assert "sacha" in personalities
-    assert personalities["sacha"].name == "Sacha"
-
-
-def test_config_load_personalities_invalid_json(tmp_path, capsys):
-    p_dir = tmp_path / "personalities"
-    p_dir.mkdir()
-    p_file = p_dir / "bad.json"
-    p_file.write_text("{invalid_json", encoding="utf-8")
-
-    personalities = Config.load_personalities(str(p_dir))
-    assert personalities == {}
-    # Check stdout/stderr for error message if needed, but the function prints.
-    captured = capsys.readouterr()
-    assert "Error loading personality" in captured.out
-
-
 def test_config_validate_success():
     with patch.object(Config, "GOOGLE_API_KEY", "dummy_key"):
         with patch.object(Config, "LLM_PROVIDER", "google"):
@@ -70,6 +34,18 @@ def test_config_validate_fail_google():
                 Config.validate()
 
 
+def test_config_validate_voice_format():
+    with (
+        patch.object(Config, "GOOGLE_API_KEY", "dummy_key"),
+        patch.object(Config, "VOICE_FORMAT", "opus3"),
+    ):
+        with pytest.raises(ValueError, match="VOICE_FORMAT must be 'mp3' or 'ogg'"):
+            Config.validate()
+        for voice_format in ("mp3", "ogg"):
+            with patch.object(Config, "VOICE_FORMAT", voice_format):
+                Config.validate()
+
+
 def test_config_2026_defaults():
     """Ensure the configuration defaults to 2026 settings."""
     assert Config.CURRENT_YEAR == 2026
@@ -78,3 +54,8 @@ def test_config_2026_defaults():
     # We can check if they are set to the expected values.
     assert Config.GOOGLE_MODEL == "gemini-3.0-pro"
     assert Config.LLM_PROVIDER == "google"
+
+
+def test_default_personalities_dir_ignores_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert "sacha" in PersonalityRegistry(Config.PERSONALITIES_DIR)
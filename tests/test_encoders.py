@@ -0,0 +1,83 @@
+import io
+from unittest.mock import patch
+
+from PIL import Image, ImageCms
+
+from benchmarks.stubs import photo_png
+from src.config import Config
+from src.encoders import MIN_QUALITY, ImageOptions, get_encoder, process_image
+
+# --- Tests for src/encoders.py ---
+
+
+def opened(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def tagged_jpeg(side):
+    exif = Image.Exif()
+    exif[0x010F] = "Imagen"  # Make
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    output = io.BytesIO()
+    Image.open(io.BytesIO(photo_png(side))).save(
+        output, "JPEG", exif=exif, icc_profile=icc
+    )
+    return output.getvalue()
+
+
+def test_get_encoder_is_lazy_singleton():
+    with (
+        patch("src.encoders._encoder", None),
+        patch.object(Config, "MEDIA_WORKERS", 3),
+    ):
+        encoder = get_encoder()
+        assert get_encoder() is encoder
+        assert encoder._max_workers == 3
+        encoder.shutdown()
+
+
+def test_options_suffix_and_key():
+    assert ImageOptions().suffix == ".jpg"
+    assert ImageOptions(format="webp").suffix == ".webp"
+    assert ImageOptions().key() != ImageOptions(quality=70).key()
+
+
+def test_downscales_and_reencodes():
+    png = photo_png(512)
+    jpeg = process_image(png, ImageOptions(max_side=256))
+    webp = process_image(png, ImageOptions(max_side=256, format="webp"))
+    assert opened(jpeg).format == "JPEG"
+    assert opened(webp).format == "WEBP"
+    assert opened(jpeg).size == opened(webp).size == (256, 256)
+    assert len(jpeg) < len(png) / 5
+    # Already small enough: only re-encoded
+    assert opened(process_image(png, ImageOptions())).size == (512, 512)
+    assert process_image(b"not an image", ImageOptions()) is None
+
+
+def test_size_target_keeps_the_best_quality_that_fits():
+    png = photo_png(512)
+    full = process_image(png, ImageOptions())
+    target = len(full) // 2
+    fitted = process_image(png, ImageOptions(max_bytes=target))
+    assert len(fitted) <= target
+    # Bisection lands on the highest fitting quality, not the lowest one
+    floor = process_image(png, ImageOptions(quality=MIN_QUALITY))
+    assert len(fitted) > len(floor)
+    # Targets that are already met, or cannot be met, cost no extra quality
+    assert process_image(png, ImageOptions(max_bytes=len(full))) == full
+    assert process_image(png, ImageOptions(max_bytes=100)) == floor
+
+
+def test_metadata_is_stripped_unless_asked_to_keep_it():
+    source = tagged_jpeg(128)
+    stripped = opened(process_image(source, ImageOptions()))
+    assert "exif" not in stripped.info and "icc_profile" not in stripped.info
+
+    for image_format in ("jpeg", "webp"):
+        options = ImageOptions(format=image_format, strip_metadata=False)
+        kept = opened(process_image(source, options))
+        assert kept.getexif()[0x010F] == "Imagen"
+        assert kept.info["icc_profile"]
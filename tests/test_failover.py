@@ -0,0 +1,286 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agent import create_agent, provider_names
+from src.config import Config, Personality
+from src.failover import (
+    MIN_LATENCY_SAMPLES,
+    UNSTREAMED,
+    CircuitBreaker,
+    Failover,
+    Provider,
+    ProvidersUnavailable,
+)
+from src.telemetry import metrics
+
+# --- Tests for src/failover.py and the agent's use of it ---
+
+
+def provider(name, threshold=2):
+    breaker = CircuitBreaker(threshold, 30)
+    return Provider(name, MagicMock(), MagicMock(), breaker)
+
+
+class FakeCalls:
+    """Answers per provider: a reply, an exception, or an Event to wait for."""
+
+    def __init__(self, **behaviour) -> None:
+        self.behaviour = behaviour
+        self.calls = []
+        self.cancelled = []
+
+    def __call__(self, provider, config):
+        self.calls.append((provider.name, config))
+        outcome = self.behaviour[provider.name]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def acall(self, provider, config):
+        self.calls.append((provider.name, config))
+        outcome = self.behaviour[provider.name]
+        try:
+            if isinstance(outcome, asyncio.Event):
+                await outcome.wait()
+                return f"{provider.name} late"
+            if isinstance(outcome, float):
+                await asyncio.sleep(outcome)
+                return f"{provider.name} after {outcome}"
+        except asyncio.CancelledError:
+            self.cancelled.append(provider.name)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def personality():
+    return Personality(name="Fallback", byline="", identity=[], behavior=[])
+
+
+def test_breaker_opens_after_consecutive_failures_and_retries_once(clock):
+    breaker = CircuitBreaker(2, 30, clock)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now = 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+    breaker.failure()
+    assert breaker.state == "open"  # a failed trial reopens at once
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_p95_needs_enough_samples():
+    p = provider("google")
+    p.latencies.extend([1.0] * (MIN_LATENCY_SAMPLES - 1))
+    assert p.p95() is None
+    p.latencies.extend([1.0] * 18 + [5.0, 9.0])
+    assert p.p95() == 5.0
+
+
+def test_invoke_falls_back_and_skips_open_circuits():
+    google, ollama = provider("google"), provider("ollama")
+    failover = Failover([google, ollama], timeout=1)
+    calls = FakeCalls(google=ConnectionError("down"), ollama="from ollama")
+    before = metrics.get("llm_failures_total").value(provider="google", reason="error")
+
+    assert failover.invoke(calls) == "from ollama"
+    assert failover.invoke(calls) == "from ollama"
+    assert calls.calls == [("google", None), ("ollama", None)] * 2
+    after = metrics.get("llm_failures_total").value(provider="google", reason="error")
+    assert after - before == 2
+
+    # Two failures in a row: Google is no longer called.
+    assert failover.invoke(calls) == "from ollama"
+    assert calls.calls[-1] == ("ollama", None)
+    assert len(calls.calls) == 5
+    assert 'llm_circuit_open{provider="google"} 1' in metrics.render()
+    assert len(ollama.latencies) == 3
+
+
+def test_invoke_raises_when_no_provider_answers():
+    failover = Failover([provider("google")], timeout=None)
+    with pytest.raises(ProvidersUnavailable) as raised:
+        failover.invoke(FakeCalls(google=ValueError("bad")))
+    assert isinstance(raised.value.__cause__, ValueError)
+
+    failover.providers[0].breaker.failure()
+    with pytest.raises(ProvidersUnavailable) as raised:
+        failover.invoke(FakeCalls(google="unused"))
+    assert raised.value.__cause__ is None
+
+
+@pytest.mark.asyncio
+async def test_ainvoke_abandons_requests_past_the_deadline():
+    failover = Failover([provider("google"), provider("ollama")], timeout=0.01)
+    calls = FakeCalls(google=asyncio.Event(), ollama="from ollama")
+    before = metrics.get("llm_failures_total").value(
+        provider="google", reason="timeout"
+    )
+
+    assert await failover.ainvoke(calls.acall) == "from ollama"
+    after = metrics.get("llm_failures_total").value(provider="google", reason="timeout")
+    assert after - before == 1
+    assert failover.providers[0].breaker.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_ainvoke_raises_when_every_provider_fails():
+    failover = Failover([provider("google"), provider("ollama")], timeout=None)
+    calls = FakeCalls(google=ValueError("a"), ollama=ValueError("b"))
+    with pytest.raises(ProvidersUnavailable) as raised:
+        await failover.ainvoke(calls.acall)
+    assert str(raised.value.__cause__) == "b"
+
+    # Both circuits are now open: nothing is called.
+    for p in failover.providers:
+        p.breaker.failure()
+    with pytest.raises(ProvidersUnavailable):
+        await failover.ainvoke(calls.acall)
+    assert len(calls.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_hedged_backup_wins_when_the_primary_is_slow():
+    google, ollama = provider("google"), provider("ollama")
+    google.latencies.extend([0.01] * MIN_LATENCY_SAMPLES)
+    failover = Failover([google, ollama], timeout=None, hedge=True, hedge_delay=60)
+    calls = FakeCalls(google=asyncio.Event(), ollama="from ollama")
+    won = metrics.get("llm_hedges_won_total").value(provider="ollama")
+
+    # The p95 (10 ms), not the configured delay, decides when to hedge.
+    assert await failover.ainvoke(calls.acall) == "from ollama"
+    assert calls.calls == [("google", None), ("ollama", UNSTREAMED)]
+    assert calls.cancelled == ["google"]
+    assert metrics.get("llm_hedges_won_total").value(provider="ollama") == won + 1
+    # The loser's latency is kept as a lower bound; its breaker is untouched.
+    assert len(google.latencies) == MIN_LATENCY_SAMPLES + 1
+    assert google.breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_hedged_primary_can_still_win():
+    failover = Failover(
+        [provider("google"), provider("ollama")],
+        timeout=None,
+        hedge=True,
+        hedge_delay=0.01,
+    )
+    calls = FakeCalls(google=0.05, ollama=asyncio.Event())
+    hedges = metrics.get("llm_hedges_total").value(provider="ollama")
+
+    assert await failover.ainvoke(calls.acall) == "google after 0.05"
+    assert calls.cancelled == ["ollama"]
+    assert metrics.get("llm_hedges_total").value(provider="ollama") == hedges + 1
+
+
+@pytest.mark.asyncio
+async def test_hedged_race_waits_for_the_other_after_a_failure():
+    failover = Failover(
+        [provider("google"), provider("ollama")],
+        timeout=None,
+        hedge=True,
+        hedge_delay=0.01,
+    )
+    late = asyncio.Event()
+    calls = FakeCalls(google=late, ollama=ValueError("backup down"))
+    asyncio.get_running_loop().call_later(0.05, late.set)
+    assert await failover.ainvoke(calls.acall) == "google late"
+
+    calls = FakeCalls(google=asyncio.Event(), ollama=ValueError("backup down"))
+    failover.timeout = 0.05
+    with pytest.raises(ProvidersUnavailable) as raised:
+        await failover.ainvoke(calls.acall)
+    assert isinstance(raised.value.__cause__, TimeoutError)
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_a_reason_to():
+    google, ollama = provider("google"), provider("ollama")
+    failover = Failover([google, ollama], timeout=None, hedge=True, hedge_delay=0.01)
+
+    # Answered in time: no backup request.
+    calls = FakeCalls(google="fast", ollama="unused")
+    assert await failover.ainvoke(calls.acall) == "fast"
+    # Failed in time: plain fallback, streamed as usual.
+    calls = FakeCalls(google=ValueError("x"), ollama="from ollama")
+    assert await failover.ainvoke(calls.acall) == "from ollama"
+    assert calls.calls == [("google", None), ("ollama", None)]
+    # The backup's circuit is open: the primary is simply awaited.
+    ollama.breaker.failure()
+    ollama.breaker.failure()
+    calls = FakeCalls(google=0.03, ollama="unused")
+    assert await failover.ainvoke(calls.acall) == "google after 0.03"
+    # Callers may opt out of hedging.
+    calls = FakeCalls(google=0.03, ollama="unused")
+    assert await failover.ainvoke(calls.acall, hedge=False) == "google after 0.03"
+    assert calls.calls == [("google", None)]
+
+
+def test_provider_names():
+    with patch.object(Config, "LLM_PROVIDER", "ollama"):
+        with patch.object(Config, "LLM_FALLBACK_PROVIDER", "google"):
+            assert provider_names() == ["ollama", "google"]
+        with patch.object(Config, "LLM_FALLBACK_PROVIDER", "ollama"):
+            assert provider_names() == ["ollama"]
+    with patch.object(Config, "LLM_PROVIDER", "anything"):
+        with patch.object(Config, "LLM_FALLBACK_PROVIDER", "other"):
+            assert provider_names() == ["google"]
+
+
+def test_validate_requires_a_google_key_for_the_fallback():
+    with (
+        patch.object(Config, "LLM_PROVIDER", "ollama"),
+        patch.object(Config, "LLM_FALLBACK_PROVIDER", "google"),
+        patch.object(Config, "GOOGLE_API_KEY", None),
+    ):
+        with pytest.raises(ValueError, match="GOOGLE_API_KEY"):
+            Config.validate()
+
+
+def broken_gemini_and_ollama():
+    google = MagicMock()
+    google.bind_tools.return_value = google
+    google.invoke.side_effect = ConnectionError("gemini down")
+    google.ainvoke = AsyncMock(side_effect=ConnectionError("gemini down"))
+    ollama = MagicMock()
+    ollama.bind_tools.return_value = ollama
+    ollama.invoke.return_value = AIMessage(content="from ollama")
+    ollama.ainvoke = AsyncMock(return_value=AIMessage(content="from ollama"))
+    return google, ollama
+
+
+@pytest.mark.asyncio
+async def test_agent_falls_back_to_ollama(personality):
+    google, ollama = broken_gemini_and_ollama()
+    with (
+        patch.object(Config, "LLM_PROVIDER", "google"),
+        patch.object(Config, "LLM_FALLBACK_PROVIDER", "ollama"),
+        patch("src.agent.ChatGoogleGenerativeAI", return_value=google),
+        patch("src.agent.ChatOllama", return_value=ollama),
+    ):
+        app = create_agent(personality)
+
+    inputs = {"messages": [HumanMessage(content="hi")]}
+    result = app.invoke(inputs, {"configurable": {"thread_id": "sync"}})
+    assert result["messages"][-1].content == "from ollama"
+    result = await app.ainvoke(inputs, {"configurable": {"thread_id": "async"}})
+    assert result["messages"][-1].content == "from ollama"
+    assert google.invoke.call_count == 1 and google.ainvoke.call_count == 1
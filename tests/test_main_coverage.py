@@ -1,15 +1,60 @@
-from unittest.mock import AsyncMock, MagicMock, mock_open, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
 from telegram import Update
 
+from src.artifacts import ArtifactStore
+from src.cache import DiskCache
 from src.config import Config, Personality
-from src.main import bot_loop, cli_loop, get_agent_for_user, handle_message, main, start
+from src.main import (
+    bot_loop,
+    build_agent,
+    build_application,
+    chat_queue,
+    cli_loop,
+    get_agent_for_user,
+    handle_message,
+    main,
+    start,
+)
+from src.media import MediaIndex
+from src.registry import AgentRegistry
 
 # --- Tests for src/main.py ---
 
 
+@pytest.fixture(autouse=True)
+def tts_cache(tmp_path):
+    cache = DiskCache(str(tmp_path / "tts"), 1024 * 1024, suffix=".mp3")
+    with patch("src.tools._tts_cache", cache):
+        yield cache
+
+
+@pytest.fixture(autouse=True)
+def artifact_store():
+    store = ArtifactStore(spill_bytes=1024, ttl=60)
+    with patch("src.artifacts._store", store):
+        yield store
+
+
+@pytest.fixture(autouse=True)
+def media_index():
+    index = MediaIndex()
+    with patch("src.media.media_index", index):
+        yield index
+
+
+@pytest.fixture(autouse=True)
+def shared_graph():
+    # Never build a real LLM-backed graph from these tests.
+    with patch("src.main.graph", None):
+        with patch("src.main.create_graph") as mock_create_graph:
+            with patch.object(chat_queue, "debounce", 0):
+                yield mock_create_graph
+
+
 @pytest.fixture
 def mock_agent():
     agent = AsyncMock()
@@ -25,9 +70,9 @@ def mock_personalities():
 
 def test_get_agent_for_user(mock_personalities):
     with patch("src.main.personalities", mock_personalities):
-        with patch("src.main.create_agent") as mock_create:
+        with patch("src.main.bind_personality") as mock_create:
             mock_create.return_value = "mock_agent"
-            with patch("src.main.agents", {}):
+            with patch("src.main.agents", AgentRegistry(build_agent, 8)):
                 # New agent
                 agent = get_agent_for_user("sacha")
                 assert agent == "mock_agent"
@@ -38,11 +83,29 @@ def test_get_agent_for_user(mock_personalities):
                 assert mock_create.call_count == 1  # Only created once
 
 
+def test_get_agent_for_user_shares_one_graph(shared_graph):
+    shared_graph.return_value = RunnableLambda(lambda x: x)
+    pers = {
+        "sacha": Personality(name="Sacha", byline="", identity=[], behavior=[]),
+        "luna": Personality(name="Luna", byline="", identity=[], behavior=[]),
+    }
+    with patch("src.main.personalities", pers):
+        with patch("src.main.agents", AgentRegistry(build_agent, 8)):
+            sacha = get_agent_for_user("sacha")
+            luna = get_agent_for_user("luna")
+
+    # One graph (one LLM client, one checkpointer) serves every personality.
+    shared_graph.assert_called_once()
+    assert sacha.bound is luna.bound is shared_graph.return_value
+    assert sacha.config["configurable"]["personality"] is pers["sacha"]
+    assert luna.config["configurable"]["personality"] is pers["luna"]
+
+
 def test_get_agent_for_user_fallback(mock_personalities):
     with patch("src.main.personalities", mock_personalities):
-        with patch("src.main.create_agent") as mock_create:
+        with patch("src.main.bind_personality") as mock_create:
             mock_create.return_value = "mock_agent"
-            with patch("src.main.agents", {}):
+            with patch("src.main.agents", AgentRegistry(build_agent, 8)):
                 # Unknown personality -> fallback to Sacha
                 agent = get_agent_for_user("unknown")
                 assert agent == "mock_agent"
@@ -54,16 +117,16 @@ def test_get_agent_for_user_fallback_other():
         "other": Personality(name="Other", byline="", identity=[], behavior=[])
     }
     with patch("src.main.personalities", other_pers):
-        with patch("src.main.create_agent") as mock_create:
+        with patch("src.main.bind_personality") as mock_create:
             mock_create.return_value = "mock_agent"
-            with patch("src.main.agents", {}):
+            with patch("src.main.agents", AgentRegistry(build_agent, 8)):
                 agent = get_agent_for_user("unknown")
                 assert agent == "mock_agent"
 
 
 def test_get_agent_for_user_no_personalities():
     with patch("src.main.personalities", {}):
-        with patch("src.main.agents", {}):
+        with patch("src.main.agents", AgentRegistry(build_agent, 8)):
             with pytest.raises(ValueError, match="No personalities found"):
                 get_agent_for_user("sacha")
 
@@ -72,10 +135,8 @@ def test_get_agent_for_user_no_personalities():
 async def test_cli_loop_quit():
     with patch("builtins.input", side_effect=["sacha", "quit"]):
         with patch("builtins.print") as mock_print:
-            with patch(
-                "src.main.Config.load_personalities", return_value={"sacha": "p"}
-            ):
-                with patch("src.main.create_agent") as mock_create:
+            with patch("src.main.personalities", {"sacha": "p"}):
+                with patch("src.main.bind_personality") as mock_create:
                     mock_create.return_value = AsyncMock()
                     await cli_loop()
                     mock_print.assert_any_call("Starting CLI mode...")
@@ -85,9 +146,7 @@ async def test_cli_loop_quit():
 async def test_cli_loop_chat(mock_agent):
     # Mock input: choose sacha, say hi, then quit
     with patch("builtins.input", side_effect=["sacha", "hi", "quit"]):
-        with patch(
-            "src.main.Config.load_personalities", return_value={"sacha": MagicMock()}
-        ):
+        with patch("src.main.personalities", {"sacha": MagicMock()}):
             with patch("src.main.get_agent_for_user", return_value=mock_agent):
                 with patch("builtins.print") as mock_print:
                     await cli_loop()
@@ -101,11 +160,11 @@ async def test_cli_loop_chat(mock_agent):
 
 @pytest.mark.asyncio
 async def test_cli_loop_no_personalities():
-    with patch("src.main.Config.load_personalities", return_value={}):
+    with patch("src.main.personalities", {}):
         with patch("builtins.print") as mock_print:
             await cli_loop()
             mock_print.assert_called_with(
-                "No personalities found in src/personalities/"
+                f"No personalities found in {Config.PERSONALITIES_DIR}"
             )
 
 
@@ -114,9 +173,7 @@ async def test_cli_loop_error(mock_agent):
     # Mock input: choose sacha, say hi (triggers error), quit
     mock_agent.ainvoke.side_effect = Exception("Boom")
     with patch("builtins.input", side_effect=["sacha", "hi", "quit"]):
-        with patch(
-            "src.main.Config.load_personalities", return_value={"sacha": MagicMock()}
-        ):
+        with patch("src.main.personalities", {"sacha": MagicMock()}):
             with patch("src.main.get_agent_for_user", return_value=mock_agent):
                 with patch("builtins.print") as mock_print:
                     await cli_loop()
@@ -174,143 +231,101 @@ async def test_handle_message_text(mock_agent):
         update.message.reply_text.assert_called_with("Hello user")
 
 
-@pytest.mark.asyncio
-async def test_handle_message_tool_audio(mock_agent):
-    # Mock agent returning a ToolMessage with AUDIO_GENERATED
-    mock_agent.ainvoke.return_value = {
-        "messages": [
-            HumanMessage(content="Speak"),
-            ToolMessage(content="AUDIO_GENERATED:test.mp3", tool_call_id="1"),
-        ]
-    }
-
+def media_context():
     update = MagicMock(spec=Update)
     update.effective_chat.id = 456
+    update.message.text = "Hi"
     update.message.reply_text = AsyncMock()
     context = MagicMock()
     context.user_data = {}
     context.bot.send_voice = AsyncMock()
+    context.bot.send_photo = AsyncMock()
     context.bot.send_chat_action = AsyncMock()
+    return update, context
 
-    with patch("src.main.get_agent_for_user", return_value=mock_agent):
-        with patch("builtins.open", mock_open(read_data=b"audio")):
-            with patch("os.remove") as mock_remove:
-                await handle_message(update, context)
 
-                context.bot.send_voice.assert_called()
-                mock_remove.assert_called_with("test.mp3")
+def tool_reply(mock_agent, kind, artifact_id):
+    mock_agent.ainvoke.return_value = {
+        "messages": [AIMessage(content="Here you go")],
+        "media": [{"kind": kind, "artifact_id": artifact_id}],
+    }
 
 
 @pytest.mark.asyncio
-async def test_handle_message_tool_audio_cleanup_error(mock_agent):
-    mock_agent.ainvoke.return_value = {
-        "messages": [
-            HumanMessage(content="Speak"),
-            ToolMessage(content="AUDIO_GENERATED:test.mp3", tool_call_id="1"),
-        ]
-    }
-    update = MagicMock(spec=Update)
-    update.message.reply_text = AsyncMock()  # Must be AsyncMock
-    context = MagicMock()
-    context.bot.send_voice = AsyncMock()
-    context.bot.send_chat_action = AsyncMock()
+async def test_handle_message_tool_audio(mock_agent, artifact_store):
+    artifact_id = artifact_store.put("audio", "voice.mp3", b"audio")
+    tool_reply(mock_agent, "voice", artifact_id)
+    update, context = media_context()
 
     with patch("src.main.get_agent_for_user", return_value=mock_agent):
-        with patch("builtins.open", mock_open(read_data=b"audio")):
-            with patch("os.remove", side_effect=Exception("Cleanup fail")):
-                await handle_message(update, context)
-                # Should not raise, but log warning.
-                context.bot.send_voice.assert_called()
+        await handle_message(update, context)
+
+    voice = context.bot.send_voice.await_args.kwargs["voice"]
+    assert voice.input_file_content == b"audio"
+    assert voice.filename == "voice.mp3"
+    assert len(artifact_store) == 0
 
 
 @pytest.mark.asyncio
-async def test_handle_message_tool_audio_send_error(mock_agent):
-    mock_agent.ainvoke.return_value = {
-        "messages": [
-            HumanMessage(content="Speak"),
-            ToolMessage(content="AUDIO_GENERATED:test.mp3", tool_call_id="1"),
-        ]
-    }
-    update = MagicMock(spec=Update)
-    update.message.reply_text = AsyncMock()  # Must be AsyncMock
-    context = MagicMock()
-    context.bot.send_voice = AsyncMock(side_effect=Exception("Send fail"))
-    context.bot.send_chat_action = AsyncMock()
+async def test_handle_message_keeps_cached_audio(mock_agent, tts_cache, artifact_store):
+    cached = tts_cache.put_bytes("clip", b"audio")
+    tool_reply(mock_agent, "voice", artifact_store.put_file("audio", cached))
+    update, context = media_context()
 
     with patch("src.main.get_agent_for_user", return_value=mock_agent):
-        # Should catch exception and log error
         await handle_message(update, context)
 
+    context.bot.send_voice.assert_called()
+    assert tts_cache.get("clip") == cached
+    assert len(artifact_store) == 0
 
-@pytest.mark.asyncio
-async def test_handle_message_tool_image(mock_agent):
-    # Mock agent returning a ToolMessage with IMAGE_GENERATED
-    mock_agent.ainvoke.return_value = {
-        "messages": [
-            HumanMessage(content="Selfie"),
-            ToolMessage(content="IMAGE_GENERATED:test.png", tool_call_id="1"),
-        ]
-    }
 
-    update = MagicMock(spec=Update)
-    update.effective_chat.id = 456
-    update.message.reply_text = AsyncMock()
-    context = MagicMock()
-    context.user_data = {}
-    context.bot.send_photo = AsyncMock()
-    context.bot.send_chat_action = AsyncMock()
+@pytest.mark.asyncio
+async def test_handle_message_tool_audio_send_error(mock_agent, artifact_store):
+    artifact_id = artifact_store.put("audio", "voice.mp3", b"audio")
+    tool_reply(mock_agent, "voice", artifact_id)
+    update, context = media_context()
+    context.bot.send_voice.side_effect = Exception("Send fail")
 
     with patch("src.main.get_agent_for_user", return_value=mock_agent):
-        with patch("builtins.open", mock_open(read_data=b"image")):
-            with patch("os.remove") as mock_remove:
-                await handle_message(update, context)
-                context.bot.send_photo.assert_called()
-                mock_remove.assert_called_with("test.png")
+        # Should catch exception and log error
+        await handle_message(update, context)
+
+    # The artifact is released even though sending failed.
+    assert len(artifact_store) == 0
 
 
 @pytest.mark.asyncio
-async def test_handle_message_tool_image_cleanup_error(mock_agent):
-    mock_agent.ainvoke.return_value = {
-        "messages": [
-            HumanMessage(content="Selfie"),
-            ToolMessage(content="IMAGE_GENERATED:test.png", tool_call_id="1"),
-        ]
-    }
-    update = MagicMock(spec=Update)
-    update.message.reply_text = AsyncMock()  # Must be AsyncMock
-    context = MagicMock()
-    context.bot.send_photo = AsyncMock()
-    context.bot.send_chat_action = AsyncMock()
+async def test_handle_message_tool_image(mock_agent, artifact_store):
+    artifact_id = artifact_store.put("image", "selfie.png", b"image")
+    tool_reply(mock_agent, "photo", artifact_id)
+    update, context = media_context()
 
     with patch("src.main.get_agent_for_user", return_value=mock_agent):
-        with patch("builtins.open", mock_open(read_data=b"image")):
-            with patch("os.remove", side_effect=Exception("Cleanup fail")):
-                await handle_message(update, context)
-                context.bot.send_photo.assert_called()
+        await handle_message(update, context)
+
+    photo = context.bot.send_photo.await_args.kwargs["photo"]
+    assert photo.input_file_content == b"image"
+    assert len(artifact_store) == 0
 
 
 @pytest.mark.asyncio
-async def test_handle_message_tool_image_send_error(mock_agent):
-    mock_agent.ainvoke.return_value = {
-        "messages": [
-            HumanMessage(content="Selfie"),
-            ToolMessage(content="IMAGE_GENERATED:test.png", tool_call_id="1"),
-        ]
-    }
-    update = MagicMock(spec=Update)
-    update.message.reply_text = AsyncMock()  # Must be AsyncMock
-    context = MagicMock()
-    context.bot.send_photo = AsyncMock(side_effect=Exception("Send fail"))
-    context.bot.send_chat_action = AsyncMock()
+async def test_handle_message_tool_image_expired(mock_agent, artifact_store):
+    tool_reply(mock_agent, "photo", "swept-away")
+    update, context = media_context()
 
     with patch("src.main.get_agent_for_user", return_value=mock_agent):
         await handle_message(update, context)
 
+    context.bot.send_photo.assert_not_called()
+    update.message.reply_text.assert_awaited_once()
+
 
 @pytest.mark.asyncio
 async def test_handle_message_error():
     update = MagicMock(spec=Update)
     update.effective_chat.id = 123
+    update.message.text = "Hi"
     update.message.reply_text = AsyncMock()
     context = MagicMock()
 
@@ -324,17 +339,87 @@ async def test_handle_message_error():
 
 def test_bot_loop():
     with patch.object(Config, "TELEGRAM_TOKEN", "fake_token"):
-        with patch("src.main.Config.load_personalities", return_value={}):
-            with patch("telegram.ext.Application.builder") as MockBuilder:
-                mock_app = MagicMock()
-                mock_app.run_polling = MagicMock()
-                MockBuilder.return_value.token.return_value.build.return_value = (
-                    mock_app
-                )
+        with patch("telegram.ext.Application.builder") as MockBuilder:
+            mock_app = MagicMock()
+            mock_app.run_polling = MagicMock()
+            builder = MockBuilder.return_value.token.return_value
+            builder.concurrent_updates.return_value.build.return_value = mock_app
 
-                bot_loop()
+            bot_loop()
 
-                mock_app.run_polling.assert_called_once()
+            mock_app.run_polling.assert_called_once()
+
+
+def test_bot_loop_webhook():
+    with (
+        patch.object(Config, "TELEGRAM_TOKEN", "fake_token"),
+        patch.object(Config, "WEBHOOK_URL", "https://bot.example.com"),
+        patch.object(Config, "WEBHOOK_SECRET", ""),
+        patch("telegram.ext.Application.builder") as MockBuilder,
+        patch("src.main.serve_webhook", new_callable=MagicMock) as mock_serve,
+        patch("src.main.asyncio.run") as mock_run,
+    ):
+        builder = MockBuilder.return_value.token.return_value
+        mock_app = builder.concurrent_updates.return_value.build.return_value
+        bot_loop(webhook=True)
+
+        builder.concurrent_updates.assert_called_once_with(Config.CONCURRENT_UPDATES)
+        mock_run.assert_called_once()
+        mock_app.run_polling.assert_not_called()
+        args = mock_serve.call_args.args
+        assert args[0] is mock_app
+        assert args[3] == "https://bot.example.com"
+        assert args[5] is None
+
+
+def test_bot_loop_supervisor():
+    with (
+        patch.object(Config, "TELEGRAM_TOKEN", "1:fake"),
+        patch.object(Config, "CHECKPOINT_DB", "checkpoints.sqlite"),
+        patch("src.main.Supervisor") as MockSupervisor,
+        patch("src.main.supervise", new_callable=MagicMock) as mock_supervise,
+        patch("src.main.asyncio.run") as mock_run,
+        patch("telegram.ext.Application.builder") as MockBuilder,
+    ):
+        bot_loop(workers=3)
+
+        MockSupervisor.assert_called_once_with(3, build_application)
+        mock_run.assert_called_once()
+        assert mock_supervise.call_args.args[2] is False  # polling
+        MockBuilder.assert_not_called()
+
+
+def test_bot_loop_supervisor_requires_a_checkpoint_db():
+    with (
+        patch.object(Config, "TELEGRAM_TOKEN", "1:fake"),
+        patch.object(Config, "CHECKPOINT_DB", ""),
+        patch("src.main.supervise") as mock_supervise,
+        patch("builtins.print") as mock_print,
+    ):
+        bot_loop(workers=3)
+    mock_print.assert_called_with(
+        "Error: CHECKPOINT_DB must be set to run more than one worker."
+    )
+    mock_supervise.assert_not_called()
+
+
+def test_build_application_for_worker():
+    with (
+        patch("telegram.ext.Application.builder") as MockBuilder,
+    ):
+        builder = MockBuilder.return_value.token.return_value.concurrent_updates
+        build_application(updater=False)
+        builder.return_value.updater.assert_called_once_with(None)
+
+
+def test_bot_loop_webhook_requires_url():
+    with (
+        patch.object(Config, "TELEGRAM_TOKEN", "fake_token"),
+        patch.object(Config, "WEBHOOK_URL", ""),
+        patch("builtins.print") as mock_print,
+    ):
+        bot_loop(webhook=True)
+        mock_print.assert_called_with("Error: WEBHOOK_URL not set.")
 
 
 def test_bot_loop_no_token():
@@ -344,7 +429,28 @@ def test_bot_loop_no_token():
             mock_print.assert_called_with("Error: TELEGRAM_TOKEN not set.")
 
 
-def test_main_cli():
+@pytest.fixture
+def valid_config():
+    with patch.object(Config, "GOOGLE_API_KEY", "dummy_key"):
+        yield
+
+
+def test_main_validates_config_before_starting(valid_config):
+    with (
+        patch("argparse.ArgumentParser.parse_args") as mock_args,
+        patch.object(Config, "VOICE_FORMAT", "opus3"),
+        patch("src.main.bot_loop") as mock_bot_loop,
+        patch("builtins.print") as mock_print,
+    ):
+        mock_args.return_value.cli = False
+        main()
+    mock_print.assert_called_with(
+        "Error: VOICE_FORMAT must be 'mp3' or 'ogg', not 'opus3'."
+    )
+    mock_bot_loop.assert_not_called()
+
+
+def test_main_cli(valid_config):
     with patch("argparse.ArgumentParser.parse_args") as mock_args:
         mock_args.return_value.cli = True
         with patch("src.main.cli_loop", new_callable=MagicMock):  # async func
@@ -355,17 +461,19 @@ def test_main_cli():
                 mock_run.assert_called()
 
 
-def test_main_bot():
+def test_main_bot(valid_config):
     with patch("argparse.ArgumentParser.parse_args") as mock_args:
         mock_args.return_value.cli = False
+        mock_args.return_value.webhook = True
+        mock_args.return_value.workers = 4
         with patch("src.main.bot_loop") as mock_bot_loop:
             with patch("asyncio.run") as mock_run:
                 main()
                 mock_run.assert_not_called()
-                mock_bot_loop.assert_called_once()
+                mock_bot_loop.assert_called_once_with(webhook=True, workers=4)
 
 
-def test_main_keyboard_interrupt():
+def test_main_keyboard_interrupt(valid_config):
     with patch("argparse.ArgumentParser.parse_args") as mock_args:
         mock_args.return_value.cli = False
         with patch("src.main.bot_loop", side_effect=KeyboardInterrupt):
@@ -384,23 +492,21 @@ def test_main_execution():
 @pytest.mark.asyncio
 async def test_cli_loop_missing_personalities_print():
     # Test lines 55-56
-    with patch("src.main.Config.load_personalities", return_value={}):
+    with patch("src.main.personalities", {}):
         with patch("builtins.print") as mock_print:
             await cli_loop()
             mock_print.assert_called_with(
-                "No personalities found in src/personalities/"
+                f"No personalities found in {Config.PERSONALITIES_DIR}"
             )
 
 
 @pytest.mark.asyncio
 async def test_cli_loop_default_personality():
     # Test lines 61-64: input empty -> default sacha
-    with patch.dict("src.main.agents", {}, clear=True):
+    with patch("src.main.agents", AgentRegistry(build_agent, 8)):
         with patch("builtins.input", side_effect=["", "quit"]):
-            with patch(
-                "src.main.Config.load_personalities", return_value={"sacha": "p"}
-            ):
-                with patch("src.main.create_agent") as mock_create:
+            with patch("src.main.personalities", {"sacha": "p"}):
+                with patch("src.main.bind_personality") as mock_create:
                     mock_create.return_value = AsyncMock()
                     with patch("builtins.print") as mock_print:
                         await cli_loop()
@@ -414,12 +520,10 @@ async def test_cli_loop_default_personality():
 @pytest.mark.asyncio
 async def test_cli_loop_invalid_personality():
     # Test lines 66-68: invalid input -> default sacha
-    with patch.dict("src.main.agents", {}, clear=True):
+    with patch("src.main.agents", AgentRegistry(build_agent, 8)):
         with patch("builtins.input", side_effect=["invalid", "quit"]):
-            with patch(
-                "src.main.Config.load_personalities", return_value={"sacha": "p"}
-            ):
-                with patch("src.main.create_agent") as mock_create:
+            with patch("src.main.personalities", {"sacha": "p"}):
+                with patch("src.main.bind_personality") as mock_create:
                     mock_create.return_value = AsyncMock()
                     with patch("builtins.print") as mock_print:
                         await cli_loop()
@@ -0,0 +1,153 @@
+import io
+import json
+import os
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from telegram.error import BadRequest
+
+from src.artifacts import ArtifactStore
+from src.media import MediaIndex, send_photo, send_voice
+
+# --- Tests for src/media.py ---
+
+
+@pytest.fixture
+def store():
+    store = ArtifactStore(spill_bytes=1024, ttl=60)
+    with patch("src.artifacts._store", store):
+        yield store
+
+
+@pytest.fixture
+def index():
+    index = MediaIndex()
+    with patch("src.media.media_index", index):
+        yield index
+
+
+def sent_message(voice_id=None, photo_ids=()):
+    message = MagicMock()
+    message.voice = MagicMock(file_id=voice_id) if voice_id else None
+    message.photo = [MagicMock(file_id=file_id) for file_id in photo_ids]
+    return message
+
+
+def test_keys_depend_on_kind_and_content():
+    same = MediaIndex.key_for("voice", io.BytesIO(b"same"))
+    assert same == MediaIndex.key_for("voice", io.BytesIO(b"same"))
+    assert same != MediaIndex.key_for("photo", io.BytesIO(b"same"))
+    assert same != MediaIndex.key_for("voice", io.BytesIO(b"different"))
+
+    media = io.BytesIO(b"rewound")
+    MediaIndex.key_for("voice", media)
+    assert media.read() == b"rewound"
+
+
+def test_lru_bound_and_counters():
+    index = MediaIndex(max_entries=2)
+    index.put("a", "id-a")
+    index.put("b", "id-b")
+    assert index.get("a") == "id-a"  # "b" becomes least recently used
+    index.put("c", "id-c")
+    assert index.get("b") is None
+    assert len(index) == 2
+    assert (index.hits, index.misses) == (1, 1)
+    index.forget("missing")
+
+
+def test_persists_across_restarts(tmp_path):
+    path = tmp_path / "state" / "media.json"
+    index = MediaIndex(str(path))
+    index.put("a", "id-a")
+    index.put("b", "id-b")
+    index.forget("a")
+    assert json.loads(path.read_text()) == {"b": "id-b"}
+    assert MediaIndex(str(path)).get("b") == "id-b"
+
+
+@pytest.mark.asyncio
+async def test_writes_are_batched_off_the_event_loop(tmp_path):
+    path = tmp_path / "media.json"
+    index = MediaIndex(str(path), save_delay=0.05)
+    with patch("src.media.os.replace", wraps=os.replace) as replace:
+        for i in range(10):
+            index.put(f"k{i}", f"id-{i}")
+        index.forget("k0")
+        assert not path.exists()
+        await index._pending
+    assert replace.call_count == 1
+    assert len(json.loads(path.read_text())) == 9
+    index.save()  # nothing left to write
+    assert replace.call_count == 1
+    MediaIndex().save()
+
+
+def test_shared_file_keeps_every_process_entries(tmp_path):
+    path = tmp_path / "media.json"
+    first, second = MediaIndex(str(path)), MediaIndex(str(path))
+    first.put("a", "id-a")
+    second.put("b", "id-b")
+    assert json.loads(path.read_text()) == {"a": "id-a", "b": "id-b"}
+    # Entries saved by the other process are picked up on write
+    assert second.get("a") == "id-a"
+
+    first.forget("a")
+    first.put("c", "id-c")
+    second.put("a", "id-a2")
+    assert json.loads(path.read_text()) == {"b": "id-b", "c": "id-c", "a": "id-a2"}
+
+    # The merged index stays within max_entries, oldest entries first out
+    MediaIndex(str(path), max_entries=2).put("d", "id-d")
+    assert json.loads(path.read_text()) == {"a": "id-a2", "d": "id-d"}
+
+
+def test_unreadable_index_is_ignored(tmp_path):
+    path = tmp_path / "media.json"
+    path.write_text("{not json")
+    with patch("src.media.logger") as mock_logger:
+        assert len(MediaIndex(str(path))) == 0
+        mock_logger.warning.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_voice_is_uploaded_once_then_sent_by_file_id(tmp_path, store, index):
+    clip = tmp_path / "clip.mp3"
+    clip.write_bytes(b"audio")
+    bot = MagicMock()
+    bot.send_voice = AsyncMock(return_value=sent_message(voice_id="voice-1"))
+
+    await send_voice(bot, 1, store.put_file("audio", str(clip)))
+    await send_voice(bot, 2, store.put("audio", "copy.mp3", b"audio"))
+
+    first, second = bot.send_voice.await_args_list
+    assert first.kwargs["voice"].input_file_content == b"audio"
+    assert first.kwargs["voice"].filename == "clip.mp3"
+    assert second.kwargs == {"chat_id": 2, "voice": "voice-1"}
+    assert index.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_photo_records_largest_size(store, index):
+    bot = MagicMock()
+    bot.send_photo = AsyncMock(return_value=sent_message(photo_ids=["s", "m", "l"]))
+
+    await send_photo(bot, 1, store.put("image", "profile.jpg", b"image"))
+    assert index.get(MediaIndex.key_for("photo", io.BytesIO(b"image"))) == "l"
+
+
+@pytest.mark.asyncio
+async def test_rejected_file_id_falls_back_to_upload(store, index):
+    key = MediaIndex.key_for("photo", io.BytesIO(b"image"))
+    index.put(key, "stale")
+    bot = MagicMock()
+    bot.send_photo = AsyncMock(
+        side_effect=[BadRequest("Wrong file identifier"), sent_message()]
+    )
+
+    await send_photo(bot, 1, store.put("image", "selfie.png", b"image"))
+
+    assert bot.send_photo.await_count == 2
+    assert bot.send_photo.await_args.kwargs["photo"].input_file_content == b"image"
+    # No id came back from the upload, so nothing is remembered.
+    assert index.get(key) is None
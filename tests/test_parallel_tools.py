@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.artifacts import ArtifactStore
+from src.main import IncomingMessage, process_messages
+from src.media import MediaIndex
+from src.tools import ToolLimits, parse_limits, tool_calls_waiting
+
+# --- Tests for concurrent tool calls (src/tools.py, src/agent.py) and
+# concurrent delivery of a turn's replies (src/main.py) ---
+
+TOOL_LATENCY = 0.1
+
+
+class ScriptedLLM(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def scripted(*replies):
+    return ScriptedLLM(messages=iter(replies))
+
+
+def both_tools():
+    return AIMessage(
+        content="",
+        tool_calls=[
+            {"name": "SelfieTool", "args": {"description": "beach"}, "id": "s1"},
+            {"name": "VoiceTool", "args": {"text": "hi"}, "id": "v1"},
+        ],
+    )
+
+
+def test_parse_limits():
+    assert parse_limits("SelfieTool=4, VoiceTool=8,") == {
+        "SelfieTool": 4,
+        "VoiceTool": 8,
+    }
+    assert parse_limits("") == {}
+    for spec in ("SelfieTool", "SelfieTool=0", "=3", "VoiceTool=many"):
+        with pytest.raises(ValueError, match="TOOL_CONCURRENCY"):
+            parse_limits(spec)
+
+
+@pytest.mark.asyncio
+async def test_async_limits_cap_each_tool_separately():
+    limits = ToolLimits({"SelfieTool": 2})
+    running = {"SelfieTool": 0, "VoiceTool": 0}
+    peak = dict(running)
+    waits = []
+    queued = []
+
+    async def call(name):
+        async with limits.acquire(name) as waited:
+            waits.append(waited)
+            running[name] += 1
+            peak[name] = max(peak[name], running[name])
+            queued.append(tool_calls_waiting.value(tool="SelfieTool"))
+            await asyncio.sleep(0.02)
+            running[name] -= 1
+
+    await asyncio.gather(*(call("SelfieTool") for _ in range(5)), call("VoiceTool"))
+    await asyncio.gather(*(call("VoiceTool") for _ in range(5)))
+
+    assert peak == {"SelfieTool": 2, "VoiceTool": 5}
+    assert max(waits) >= 0.03
+    assert max(queued) == 3
+    assert tool_calls_waiting.value(tool="SelfieTool") == 0
+
+
+def test_sync_limits_cap_threads():
+    limits = ToolLimits({"SelfieTool": 1})
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def call(name):
+        with limits.hold(name):
+            with lock:
+                running.append(name)
+                peak.append(running.count("SelfieTool"))
+            time.sleep(0.02)
+            with lock:
+                running.remove(name)
+
+    threads = [threading.Thread(target=call, args=("SelfieTool",)) for _ in range(3)]
+    threads.append(threading.Thread(target=call, args=("VoiceTool",)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 1
+    assert tool_calls_waiting.value(tool="SelfieTool") == 0
+
+
+def test_sync_limits_are_reentrant_per_thread():
+    limits = ToolLimits({"VoiceTool": 1})
+    # The tool node holds the slot, then the tool's sync path asks again
+    with limits.hold("VoiceTool") as outer:
+        with limits.hold("VoiceTool") as inner:
+            assert inner == 0.0
+    assert outer >= 0.0
+    # and the slot is free again afterwards
+    with limits.hold("VoiceTool"):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_tool_calls_of_one_message_run_concurrently(build_app):
+    app = build_app(scripted(both_tools(), AIMessage(content="both sent")))
+
+    async def slow_selfie(self, description):
+        await asyncio.sleep(TOOL_LATENCY)
+        return "selfie sent", None
+
+    async def slow_voice(self, text):
+        await asyncio.sleep(TOOL_LATENCY)
+        return "voice sent", None
+
+    config = {"configurable": {"thread_id": "parallel"}}
+    with (
+        patch("src.tools.SelfieTool._arun", slow_selfie),
+        patch("src.tools.VoiceTool._arun", slow_voice),
+    ):
+        started = time.perf_counter()
+        result = await app.ainvoke({"messages": [HumanMessage("both")]}, config)
+        elapsed = time.perf_counter() - started
+
+    print(f"\nTwo {TOOL_LATENCY * 1000:.0f}ms tools took {elapsed * 1000:.0f}ms")
+    assert result["messages"][-1].content == "both sent"
+    assert elapsed < 2 * TOOL_LATENCY
+
+
+@pytest.mark.asyncio
+async def test_tool_cap_applies_across_chats(build_app):
+    app = build_app(
+        scripted(both_tools(), AIMessage("a"), both_tools(), AIMessage("b"))
+    )
+    active = []
+    peak = []
+
+    async def slow_selfie(self, description):
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0.02)
+        active.pop()
+        return "selfie sent", None
+
+    async def voice(self, text):
+        return "voice sent", None
+
+    with (
+        patch("src.agent.tool_limits", ToolLimits({"SelfieTool": 1})),
+        patch("src.tools.SelfieTool._arun", slow_selfie),
+        patch("src.tools.VoiceTool._arun", voice),
+    ):
+        await asyncio.gather(
+            *(
+                app.ainvoke(
+                    {"messages": [HumanMessage("both")]},
+                    {"configurable": {"thread_id": f"chat-{n}"}},
+                )
+                for n in range(2)
+            )
+        )
+    assert max(peak) == 1
+
+
+def test_sync_tool_calls_respect_limits(build_app):
+    app = build_app(scripted(both_tools(), AIMessage(content="done")))
+    limits = ToolLimits({"SelfieTool": 1, "VoiceTool": 1})
+    config = {"configurable": {"thread_id": "sync-parallel"}}
+    with (
+        patch("src.agent.tool_limits", limits),
+        patch("src.tools.SelfieTool._run", return_value=("selfie sent", None)),
+        patch("src.tools.VoiceTool._run", return_value=("voice sent", None)),
+    ):
+        result = app.invoke({"messages": [HumanMessage("both")]}, config)
+    assert result["messages"][-1].content == "done"
+
+
+@pytest.mark.asyncio
+async def test_text_and_media_are_sent_concurrently():
+    store = ArtifactStore(spill_bytes=1024, ttl=60)
+    media = [
+        {"kind": "photo", "artifact_id": store.put("image", "s.png", b"png")},
+        {"kind": "voice", "artifact_id": store.put("audio", "v.mp3", b"mp3")},
+    ]
+    agent = MagicMock()
+    agent.ainvoke = AsyncMock(
+        return_value={"messages": [AIMessage("Here you go")], "media": media}
+    )
+
+    async def slow_send(*args, **kwargs):
+        await asyncio.sleep(TOOL_LATENCY)
+        return MagicMock(photo=None, voice=None)
+
+    update = MagicMock()
+    update.message.reply_text = AsyncMock(side_effect=slow_send)
+    context = MagicMock()
+    context.user_data = {}
+    context.bot.send_chat_action = AsyncMock()
+    context.bot.send_photo = AsyncMock(side_effect=slow_send)
+    context.bot.send_voice = AsyncMock(side_effect=slow_send)
+
+    with (
+        patch("src.artifacts._store", store),
+        patch("src.media.media_index", MediaIndex()),
+        patch("src.main.get_agent_for_user", return_value=agent),
+    ):
+        started = time.perf_counter()
+        await process_messages([IncomingMessage(1, "both", update, context)])
+        elapsed = time.perf_counter() - started
+
+    update.message.reply_text.assert_awaited_once_with("Here you go")
+    context.bot.send_photo.assert_awaited_once()
+    context.bot.send_voice.assert_awaited_once()
+    assert len(store) == 0
+    print(
+        f"\nText + 2 media ({TOOL_LATENCY * 1000:.0f}ms each): {elapsed * 1000:.0f}ms"
+    )
+    assert elapsed < 2 * TOOL_LATENCY
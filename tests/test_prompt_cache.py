@@ -0,0 +1,229 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from src import agent
+from src.agent import system_message
+from src.config import Personality
+from src.context_cache import GeminiContextCache
+from src.tools import SelfieTool, VoiceTool
+
+# --- Tests for the pre-rendered system prompt and src/context_cache.py ---
+
+
+def fake_client(fail: bool = False) -> MagicMock:
+    client = MagicMock()
+    names = iter(f"cachedContents/{i}" for i in range(1, 100))
+
+    def create(model, config):
+        if fail:
+            raise ValueError("Cached content is too small")
+        return SimpleNamespace(name=next(names))
+
+    async def acreate(model, config):
+        return create(model, config)
+
+    client.caches.create.side_effect = create
+    client.aio.caches.create = AsyncMock(side_effect=acreate)
+    return client
+
+
+class RecordingLLM:
+    """Fake Gemini model that records which path each turn took."""
+
+    def __init__(self, client) -> None:
+        self.client = client
+        self.calls: list = []
+        self.bound = SimpleNamespace(
+            invoke=self.invoke_bound, ainvoke=self.ainvoke_bound
+        )
+
+    def bind_tools(self, tools):
+        return self.bound
+
+    def invoke(self, messages, config=None, **kwargs):
+        self.calls.append(("cached", messages, kwargs))
+        return AIMessage(content="ok")
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        return self.invoke(messages, **kwargs)
+
+    def invoke_bound(self, messages, config=None):
+        self.calls.append(("full", messages, {}))
+        return AIMessage(content="ok")
+
+    async def ainvoke_bound(self, messages, config=None):
+        return self.invoke_bound(messages)
+
+
+@pytest.fixture
+def personality():
+    return Personality(name="Cache", byline="cached", identity=["me"], behavior=[])
+
+
+def test_system_message_is_rendered_once_per_personality(personality):
+    with patch("src.agent.build_system_prompt", wraps=agent.build_system_prompt) as b:
+        first = system_message(personality)
+        second = system_message(personality)
+    assert first is second
+    assert b.call_count == 1
+    assert "You are Cache, cached." in first.content
+
+    other = Personality(name="Other", byline="", identity=[], behavior=[])
+    assert "Other" in system_message(other).content
+
+
+def test_system_message_is_dropped_with_its_personality():
+    personality = Personality(name="Gone", byline="", identity=[], behavior=[])
+    key = id(personality)
+    system_message(personality)
+    assert key in agent._system_messages
+    del personality
+    gc.collect()
+    assert key not in agent._system_messages
+
+
+def test_graph_reuses_the_same_system_message_every_turn(personality, build_app):
+    llm = RecordingLLM(fake_client())
+    app = build_app(llm, personality, GEMINI_CONTEXT_CACHE=False)
+    config = {"configurable": {"thread_id": "prompt"}}
+    app.invoke({"messages": [HumanMessage("hi")]}, config)
+    app.invoke({"messages": [HumanMessage("again")]}, config)
+
+    first, second = (call[1][0] for call in llm.calls)
+    assert isinstance(first, SystemMessage)
+    assert first is second is system_message(personality)
+    llm.client.caches.create.assert_not_called()
+
+
+def test_context_cache_uploads_prompt_and_tools_once(clock):
+    client = fake_client()
+    cache = GeminiContextCache(
+        client, "gemini-test", [SelfieTool(), VoiceTool()], 100, clock
+    )
+
+    assert cache.get("prompt") == "cachedContents/1"
+    assert cache.get("prompt") == "cachedContents/1"
+    assert cache.get("other prompt") == "cachedContents/2"
+    assert cache.created == 2
+
+    kwargs = client.caches.create.call_args_list[0].kwargs
+    assert kwargs["model"] == "gemini-test"
+    config = kwargs["config"]
+    assert config.system_instruction == "prompt"
+    assert config.ttl == "100s"
+    selfie, voice = config.tools[0].function_declarations
+    assert [selfie.name, voice.name] == ["SelfieTool", "VoiceTool"]
+    assert selfie.parameters_json_schema["required"] == ["description"]
+
+    # Recreated shortly before the server-side TTL runs out
+    clock.now = 89
+    assert cache.get("prompt") == "cachedContents/1"
+    clock.now = 91
+    assert cache.get("prompt") == "cachedContents/3"
+
+
+def test_context_cache_failure_falls_back_until_ttl(clock):
+    client = fake_client(fail=True)
+    cache = GeminiContextCache(client, "gemini-test", [], 100, clock)
+
+    assert cache.get("short prompt") is None
+    assert cache.get("short prompt") is None
+    assert cache.failures == 1
+    clock.now = 95
+    assert cache.get("short prompt") is None
+    assert cache.failures == 2
+
+
+@pytest.mark.asyncio
+async def test_context_cache_async_create_and_failure(clock):
+    cache = GeminiContextCache(fake_client(), "gemini-test", [], 100, clock)
+    assert await cache.aget("prompt") == "cachedContents/1"
+    assert await cache.aget("prompt") == "cachedContents/1"
+    assert cache.created == 1
+
+    failing = GeminiContextCache(fake_client(fail=True), "m", [], 100, clock)
+    assert await failing.aget("prompt") is None
+    assert failing.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cold_turns_create_one_cache(clock):
+    client = fake_client()
+    release = asyncio.Event()
+    create = client.aio.caches.create.side_effect
+
+    async def slow_create(model, config):
+        await release.wait()
+        return await create(model, config)
+
+    client.aio.caches.create.side_effect = slow_create
+    cache = GeminiContextCache(client, "gemini-test", [], 100, clock)
+
+    turns = [asyncio.ensure_future(cache.aget("prompt")) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*turns) == ["cachedContents/1"] * 3
+    assert client.aio.caches.create.await_count == 1
+    assert (cache.created, cache.deduplicated) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_creation_releases_the_waiters(clock):
+    never = asyncio.Event()
+
+    async def hang(model, config):
+        await never.wait()
+
+    client = fake_client()
+    client.aio.caches.create = AsyncMock(side_effect=hang)
+    cache = GeminiContextCache(client, "gemini-test", [], 100, clock)
+
+    owner = asyncio.ensure_future(cache.aget("prompt"))
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(cache.aget("prompt"))
+    await asyncio.sleep(0)
+    owner.cancel()
+    # The waiter sends the full prompt; the next turn tries again
+    assert await waiter is None
+    with pytest.raises(asyncio.CancelledError):
+        await owner
+    assert cache._inflight == {} and cache._entries == {}
+
+
+def test_graph_sends_only_history_with_context_cache(personality, build_app):
+    llm = RecordingLLM(fake_client())
+    app = build_app(llm, personality, GEMINI_CONTEXT_CACHE=True)
+    config = {"configurable": {"thread_id": "cached"}}
+    app.invoke({"messages": [HumanMessage("hi")]}, config)
+    app.invoke({"messages": [HumanMessage("again")], "summary": "met"}, config)
+
+    (mode, messages, kwargs), (_, summarized, _) = llm.calls
+    assert mode == "cached"
+    assert kwargs == {"cached_content": "cachedContents/1"}
+    assert [m.content for m in messages] == ["hi"]
+    assert summarized[0].content == "Summary of the earlier conversation:\nmet"
+    assert not any(isinstance(m, SystemMessage) for m in summarized)
+    prompt = llm.client.caches.create.call_args.kwargs["config"].system_instruction
+    assert prompt == system_message(personality).content
+    assert llm.client.caches.create.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_graph_context_cache_async_path_and_fallback(personality, build_app):
+    llm = RecordingLLM(fake_client())
+    app = build_app(llm, personality, GEMINI_CONTEXT_CACHE=True)
+    config = {"configurable": {"thread_id": "cached-async"}}
+    await app.ainvoke({"messages": [HumanMessage("hi")]}, config)
+    assert llm.calls[0][0] == "cached"
+
+    failing = RecordingLLM(fake_client(fail=True))
+    app = build_app(failing, personality, GEMINI_CONTEXT_CACHE=True)
+    await app.ainvoke({"messages": [HumanMessage("hi")]}, config)
+    app.invoke({"messages": [HumanMessage("sync")]}, config)
+    assert [call[0] for call in failing.calls] == ["full", "full"]
+    assert isinstance(failing.calls[0][1][0], SystemMessage)
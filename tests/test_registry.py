@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src.config import Personality
+from src.main import get_agent_for_user
+from src.registry import AgentRegistry, PersonalityRegistry
+
+# --- Tests for src/registry.py ---
+
+
+def make_personality(name: str) -> Personality:
+    return Personality(name=name, byline="", identity=[], behavior=[])
+
+
+def test_registry_hits_and_misses():
+    built = []
+    registry = AgentRegistry(lambda p: built.append(p.name) or p.name, max_size=4)
+    sacha = make_personality("Sacha")
+
+    assert registry.get("sacha", sacha) == "Sacha"
+    assert registry.get("sacha", sacha) == "Sacha"
+    assert built == ["Sacha"]
+    assert registry.stats() == {"size": 1, "hits": 1, "misses": 1, "evictions": 0}
+    assert "Sacha" in registry
+    assert " sacha " in registry
+    assert 42 not in registry
+
+
+def test_registry_evicts_least_recently_used():
+    registry = AgentRegistry(lambda p: p.name, max_size=2)
+    for name in ("a", "b"):
+        registry.get(name, make_personality(name))
+    registry.get("a", make_personality("a"))  # "b" is now least recently used
+    registry.get("c", make_personality("c"))
+
+    assert "a" in registry and "c" in registry
+    assert "b" not in registry
+    assert len(registry) == 2
+    assert registry.evictions == 1
+
+    registry.clear()
+    assert len(registry) == 0
+
+
+def test_registry_builds_once_under_concurrency():
+    calls = 0
+    lock = threading.Lock()
+
+    def slow_factory(personality):
+        nonlocal calls
+        with lock:
+            calls += 1
+        time.sleep(0.05)
+        return object()
+
+    registry = AgentRegistry(slow_factory, max_size=4)
+    sacha = make_personality("Sacha")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: registry.get("sacha", sacha), range(8)))
+
+    assert calls == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_get_agent_for_user_canonicalizes_names():
+    pers = {"sacha": make_personality("Sacha"), "luna": make_personality("Luna")}
+    registry = AgentRegistry(lambda p: p.name, max_size=8)
+    with patch("src.main.personalities", pers):
+        with patch("src.main.agents", registry):
+            for name in ("Sacha", "sacha", " SACHA ", "nobody", "x" * 100):
+                assert get_agent_for_user(name) == "Sacha"
+            assert get_agent_for_user("Luna") == "Luna"
+
+    # Unknown names fall back before the lookup and never grow the cache.
+    assert len(registry) == 2
+    assert registry.misses == 2
+
+
+def test_registry_rebuilds_agent_for_reloaded_personality():
+    registry = AgentRegistry(lambda p: p.byline, max_size=4)
+    assert registry.get("sacha", make_personality("Sacha")) == ""
+    edited = Personality(name="Sacha", byline="edited", identity=[], behavior=[])
+    assert registry.get("sacha", edited) == "edited"
+    assert registry.get("sacha", edited) == "edited"
+    assert registry.stats() == {"size": 1, "hits": 1, "misses": 2, "evictions": 0}
+
+
+# --- PersonalityRegistry ---
+
+
+def write_personality(directory, stem, name, byline="", mtime=None):
+    path = directory / f"{stem}.json"
+    data = {"name": name, "byline": byline, "identity": [], "behavior": []}
+    path.write_text(json.dumps(data), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def persona_dir(tmp_path):
+    write_personality(tmp_path, "sacha", "Sacha", "original", mtime=1000)
+    write_personality(tmp_path, "alix_earle", "Alix Earle", mtime=1000)
+    write_personality(tmp_path, "jane", "Jane Doe", mtime=1000)
+    (tmp_path / "broken.json").write_text("{not json", encoding="utf-8")
+    return tmp_path
+
+
+def test_personality_registry_loads_lazily(persona_dir):
+    registry = PersonalityRegistry(str(persona_dir))
+    assert registry.stats()["parses"] == 0
+
+    assert registry["sacha"].byline == "original"
+    assert registry["alix earle"].name == "Alix Earle"
+    assert registry.stats() == {"files": 4, "loaded": 2, "parses": 2, "reloads": 0}
+    assert registry["sacha"] is registry["sacha"]
+    assert registry.parses == 2
+
+    # A name that does not match its file name loads the rest once
+    assert "jane doe" in registry
+    assert "nobody" not in registry
+    assert registry.parses == 4
+    assert sorted(registry) == ["alix earle", "jane doe", "sacha"]
+    assert len(registry) == 3
+    assert registry.parses == 4
+
+
+def test_personality_registry_reloads_only_changed_files(persona_dir, clock):
+    registry = PersonalityRegistry(str(persona_dir), reload_interval=2, clock=clock)
+    sacha, alix = registry["sacha"], registry["alix earle"]
+
+    write_personality(persona_dir, "sacha", "Sacha", "edited", mtime=2000)
+    clock.now = 1
+    assert registry["sacha"] is sacha  # not re-checked yet
+    clock.now = 3
+    assert registry["sacha"].byline == "edited"
+    assert registry["alix earle"] is alix
+    assert registry.stats()["reloads"] == 1
+
+    # An invalid edit keeps serving the last good version
+    (persona_dir / "sacha.json").write_text("{oops", encoding="utf-8")
+    clock.now = 6
+    assert registry["sacha"].byline == "edited"
+
+    # Renaming inside the file moves the key; removed files disappear
+    write_personality(persona_dir, "sacha", "Sacha Two", mtime=3000)
+    (persona_dir / "alix_earle.json").unlink()
+    write_personality(persona_dir, "luna", "Luna")
+    clock.now = 9
+    assert "sacha" not in registry
+    assert registry["sacha two"].name == "Sacha Two"
+    assert "alix earle" not in registry
+    assert registry["luna"].name == "Luna"
+
+
+def test_personality_registry_missing_directory(tmp_path):
+    registry = PersonalityRegistry(str(tmp_path / "missing"))
+    assert len(registry) == 0
+    with pytest.raises(KeyError):
+        registry["sacha"]
+
+
+def test_personality_registry_skips_files_removed_during_scan(persona_dir):
+    registry = PersonalityRegistry(str(persona_dir))
+    real_stat = Path.stat
+
+    def stat(path, **kwargs):
+        if path.name == "jane.json":
+            raise FileNotFoundError(path)
+        return real_stat(path, **kwargs)
+
+    with patch.object(Path, "stat", stat):
+        assert sorted(registry) == ["alix earle", "sacha"]
+
+
+def test_personality_reload_rebuilds_agent(persona_dir, clock):
+    pers = PersonalityRegistry(str(persona_dir), reload_interval=1, clock=clock)
+    registry = AgentRegistry(lambda p: p.byline, max_size=8)
+    with patch("src.main.personalities", pers):
+        with patch("src.main.agents", registry):
+            assert get_agent_for_user("Sacha") == "original"
+            assert get_agent_for_user("alix earle") == ""
+            write_personality(persona_dir, "sacha", "Sacha", "edited", mtime=2000)
+            clock.now = 2
+            assert get_agent_for_user("Sacha") == "edited"
+            assert get_agent_for_user("alix earle") == ""
+    assert registry.stats()["misses"] == 3
@@ -0,0 +1,275 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src import response_cache as response_cache_module
+from src.config import Config, Personality
+from src.response_cache import (
+    ResponseCache,
+    cosine,
+    exact_embedding,
+    get_response_cache,
+    ngram_embedding,
+    normalize,
+)
+
+# --- Tests for src/response_cache.py and its use in the chat graph ---
+
+LLM_LATENCY = 0.05
+
+
+class SlowLLM:
+    """Fake chat model that takes LLM_LATENCY per reply and counts its calls."""
+
+    def __init__(self, replies=None) -> None:
+        self.calls = 0
+        self.replies = replies
+
+    def bind_tools(self, tools):
+        return self
+
+    def _reply(self):
+        self.calls += 1
+        if self.replies:
+            return self.replies.pop(0)
+        return AIMessage(content=f"reply #{self.calls}")
+
+    def invoke(self, messages, config=None):
+        time.sleep(LLM_LATENCY)
+        return self._reply()
+
+    async def ainvoke(self, messages, config=None):
+        await asyncio.sleep(LLM_LATENCY)
+        return self._reply()
+
+
+@pytest.fixture
+def cache():
+    cache = ResponseCache(ngram_embedding, 0.85, 60, 100)
+    with (
+        patch.object(Config, "RESPONSE_CACHE", True),
+        patch.object(response_cache_module, "_cache", cache),
+    ):
+        yield cache
+
+
+def test_normalize_folds_small_talk_variants():
+    assert normalize("Oiii!! Tudo bem? 😊") == "oi tudo bem"
+    assert normalize("  Boa   NOITE ") == normalize("boa noite!") == "boa noite"
+    assert normalize("Olá") == "ola"
+    assert normalize("🙂") == ""
+
+
+def test_embeddings_similarity():
+    assert cosine(exact_embedding("hi"), exact_embedding("hi")) == 1.0
+    assert cosine(exact_embedding("hi"), exact_embedding("hey")) == 0.0
+
+    base = ngram_embedding("how are you")
+    assert cosine(base, ngram_embedding("how are you")) == pytest.approx(1.0)
+    assert cosine(base, ngram_embedding("how are you doing")) > 0.8
+    assert cosine(base, ngram_embedding("good night")) == 0.0
+    assert cosine(ngram_embedding("a"), ngram_embedding("a")) == pytest.approx(1.0)
+
+
+def test_lookup_matches_similar_text_in_the_same_scope():
+    cache = ResponseCache(ngram_embedding, 0.85, 60, 100)
+    assert cache.lookup("sacha", "how are you?") is None
+    cache.store("sacha", "How are you?", "Great, and you?", 1.5)
+
+    assert cache.lookup("sacha", "how are you") == "Great, and you?"
+    assert cache.lookup("sacha", "how are youu") == "Great, and you?"
+    assert cache.lookup("sacha", "good night") is None
+    assert cache.lookup("jane", "how are you") is None
+    assert cache.lookup("sacha", "!!!") is None
+
+    assert cache.stats() == {
+        "entries": 1,
+        "hits": 2,
+        "misses": 3,
+        "hit_rate": 0.4,
+        "latency_saved": 3.0,
+        "evictions": 0,
+    }
+
+
+def test_store_ignores_empty_turns_and_replies():
+    cache = ResponseCache(exact_embedding, 1.0, 60, 100)
+    cache.store("s", "😊", "reply", 1.0)
+    cache.store("s", "hi", "", 1.0)
+    assert cache.stats()["entries"] == 0
+    assert cache.hit_rate() == 0.0
+
+
+def test_entries_expire_and_are_evicted_lru(clock):
+    cache = ResponseCache(exact_embedding, 1.0, 10, 2, clock)
+    cache.store("s", "hi", "hello", 1.0)
+    cache.store("s", "bye", "see you", 1.0)
+    assert cache.lookup("s", "hi") == "hello"
+
+    cache.store("s", "good night", "sweet dreams", 1.0)
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup("s", "bye") is None
+    assert cache.lookup("s", "hi") == "hello"
+
+    clock.now = 11
+    assert cache.lookup("s", "hi") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_get_response_cache_uses_config():
+    with patch.object(response_cache_module, "_cache", None):
+        with patch.object(Config, "RESPONSE_CACHE_EMBEDDING", "exact"):
+            cache = get_response_cache()
+        assert cache.embed is exact_embedding
+        assert cache.threshold == Config.RESPONSE_CACHE_THRESHOLD
+        assert get_response_cache() is cache
+
+    with patch.object(response_cache_module, "_cache", None):
+        with patch.object(Config, "RESPONSE_CACHE_EMBEDDING", "bert"):
+            with pytest.raises(ValueError, match="RESPONSE_CACHE_EMBEDDING"):
+                get_response_cache()
+
+
+@pytest.mark.asyncio
+async def test_repeated_small_talk_skips_the_llm(cache, build_app):
+    llm = SlowLLM()
+    app = build_app(llm)
+
+    async def turn(thread, text):
+        config = {"configurable": {"thread_id": thread}}
+        started = time.perf_counter()
+        result = await app.ainvoke({"messages": [HumanMessage(text)]}, config)
+        return result["messages"][-1], time.perf_counter() - started
+
+    first, cold = await turn("a", "Oi!")
+    second, warm = await turn("b", "oiii")
+    assert llm.calls == 1
+    assert second.content == first.content == "reply #1"
+    assert second.response_metadata == {"response_cache": True}
+
+    # Other personas keep their own replies
+    other = build_app(
+        llm, Personality(name="Jane", byline="", identity=[], behavior=[])
+    )
+    config = {"configurable": {"thread_id": "c"}}
+    await other.ainvoke({"messages": [HumanMessage("oi")]}, config)
+    assert llm.calls == 2
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["latency_saved"] >= LLM_LATENCY
+    print(
+        f"\nCold turn: {cold * 1000:.1f}ms, cached turn: {warm * 1000:.1f}ms, "
+        f"hit rate {stats['hit_rate']:.0%}"
+    )
+    assert warm < cold
+
+
+def test_sync_path_and_non_cacheable_turns(cache, build_app):
+    selfie_call = AIMessage(
+        content="",
+        tool_calls=[{"name": "SelfieTool", "args": {"description": "x"}, "id": "c1"}],
+    )
+    llm = SlowLLM([selfie_call, AIMessage(content="here!")])
+    app = build_app(llm)
+    config = {"configurable": {"thread_id": "sync"}}
+
+    with patch("src.tools.SelfieTool._run", return_value=("sent", None)):
+        app.invoke({"messages": [HumanMessage("selfie")]}, config)
+    # Neither the tool call nor the reply after the tool result was cached
+    assert cache.stats()["entries"] == 0
+    assert isinstance(app.get_state(config).values["messages"][-2], ToolMessage)
+
+    def first_turn(thread, content):
+        config = {"configurable": {"thread_id": thread}}
+        return app.invoke({"messages": [HumanMessage(content)]}, config)
+
+    long_text = "tell me " + "a very long story " * 5
+    first_turn("long-1", long_text)
+    first_turn("long-2", long_text)
+    first_turn("parts", [{"type": "text", "text": "oi"}])
+    assert cache.stats()["entries"] == 0
+
+    # Small talk inside an ongoing chat is not stored either
+    app.invoke({"messages": [HumanMessage("boa noite")]}, config)
+    assert cache.stats()["entries"] == 0
+
+    first_turn("new", "boa noite")
+    reply = first_turn("newer", "Boa noite!")
+    assert reply["messages"][-1].content == "reply #7"
+    assert llm.calls == 7
+    # ... nor answered from the cache
+    reply = app.invoke({"messages": [HumanMessage("Boa noite!")]}, config)
+    assert reply["messages"][-1].content == "reply #8"
+
+
+@pytest.mark.asyncio
+async def test_chats_never_share_a_personalized_reply(cache, build_app):
+    llm = SlowLLM(
+        [
+            AIMessage(content="Nice to meet you, Ana!"),
+            AIMessage(content="Oi Ana, how was the dentist?"),
+            AIMessage(content="Oi! Who are you?"),
+            AIMessage(content="Oi again, Ana!"),
+        ]
+    )
+    app = build_app(llm)
+
+    async def turn(thread, text):
+        config = {"configurable": {"thread_id": thread}}
+        result = await app.ainvoke({"messages": [HumanMessage(text)]}, config)
+        return result["messages"][-1].content
+
+    await turn("ana", "I'm Ana, back from the dentist")
+    assert await turn("ana", "oi") == "Oi Ana, how was the dentist?"
+    # The reply above was written with Ana's history in the prompt
+    assert await turn("bruno", "oi") == "Oi! Who are you?"
+    assert llm.calls == 3
+    # A chat with history never gets the reply written for a stranger
+    assert await turn("ana", "oi!") == "Oi again, Ana!"
+    assert llm.calls == 4
+    # while another chat's first turn reuses it
+    assert await turn("carla", "Oi") == "Oi! Who are you?"
+    assert llm.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_small_talk_after_the_same_exchange_uses_the_cache(cache, build_app):
+    llm = SlowLLM()
+    app = build_app(llm)
+
+    async def turn(thread, *messages):
+        config = {"configurable": {"thread_id": thread}}
+        result = await app.ainvoke({"messages": list(messages)}, config)
+        return result["messages"][-1].content
+
+    assert await turn("a", HumanMessage("oi")) == "reply #1"
+    assert await turn("a", HumanMessage("boa noite")) == "reply #2"
+    # Same first exchange, user text and reply, so the same second reply
+    assert await turn("b", HumanMessage("Oi!")) == "reply #1"
+    assert await turn("b", HumanMessage("Boa noite!")) == "reply #2"
+    assert llm.calls == 2
+
+    # A chat with unrelated history never gets a reply written without it
+    intro = HumanMessage("I'm Bruno and I just moved to Lisbon, say hi")
+    assert await turn("c", intro) == "reply #3"
+    assert await turn("c", HumanMessage("boa noite")) == "reply #4"
+    assert await turn("c", HumanMessage("oi")) == "reply #5"
+    # nor does a chat longer than the context turns, even one matching "a"
+    assert await turn("a", HumanMessage("oi")) == "reply #6"
+    assert llm.calls == 6
+
+    # Without context turns, only first messages use the cache
+    with patch.object(Config, "RESPONSE_CACHE_CONTEXT_TURNS", 0):
+        assert await turn("d", HumanMessage("oi")) == "reply #1"
+        assert await turn("d", HumanMessage("boa noite")) == "reply #7"
+    assert llm.calls == 7
+
+    # Turns the scope cannot describe are never answered from the cache
+    picture = HumanMessage([{"type": "text", "text": "oi"}])
+    assert await turn("e", picture) == "reply #8"
+    assert await turn("e", HumanMessage("boa noite")) == "reply #9"
+    assert llm.calls == 9
@@ -0,0 +1,146 @@
+import logging
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agent import create_agent
+from src.config import Config, Personality
+from src.router import needs_escalation, route_text
+from src.telemetry import metrics
+
+# --- Tests for src/router.py and the model cascade in src/agent.py ---
+
+
+@pytest.mark.parametrize(
+    "text, tier, reason",
+    [
+        ("lol ok 😂", "fast", "small talk"),
+        ("boa noite", "fast", "small talk"),
+        ("oi, tudo bem?", "fast", "small talk"),
+        ("manda uma FOTO?", "flagship", "media"),
+        ("me manda um áudio", "flagship", "media"),
+        ("Por que você sumiu?", "flagship", "hard"),
+        ("tá bom? sério?", "flagship", "hard"),
+        ("haha " * 20, "flagship", "long"),
+    ],
+)
+def test_route_text(text, tier, reason):
+    route = route_text(text, max_chars=80)
+    assert (route.tier, route.reason) == (tier, reason)
+
+
+def test_needs_escalation():
+    assert needs_escalation("")
+    assert needs_escalation("Vou te mandar uma foto agora!")
+    assert needs_escalation("wanna hear my voice?")
+    assert not needs_escalation("haha sim, boa noite 💕")
+
+
+def model(reply=None, error=None):
+    llm = MagicMock()
+    llm.bind_tools.return_value = llm
+    if error:
+        llm.invoke.side_effect = error
+        llm.ainvoke = AsyncMock(side_effect=error)
+    else:
+        llm.invoke.return_value = AIMessage(content=reply)
+        llm.ainvoke = AsyncMock(return_value=AIMessage(content=reply))
+    return llm
+
+
+def cascade_agent(fast, flagship):
+    models = {Config.GOOGLE_FAST_MODEL: fast, Config.GOOGLE_MODEL: flagship}
+    personality = Personality(name="Cascade", byline="", identity=[], behavior=[])
+    with (
+        patch.object(Config, "LLM_PROVIDER", "google"),
+        patch.object(Config, "MODEL_CASCADE", True),
+        patch(
+            "src.agent.ChatGoogleGenerativeAI",
+            side_effect=lambda **kwargs: models[kwargs["model"]],
+        ),
+    ):
+        return create_agent(personality)
+
+
+def run(app, text, thread="t"):
+    inputs = {"messages": [HumanMessage(content=text)]}
+    result = app.invoke(inputs, {"configurable": {"thread_id": thread}})
+    return result["messages"][-1].content
+
+
+def test_small_talk_is_answered_by_the_fast_model_without_tools():
+    fast, flagship = model("kkkk 😂"), model("flagship")
+    app = cascade_agent(fast, flagship)
+    routed = metrics.get("model_routes_total").value(tier="fast", reason="small talk")
+
+    assert run(app, "lol ok 😂") == "kkkk 😂"
+    # The fast model is called directly, not through bind_tools' binding.
+    assert fast.invoke.called and not flagship.invoke.called
+    total = metrics.get("model_routes_total").value(tier="fast", reason="small talk")
+    assert total == routed + 1
+    assert metrics.get("model_tier_seconds").count(tier="fast") >= 1
+
+    assert run(app, "manda uma selfie") == "flagship"
+    assert flagship.invoke.call_count == 1
+
+
+def test_unusable_fast_replies_are_escalated():
+    fast, flagship = model("vou te mandar uma foto!"), model("📸 aqui")
+    app = cascade_agent(fast, flagship)
+    escalations = metrics.get("model_escalations_total").value()
+
+    assert run(app, "oi") == "📸 aqui"
+    assert metrics.get("model_escalations_total").value() == escalations + 1
+
+    broken = cascade_agent(model(error=ConnectionError("down")), model("ok"))
+    assert run(broken, "oi") == "ok"
+
+
+@pytest.mark.asyncio
+async def test_async_cascade():
+    fast, flagship = model(""), model("flagship")
+    app = cascade_agent(fast, flagship)
+    config = {"configurable": {"thread_id": "async"}}
+
+    result = await app.ainvoke({"messages": [HumanMessage(content="oi")]}, config)
+    assert result["messages"][-1].content == "flagship"
+    assert fast.ainvoke.await_count == 1
+
+    fast.ainvoke = AsyncMock(return_value=AIMessage(content="oii"))
+    result = await app.ainvoke({"messages": [HumanMessage(content="oi")]}, config)
+    assert result["messages"][-1].content == "oii"
+
+    app = cascade_agent(model(error=ConnectionError("down")), flagship)
+    result = await app.ainvoke({"messages": [HumanMessage(content="oi")]}, config)
+    assert result["messages"][-1].content == "flagship"
+
+
+def test_non_text_turns_go_to_the_flagship():
+    fast, flagship = model("fast"), model("flagship")
+    app = cascade_agent(fast, flagship)
+    picture = HumanMessage(content=[{"type": "text", "text": "oi"}])
+    result = app.invoke(
+        {"messages": [picture]}, {"configurable": {"thread_id": "multi"}}
+    )
+    assert result["messages"][-1].content == "flagship"
+    assert not fast.invoke.called
+
+
+def test_flagship_is_not_timed_without_a_cascade(caplog):
+    samples = metrics.get("model_tier_seconds").count(tier="flagship")
+    personality = Personality(name="Plain", byline="", identity=[], behavior=[])
+    with (
+        patch.object(Config, "LLM_PROVIDER", "google"),
+        patch("src.agent.ChatGoogleGenerativeAI", return_value=model("oi")),
+    ):
+        app = create_agent(personality)
+
+    with caplog.at_level(logging.INFO, logger="src.agent"):
+        assert run(app, "oi", thread="plain") == "oi"
+    assert metrics.get("model_tier_seconds").count(tier="flagship") == samples
+    assert "model replied" not in caplog.text
+
+    app = cascade_agent(model("fast"), model("flagship"))
+    assert run(app, "manda uma selfie") == "flagship"
+    assert metrics.get("model_tier_seconds").count(tier="flagship") == samples + 1
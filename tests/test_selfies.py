@@ -0,0 +1,313 @@
+import asyncio
+import io
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from src import selfies
+from src.artifacts import ArtifactStore
+from src.cache import DiskCache
+from src.config import Config, Personality
+from src.encoders import ImageOptions
+from src.selfies import SelfieService, SelfieUnavailable, get_selfie_service
+from src.telemetry import metrics
+from src.tools import SELFIE_SENT, SelfieTool
+
+# --- Tests for src/selfies.py and SelfieTool's use of it ---
+
+
+def png(width, height):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 90)).save(output, "PNG")
+    return output.getvalue()
+
+
+class FakeImagen:
+    """Counts generations; each one waits until ``release`` is set."""
+
+    def __init__(self, image=None) -> None:
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.image = image or png(64, 64)
+
+    async def __call__(self, prompt):
+        self.calls.append(prompt)
+        await self.release.wait()
+        return self.image
+
+
+def make_service(tmp_path, clock=time.monotonic, **overrides):
+    options = {
+        "workers": 2,
+        "queue_size": 4,
+        "rate_limit": 10,
+        "rate_window": 3600,
+        "image": ImageOptions(max_side=32),
+        **overrides,
+    }
+    cache = DiskCache(str(tmp_path / "selfies"), 1024 * 1024, suffix=".jpg")
+    return SelfieService(cache, clock=clock, **options)
+
+
+@pytest.mark.asyncio
+async def test_generated_selfies_are_cached_per_scope(tmp_path):
+    service = make_service(tmp_path)
+    imagen = FakeImagen()
+
+    first = await service.get("chat-1", "sacha", "beach", imagen)
+    again = await service.get("chat-2", "sacha", "beach", imagen)
+    other = await service.get("chat-1", "jane", "beach", imagen)
+
+    assert imagen.calls == ["beach", "beach"]
+    assert first.path == again.path != other.path
+    with Image.open(first.path) as image:
+        assert image.format == "JPEG"
+        assert max(image.size) == 32
+    assert service.cache.stats()["hits"] == 1
+    assert service.stats()["generated"] == 2
+    text = metrics.render()
+    assert 'selfie_image_bytes_count{stage="processed"}' in text
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_in_flight_share_one_generation(tmp_path):
+    service = make_service(tmp_path)
+    imagen = FakeImagen()
+    imagen.release.clear()
+
+    requests = [
+        asyncio.create_task(service.get(f"chat-{n}", "sacha", "beach", imagen))
+        for n in range(3)
+    ]
+    await asyncio.sleep(0.01)
+    assert service.pending == 1
+    imagen.release.set()
+    results = await asyncio.gather(*requests)
+
+    assert imagen.calls == ["beach"]
+    assert len({result.path for result in results}) == 1
+    assert service.stats() == {
+        "pending": 0,
+        "generated": 1,
+        "deduplicated": 2,
+        "rate_limited": 0,
+        "rejected": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_cancelled_joiner_does_not_cancel_the_generation(tmp_path):
+    service = make_service(tmp_path)
+    imagen = FakeImagen()
+    imagen.release.clear()
+
+    owner, quitter, joiner = [
+        asyncio.create_task(service.get(f"chat-{n}", "sacha", "beach", imagen))
+        for n in range(3)
+    ]
+    await asyncio.sleep(0.01)
+    quitter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await quitter
+    imagen.release.set()
+
+    selfie, joined = await asyncio.gather(owner, joiner)
+    assert selfie.path is not None
+    assert joined.path == selfie.path
+    assert service.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_failures_reach_every_waiter_and_are_not_cached(tmp_path):
+    service = make_service(tmp_path)
+    release = asyncio.Event()
+
+    async def failing(prompt):
+        await release.wait()
+        raise RuntimeError("quota exceeded")
+
+    requests = [
+        asyncio.create_task(service.get(f"chat-{n}", "sacha", "beach", failing))
+        for n in range(2)
+    ]
+    await asyncio.sleep(0.01)
+    release.set()
+    results = await asyncio.gather(*requests, return_exceptions=True)
+    assert [str(r) for r in results] == ["quota exceeded"] * 2
+    assert service.pending == 0
+
+    imagen = FakeImagen()
+    assert (await service.get("chat-1", "sacha", "beach", imagen)).path
+    assert imagen.calls == ["beach"]
+
+
+@pytest.mark.asyncio
+async def test_undecodable_output_is_returned_raw_and_not_cached(tmp_path):
+    service = make_service(tmp_path)
+    imagen = FakeImagen(image=b"raw bytes")
+    selfie = await service.get("chat", "sacha", "beach", imagen)
+    assert selfie.path is None
+    assert selfie.image == b"raw bytes"
+    assert service.cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_per_chat(tmp_path, clock):
+    service = make_service(tmp_path, clock, rate_limit=2, rate_window=600)
+    imagen = FakeImagen()
+
+    await service.get("chat-1", "sacha", "one", imagen)
+    clock.now = 100
+    await service.get("chat-1", "sacha", "two", imagen)
+    with pytest.raises(SelfieUnavailable, match="try again in 9 min"):
+        await service.get("chat-1", "sacha", "three", imagen)
+    # Other chats and cached prompts are not limited
+    await service.get("chat-2", "sacha", "three", imagen)
+    await service.get("chat-1", "sacha", "one", imagen)
+
+    clock.now = 601
+    await service.get("chat-1", "sacha", "four", imagen)
+    assert service.stats()["rate_limited"] == 1
+
+    # Chats idle for a whole window are forgotten
+    clock.now = 2000
+    await service.get("chat-3", "sacha", "five", imagen)
+    assert set(service._requests) == {"chat-3"}
+
+
+@pytest.mark.asyncio
+async def test_backlog_is_bounded(tmp_path):
+    service = make_service(tmp_path, workers=1, queue_size=1)
+    imagen = FakeImagen()
+    imagen.release.clear()
+
+    running = asyncio.create_task(service.get("a", "s", "one", imagen))
+    queued = asyncio.create_task(service.get("b", "s", "two", imagen))
+    await asyncio.sleep(0.01)
+    # One generation runs while the other waits for the single worker
+    assert imagen.calls == ["one"]
+    with pytest.raises(SelfieUnavailable, match="Too many selfies"):
+        await service.get("c", "s", "three", imagen)
+
+    imagen.release.set()
+    await asyncio.gather(running, queued)
+    assert imagen.calls == ["one", "two"]
+    assert service.stats()["rejected"] == 1
+
+
+def test_get_selfie_service_uses_config(tmp_path):
+    with (
+        patch.object(selfies, "_service", None),
+        patch.object(Config, "SELFIE_CACHE_DIR", str(tmp_path / "lazy")),
+        patch.object(Config, "SELFIE_WORKERS", 3),
+        patch.object(Config, "SELFIE_FORMAT", "webp"),
+        patch.object(Config, "SELFIE_MAX_KB", 100),
+    ):
+        service = get_selfie_service()
+        assert get_selfie_service() is service
+        assert service.workers == 3
+        assert service.image == ImageOptions(format="webp", max_bytes=100 * 1024)
+        assert service.cache.suffix == ".webp"
+        assert service.cache.directory == tmp_path / "lazy"
+
+        text = metrics.render()
+        assert "selfies_pending 0.0" in text
+        assert 'selfie_requests_total{result="generated"} 0.0' in text
+        assert 'cache_requests_total{cache="selfies",result="hit"} 0.0' in text
+
+
+@pytest.fixture
+def artifact_store():
+    store = ArtifactStore(spill_bytes=1024, ttl=60)
+    with patch("src.artifacts._store", store):
+        yield store
+
+
+@pytest.mark.asyncio
+async def test_selfie_tool_uses_chat_and_persona(tmp_path, artifact_store):
+    service = make_service(tmp_path, rate_limit=1)
+    client = MagicMock()
+    response = MagicMock()
+    response.generated_images[0].image.image_bytes = png(64, 64)
+    client.aio.models.generate_images = AsyncMock(return_value=response)
+    personality = Personality(name="Sacha", byline="", identity=[], behavior=[])
+
+    async def call(thread_id, description):
+        config = {"configurable": {"thread_id": thread_id, "personality": personality}}
+        return await SelfieTool().ainvoke(
+            {
+                "type": "tool_call",
+                "name": "SelfieTool",
+                "args": {"description": description},
+                "id": "call-1",
+            },
+            config,
+        )
+
+    with (
+        patch.object(selfies, "_service", service),
+        patch.object(SelfieTool, "_get_client", lambda self: client),
+    ):
+        first = await call("42", "beach")
+        cached = await call("43", "beach")
+        limited = await call("42", "park")
+
+    assert first.content == cached.content == SELFIE_SENT
+    artifact = artifact_store.get(first.artifact["artifact_id"])
+    key = DiskCache.make_key("Sacha", "beach", service.image.key())
+    assert artifact.filename == service.cache.path_for(key).name
+    assert client.aio.models.generate_images.await_count == 1
+    assert "Selfie limit reached" in limited.content
+    assert limited.artifact is None
+
+
+@pytest.mark.asyncio
+async def test_sync_path_refuses_to_block_a_running_loop():
+    with patch.object(SelfieTool, "_get_client", lambda self: MagicMock()):
+        result, media = SelfieTool()._run("beach")
+    assert "Async event loop already running" in result
+    assert media is None
+
+
+def test_sync_calls_respect_selfie_workers(tmp_path, artifact_store):
+    service = make_service(tmp_path, workers=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def generate_images(**kwargs):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        response = MagicMock()
+        response.generated_images[0].image.image_bytes = png(64, 64)
+        return response
+
+    client = MagicMock()
+    client.models.generate_images = generate_images
+    results = []
+
+    def call(description):
+        results.append(SelfieTool()._run(description))
+
+    with (
+        patch.object(selfies, "_service", service),
+        patch.object(SelfieTool, "_get_client", lambda self: client),
+    ):
+        # Each sync call runs on its own event loop
+        threads = [threading.Thread(target=call, args=(f"pose {n}",)) for n in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert [content for content, _ in results] == [SELFIE_SENT] * 5
+    assert max(peak) == 2
+    assert service.generated == 5
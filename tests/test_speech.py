@@ -0,0 +1,162 @@
+import asyncio
+import io
+import time
+import wave
+from contextlib import aclosing
+from unittest.mock import patch
+
+import av
+import pytest
+
+from benchmarks.stubs import VOICE_SECONDS, encode_mp3, speech_pcm
+from src.speech import (
+    edge_tts_synthesizer,
+    split_sentences,
+    stream_speech,
+    to_ogg_opus,
+)
+
+# --- Tests for src/speech.py ---
+
+SENTENCE_LATENCY = 0.05
+
+
+def test_split_sentences_merges_short_pieces():
+    text = "Hi! Oh.  I missed you so much today, you have no idea.\nTell me everything"
+    assert split_sentences(text, min_chars=10) == [
+        "Hi! Oh. I missed you so much today, you have no idea.",
+        "Tell me everything",
+    ]
+    assert split_sentences("One. Two. Three.", min_chars=1) == [
+        "One.",
+        "Two.",
+        "Three.",
+    ]
+    assert split_sentences("  \n ") == []
+
+
+class FakeSynthesizer:
+    """Waits ``latency`` per sentence, then yields it as two chunks."""
+
+    def __init__(self, latency=SENTENCE_LATENCY, fail_on=None, slow=()):
+        self.latency = latency
+        self.slow = slow
+        self.fail_on = fail_on
+        self.started = []
+        self.cancelled = []
+
+    async def __call__(self, sentence):
+        self.started.append(sentence)
+        try:
+            await asyncio.sleep(self.latency * (3 if sentence in self.slow else 1))
+        except asyncio.CancelledError:
+            self.cancelled.append(sentence)
+            raise
+        if sentence == self.fail_on:
+            raise RuntimeError(f"failed on {sentence}")
+        yield f"<{sentence}".encode()
+        yield b">"
+
+
+SENTENCES = [f"This is sentence number {n} of a long voice reply." for n in range(6)]
+SIX = " ".join(SENTENCES)
+
+
+async def collect(text, synthesize, depth):
+    started = time.perf_counter()
+    first = None
+    audio = b""
+    async for data in stream_speech(text, synthesize, depth):
+        if first is None:
+            first = time.perf_counter() - started
+        audio += data
+    return audio, first, time.perf_counter() - started
+
+
+@pytest.mark.asyncio
+async def test_sentences_are_synthesized_ahead_and_joined_in_order():
+    synthesize = FakeSynthesizer()
+    audio, first, total = await collect(SIX, synthesize, depth=3)
+    # One request for the whole text, as before sentences were pipelined
+    whole = FakeSynthesizer(latency=SENTENCE_LATENCY * 6)
+    _, whole_first, _ = await collect(SIX, whole, depth=1)
+
+    print(
+        f"\nSix sentences: first audio {first * 1000:.0f}ms, "
+        f"all {total * 1000:.0f}ms (sequential {6 * SENTENCE_LATENCY * 1000:.0f}ms)"
+    )
+    assert audio == b"".join(f"<{sentence}>".encode() for sentence in SENTENCES)
+    assert first < 2 * SENTENCE_LATENCY < whole_first
+    assert total < 4 * SENTENCE_LATENCY
+
+
+@pytest.mark.asyncio
+async def test_depth_bounds_the_work_ahead():
+    synthesize = FakeSynthesizer(slow=SENTENCES[1:])
+    async with aclosing(stream_speech(SIX, synthesize, depth=2)) as chunks:
+        assert await anext(chunks) == f"<{SENTENCES[0]}".encode()
+        assert synthesize.started == SENTENCES[:2]
+    # Closing early cancels the sentence synthesized ahead
+    assert synthesize.cancelled == SENTENCES[1:2]
+
+
+@pytest.mark.asyncio
+async def test_failures_stop_the_stream():
+    synthesize = FakeSynthesizer(fail_on=SENTENCES[1], slow=SENTENCES[2:])
+    with pytest.raises(RuntimeError, match="sentence number 1"):
+        await collect(SIX, synthesize, depth=3)
+    # Everything synthesized ahead is cancelled, however far it had got
+    assert SENTENCES[2] in synthesize.cancelled
+    assert synthesize.cancelled == synthesize.started[2:]
+
+
+@pytest.mark.asyncio
+async def test_edge_tts_synthesizer_yields_audio_only():
+    async def stream():
+        yield {"type": "audio", "data": b"a"}
+        yield {"type": "WordBoundary", "offset": 0, "duration": 1, "text": "hi"}
+        yield {"type": "audio", "data": b"b"}
+
+    with patch("src.speech.edge_tts.Communicate") as communicate:
+        communicate.return_value.stream = stream
+        synthesize = edge_tts_synthesizer("en-US", "+10%", "-5Hz")
+        assert [data async for data in synthesize("hi")] == [b"a", b"b"]
+    communicate.assert_called_once_with("hi", "en-US", rate="+10%", pitch="-5Hz")
+
+
+def test_to_ogg_opus_shrinks_speech():
+    mp3 = encode_mp3(speech_pcm(VOICE_SECONDS))
+    ogg = to_ogg_opus(mp3, 24000)
+    print(f"\n{VOICE_SECONDS:g}s clip: MP3 {len(mp3)} bytes, OGG/Opus {len(ogg)} bytes")
+    assert len(ogg) < 0.6 * len(mp3)
+    with av.open(io.BytesIO(ogg), "r") as container:
+        assert container.format.name == "ogg"
+        stream = container.streams.audio[0]
+        assert stream.codec_context.name == "opus"
+        assert stream.channels == 1
+        assert abs(float(container.duration / av.time_base) - VOICE_SECONDS) < 0.2
+    with pytest.raises(ValueError):
+        to_ogg_opus(b"not audio", 24000)
+
+
+def test_to_ogg_opus_skips_damaged_packets(caplog):
+    clip = encode_mp3(speech_pcm(1.0))
+    # An ID3 tag left between two concatenated clips
+    tag = b"ID3\x04\x00\x00\x00\x00\x00\x0a" + bytes(10)
+    ogg = to_ogg_opus(clip + tag + clip, 24000)
+    assert "undecodable audio packets" in caplog.text
+    with av.open(io.BytesIO(ogg), "r") as container:
+        assert float(container.duration / av.time_base) > 1.8
+
+
+def test_to_ogg_opus_resamples_other_rates():
+    wav = io.BytesIO()
+    with wave.open(wav, "wb") as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(16000)
+        output.writeframes(speech_pcm(1.0))
+    ogg = to_ogg_opus(wav.getvalue(), 24000)
+    with av.open(io.BytesIO(ogg), "r") as container:
+        # speech_pcm made 1s at 24 kHz, which lasts 1.5s at 16 kHz
+        assert abs(float(container.duration / av.time_base) - 1.5) < 0.1
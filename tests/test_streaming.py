@@ -0,0 +1,226 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from telegram import Update
+from telegram.error import RetryAfter
+
+from src.agent import create_agent
+from src.config import Config, Personality
+from src.main import chat_queue, cli_loop, handle_message
+from src.streaming import ConsolePrinter, TelegramStreamer, stream_reply
+
+# --- Tests for src/streaming.py ---
+
+
+class FakeStreamingLLM(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class FakeAgent:
+    """Replays a scripted astream: token chunks with optional delays."""
+
+    def __init__(self, chunks, final, delay=0.0):
+        self.chunks = chunks
+        self.final = final
+        self.delay = delay
+
+    async def astream(self, inputs, config, stream_mode):
+        for node, chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield "messages", (chunk, {"langgraph_node": node})
+        yield "values", self.final
+
+
+def chunk(text, id="m1"):
+    return AIMessageChunk(content=text, id=id)
+
+
+@pytest.mark.asyncio
+async def test_stream_reply_through_real_graph():
+    llm = FakeStreamingLLM(messages=iter([AIMessage(content="hello there friend")]))
+    personality = Personality(name="Streamy", byline="", identity=[], behavior=[])
+    with patch.object(Config, "LLM_PROVIDER", "google"):
+        with patch("src.agent.ChatGoogleGenerativeAI", return_value=llm):
+            app = create_agent(personality)
+
+    seen = []
+
+    async def on_text(text):
+        seen.append(text)
+
+    final = await stream_reply(
+        app,
+        {"messages": [HumanMessage(content="hi")]},
+        {"configurable": {"thread_id": "s"}},
+        on_text,
+    )
+    assert seen[0] == "hello"
+    assert seen[-1] == "hello there friend"
+    assert len(seen) > 1
+    assert final["messages"][-1].content == "hello there friend"
+
+
+@pytest.mark.asyncio
+async def test_stream_reply_skips_other_nodes_and_resets_per_message():
+    agent = FakeAgent(
+        [
+            ("chatbot", chunk("let me take a pic", id="first")),
+            ("tools", chunk("IMAGE_GENERATED:x.png", id="tool")),
+            ("chatbot", chunk("", id="second")),
+            ("chatbot", chunk("here ", id="second")),
+            ("chatbot", chunk("you go", id="second")),
+        ],
+        final={"messages": [AIMessage(content="here you go")]},
+    )
+    seen = []
+
+    async def on_text(text):
+        seen.append(text)
+
+    await stream_reply(agent, {}, {}, on_text)
+    assert seen == ["let me take a pic", "here ", "here you go"]
+
+
+@pytest.mark.asyncio
+async def test_telegram_streamer_throttles_edits(clock):
+    sent = MagicMock()
+    sent.edit_text = AsyncMock()
+    message = MagicMock()
+    message.reply_text = AsyncMock(return_value=sent)
+    streamer = TelegramStreamer(message, min_interval=1.0, clock=clock)
+
+    await streamer.push("   ")
+    message.reply_text.assert_not_called()
+
+    clock.now = 0.2
+    await streamer.push("Hi")
+    message.reply_text.assert_awaited_once_with("Hi")
+    assert streamer.time_to_first_token == pytest.approx(0.2)
+
+    clock.now = 0.5
+    await streamer.push("Hi the")  # too soon, batched
+    sent.edit_text.assert_not_called()
+
+    clock.now = 1.3
+    await streamer.push("Hi there")
+    sent.edit_text.assert_awaited_once_with("Hi there")
+
+    await streamer.finish("Hi there")  # unchanged text is not re-sent
+    clock.now = 1.4
+    await streamer.finish("Hi there!")
+    assert streamer.edits == 2
+    assert sent.edit_text.await_args.args == ("Hi there!",)
+
+
+@pytest.mark.asyncio
+async def test_telegram_streamer_backs_off_on_retry_after(clock):
+    sent = MagicMock()
+    sent.edit_text = AsyncMock(side_effect=RetryAfter(timedelta(seconds=5)))
+    message = MagicMock()
+    message.reply_text = AsyncMock(return_value=sent)
+    streamer = TelegramStreamer(message, min_interval=1.0, clock=clock)
+
+    await streamer.push("a")
+    clock.now = 2.0
+    await streamer.push("ab")
+    assert streamer.next_edit == 7.0
+
+    sent.edit_text.side_effect = RetryAfter(3)
+    await streamer.finish("abc")
+    assert streamer.next_edit == 5.0
+    assert streamer.shown == "a"
+
+
+@pytest.mark.asyncio
+async def test_telegram_streamer_finish_without_tokens_and_truncates():
+    message = MagicMock()
+    message.reply_text = AsyncMock()
+    streamer = TelegramStreamer(message, min_interval=1.0)
+    await streamer.finish("x" * 5000)
+    message.reply_text.assert_awaited_once_with("x" * 4096)
+
+
+@pytest.mark.asyncio
+async def test_console_printer(capsys):
+    printer = ConsolePrinter("Sacha")
+    await printer.push("Hel")
+    await printer.push("Hello")
+    await printer.push("Other")
+    printer.finish("Other!")
+    out = capsys.readouterr().out
+    assert out == "Sacha: Hello\nSacha: Other!\n"
+    assert printer.time_to_first_token is not None
+
+    printer = ConsolePrinter("Sacha")
+    printer.finish("no stream")
+    await ConsolePrinter("Sacha").push("abc")
+    capsys.readouterr()
+
+    printer = ConsolePrinter("Sacha")
+    await printer.push("abc")
+    printer.finish("xyz")
+    assert capsys.readouterr().out == "Sacha: abc\nSacha: xyz\n"
+
+
+@pytest.mark.asyncio
+async def test_handle_message_streams_first_token_early():
+    agent = FakeAgent(
+        [("chatbot", chunk(word)) for word in ("one ", "two ", "three")],
+        final={"messages": [AIMessage(content="one two three")]},
+        delay=0.1,
+    )
+    loop = asyncio.get_running_loop()
+    first_reply_at = []
+    sent = MagicMock()
+    sent.edit_text = AsyncMock()
+
+    async def reply_text(text):
+        first_reply_at.append(loop.time())
+        return sent
+
+    update = MagicMock(spec=Update)
+    update.effective_chat.id = 7
+    update.message.text = "count"
+    update.message.reply_text = AsyncMock(side_effect=reply_text)
+    context = MagicMock()
+    context.user_data = {}
+    context.bot.send_chat_action = AsyncMock()
+
+    with (
+        patch("src.main.get_agent_for_user", return_value=agent),
+        patch.object(Config, "STREAM_REPLIES", True),
+        patch.object(Config, "STREAM_EDIT_INTERVAL", 0),
+        patch.object(chat_queue, "debounce", 0),
+    ):
+        start = loop.time()
+        await handle_message(update, context)
+        total = loop.time() - start
+
+    update.message.reply_text.assert_awaited_once_with("one ")
+    assert sent.edit_text.await_args.args == ("one two three",)
+    # The first token reaches the user after one chunk, not the full generation.
+    time_to_first_token = first_reply_at[0] - start
+    print(f"\nTTFT {time_to_first_token:.3f}s vs full reply {total:.3f}s")
+    assert time_to_first_token < total / 2
+
+
+@pytest.mark.asyncio
+async def test_cli_loop_streams_reply(capsys):
+    agent = FakeAgent(
+        [("chatbot", chunk("hey ")), ("chatbot", chunk("you"))],
+        final={"messages": [AIMessage(content="hey you")]},
+    )
+    with (
+        patch("builtins.input", side_effect=["sacha", "hi", "quit"]),
+        patch("src.main.personalities", {"sacha": MagicMock()}),
+        patch("src.main.get_agent_for_user", return_value=agent),
+        patch.object(Config, "STREAM_REPLIES", True),
+    ):
+        await cli_loop()
+
+    assert "sacha: hey you\n" in capsys.readouterr().out
@@ -0,0 +1,309 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import unused_port
+from telegram import Update
+from telegram.error import NetworkError
+
+from src.config import Config
+from src.supervisor import (
+    Supervisor,
+    chat_id_of,
+    poll_updates,
+    run_worker,
+    shard_for,
+    supervise,
+)
+
+# --- Tests for src/supervisor.py ---
+
+fork = multiprocessing.get_context("fork")
+
+
+class FakeApplication:
+    """Stands in for a worker's PTB application and reports what it got."""
+
+    def __init__(self, sink) -> None:
+        self.sink = sink
+        self.bot = None
+        self.update_queue = self
+        self.events = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.events.append("shutdown")
+
+    async def start(self):
+        self.events.append("start")
+
+    async def stop(self):
+        self.events.append("stop")
+
+    async def put(self, update):
+        self.sink.put((os.getpid(), update.update_id, update.effective_chat.id))
+
+
+def message(update_id, chat_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": "hi",
+        },
+    }
+
+
+def drain(sink, count, timeout=10.0):
+    items = []
+    deadline = time.monotonic() + timeout
+    while len(items) < count and time.monotonic() < deadline:
+        try:
+            items.append(sink.get(timeout=0.1))
+        except queue.Empty:
+            pass
+    return items
+
+
+def test_chat_id_of_common_update_types():
+    assert chat_id_of(message(1, -100)) == -100
+    callback = {"update_id": 2, "callback_query": {"message": {"chat": {"id": 7}}}}
+    assert chat_id_of(callback) == 7
+    inline = {"update_id": 3, "inline_query": {"from": {"id": 9}}}
+    assert chat_id_of(inline) == 9
+    assert chat_id_of({"update_id": 4, "poll": {"id": "x"}}) is None
+
+
+def test_updates_without_a_chat_are_spread_across_shards():
+    supervisor = Supervisor(3, factory=None, context=fork)
+    poll = {"update_id": 5, "poll": {"id": "x"}}
+    assert [supervisor.dispatch(poll) for _ in range(4)] == [0, 1, 2, 0]
+    # Chats still stay on their own shard
+    assert supervisor.dispatch(message(6, 4)) == 1
+    assert supervisor.dispatched == [2, 2, 1]
+
+
+def test_shard_for_is_stable_and_non_negative():
+    assert shard_for(10, 4) == shard_for(10, 4) == 2
+    assert 0 <= shard_for(-1001234, 4) < 4
+
+
+def test_run_worker_feeds_updates_until_sentinel(tmp_path):
+    inbox = queue.Queue()
+    for update_id in (1, 2):
+        inbox.put(message(update_id, 5))
+    inbox.put(None)
+    sink = queue.Queue()
+    received = fork.Value("L", 0)
+    apps = []
+
+    def factory(updater):
+        assert updater is False
+        apps.append(FakeApplication(sink))
+        return apps[0]
+
+    with (
+        patch.object(Config, "TTS_CACHE_DIR", str(tmp_path / "tts")),
+        patch.object(Config, "SELFIE_CACHE_DIR", str(tmp_path / "selfies")),
+    ):
+        run_worker(0, inbox, received, factory)
+        # Workers never share a cache directory.
+        assert Config.TTS_CACHE_DIR == str(tmp_path / "tts" / "shard-0")
+        assert Config.SELFIE_CACHE_DIR == str(tmp_path / "selfies" / "shard-0")
+
+    assert [update_id for _, update_id, _ in drain(sink, 2)] == [1, 2]
+    assert received.value == 2
+    assert apps[0].events == ["start", "stop", "shutdown"]
+
+
+def test_supervisor_shards_restarts_and_reports():
+    sink = fork.Queue()
+    supervisor = Supervisor(
+        2, lambda updater: FakeApplication(sink), context=fork, stop_timeout=5
+    )
+    supervisor.start()
+    try:
+        for update_id, chat_id in enumerate([1, 2, 3, 4, 1, 2], start=1):
+            supervisor.dispatch(message(update_id, chat_id))
+        first = drain(sink, 6)
+        pids = {chat_id: pid for pid, _, chat_id in first}
+        # Every chat sticks to one worker and both workers are used.
+        assert all(pids[chat_id] == pid for pid, _, chat_id in first)
+        assert pids[1] == pids[3] != pids[2] == pids[4]
+
+        # Graceful restart: updates queued before and during it are kept.
+        old_pid = supervisor.processes[0].pid
+        supervisor.dispatch(message(7, 2))
+        supervisor.restart(0)
+        supervisor.dispatch(message(8, 2))
+        assert {update_id for _, update_id, _ in drain(sink, 2)} == {7, 8}
+        assert supervisor.processes[0].pid != old_pid
+
+        # A crashed worker is respawned by check().
+        supervisor.processes[1].kill()
+        supervisor.processes[1].join()
+        assert supervisor.health()[0] is False
+        assert supervisor.check() == [1]
+        assert supervisor.check() == []
+
+        ready, details = supervisor.health()
+        assert ready
+        stats = details["workers"]
+        assert [worker["restarts"] for worker in stats] == [1, 1]
+        assert [worker["dispatched"] for worker in stats] == [5, 3]
+        assert stats[0]["received"] == 5
+        assert stats[0]["backlog"] == 0
+    finally:
+        supervisor.stop()
+    assert not any(process.is_alive() for process in supervisor.processes)
+
+
+def test_stuck_worker_is_terminated():
+    supervisor = Supervisor(1, MagicMock(), context=fork, stop_timeout=0.1)
+    supervisor.stop()  # nothing started yet
+    process = fork.Process(target=time.sleep, args=(30,), daemon=True)
+    process.start()
+    supervisor.processes[0] = process
+    supervisor.stop()
+    assert not process.is_alive()
+
+
+async def test_poll_updates_dispatches_and_retries():
+    supervisor = MagicMock()
+    update = Update.de_json(message(41, 3), None)
+    bot = MagicMock()
+    bot.get_updates = AsyncMock(
+        side_effect=[[update], NetworkError("down"), asyncio.CancelledError()]
+    )
+    with pytest.raises(asyncio.CancelledError):
+        await poll_updates(bot, supervisor, retry_delay=0)
+
+    supervisor.dispatch.assert_called_once_with(update.to_dict())
+    assert bot.get_updates.await_args.kwargs["offset"] == 42
+
+
+def fake_supervisor():
+    supervisor = MagicMock(spec=Supervisor)
+    supervisor.health.return_value = (True, {"workers": [{"shard": 0}]})
+    return supervisor
+
+
+async def test_supervise_webhook_mode():
+    supervisor = fake_supervisor()
+    bot = AsyncMock()
+    port = unused_port()
+    stop = asyncio.Event()
+    task = asyncio.create_task(
+        supervise(
+            supervisor,
+            bot,
+            webhook=True,
+            listen="127.0.0.1",
+            port=port,
+            url="https://bot.example.com",
+            stop=stop,
+            check_interval=0.01,
+        )
+    )
+    async with aiohttp.ClientSession() as session:
+        while not bot.set_webhook.await_count:
+            await asyncio.sleep(0.01)
+        async with session.post(
+            f"http://127.0.0.1:{port}/telegram", json=message(1, 5)
+        ) as response:
+            assert response.status == 200
+        async with session.get(f"http://127.0.0.1:{port}/healthz") as response:
+            assert (await response.json())["workers"] == [{"shard": 0}]
+
+        os.kill(os.getpid(), signal.SIGHUP)
+        while not supervisor.rolling_restart.called:
+            await asyncio.sleep(0.01)
+    stop.set()
+    await task
+
+    supervisor.start.assert_called_once()
+    supervisor.dispatch.assert_called_once_with(message(1, 5))
+    supervisor.check.assert_called()
+    supervisor.stop.assert_called_once()
+    assert (
+        bot.set_webhook.await_args.kwargs["url"] == "https://bot.example.com/telegram"
+    )
+
+
+async def test_supervise_polling_mode():
+    supervisor = fake_supervisor()
+    bot = AsyncMock()
+
+    async def long_poll(**kwargs):
+        await asyncio.sleep(3600)
+
+    bot.get_updates.side_effect = long_poll
+    stop = asyncio.Event()
+    task = asyncio.create_task(
+        supervise(supervisor, bot, False, "127.0.0.1", unused_port(), stop=stop)
+    )
+    while not bot.get_updates.await_count:
+        await asyncio.sleep(0.01)
+    stop.set()
+    await task
+
+    bot.delete_webhook.assert_awaited_once()
+    bot.set_webhook.assert_not_called()
+    supervisor.stop.assert_called_once()
+
+
+def test_rolling_restart_and_check_skip_restarting_shards():
+    supervisor = Supervisor(2, MagicMock(), context=fork)
+    with (
+        patch.object(supervisor, "_stop_worker") as mock_stop,
+        patch.object(supervisor, "_spawn") as mock_spawn,
+    ):
+        supervisor.rolling_restart()
+        assert [c.args for c in mock_stop.call_args_list] == [(0,), (1,)]
+        assert mock_spawn.call_count == 2
+
+        dead = MagicMock()
+        dead.is_alive.return_value = False
+        supervisor.processes = [dead, dead]
+        with supervisor._shard_locks[0]:
+            assert supervisor.check() == [1]
+    assert supervisor.restarts == [1, 2]
+
+
+def test_check_never_respawns_a_shard_while_it_restarts():
+    supervisor = Supervisor(1, MagicMock(), context=fork)
+    dead = MagicMock()
+    dead.is_alive.return_value = False
+    supervisor.processes = [dead]
+    stopped, checked = threading.Event(), threading.Event()
+    spawned = []
+
+    def stop_worker(shard):
+        # The old worker is gone; check() runs before its replacement starts
+        stopped.set()
+        checked.wait(5)
+
+    with (
+        patch.object(supervisor, "_stop_worker", side_effect=stop_worker),
+        patch.object(supervisor, "_spawn", side_effect=spawned.append),
+    ):
+        restart = threading.Thread(target=supervisor.restart, args=(0,))
+        restart.start()
+        stopped.wait(5)
+        assert supervisor.check() == []
+        checked.set()
+        restart.join(5)
+
+    assert spawned == [0]
+    assert supervisor.restarts == [1]
@@ -0,0 +1,346 @@
+import asyncio
+import json
+import queue
+import urllib.error
+import urllib.request
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from telegram import Bot
+
+from src import main as main_module
+from src import telemetry
+from src.agent import create_agent
+from src.config import Config, Personality
+from src.main import build_application, main, process_messages
+from src.supervisor import run_worker
+from src.telemetry import (
+    Metric,
+    MetricsRegistry,
+    TracedRequest,
+    Tracer,
+    current_span,
+    start_metrics_server,
+    track_cache,
+)
+
+# --- Tests for src/telemetry.py and the instrumented pipeline ---
+
+
+class ScriptedLLM(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+class FakeRequest:
+    """Minimal stand-in for the BaseRequest wrapped by TracedRequest."""
+
+    read_timeout = 5.0
+
+    def __init__(self) -> None:
+        self.initialize = AsyncMock()
+        self.shutdown = AsyncMock()
+        self.urls = []
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        self.urls.append(url)
+        body = b'{"ok": true, "result": {"id": 1, "is_bot": true, "first_name": "B"}}'
+        return 200, body
+
+
+@pytest.fixture
+def tracer():
+    """A fresh tracer installed as the one everything records into."""
+    tracer = Tracer(MetricsRegistry())
+    with patch.object(telemetry, "tracer", tracer):
+        with patch.object(telemetry, "span", tracer.span):
+            # Modules imported ``span`` by name before the patch
+            with (
+                patch("src.agent.span", tracer.span),
+                patch("src.main.span", tracer.span),
+                patch("src.media.span", tracer.span),
+            ):
+                yield tracer
+
+
+def test_counters_gauges_and_histograms_render_as_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("path",))
+    requests.inc(path="/a")
+    requests.inc(2, path='/"b"\n')
+    assert requests.value(path="/a") == 1.0
+    with pytest.raises(ValueError, match="cannot decrease"):
+        requests.inc(-1, path="/a")
+    with pytest.raises(ValueError, match="expects labels"):
+        requests.inc(kind="x")
+
+    depth = registry.gauge("depth", "Depth")
+    depth.inc(3)
+    depth.dec()
+    assert depth.value() == 2.0
+    depth.set(7)
+
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+    assert latency.count() == 4
+    assert latency.sum() == pytest.approx(3.65)
+
+    assert registry.render() == (
+        "# HELP depth Depth\n"
+        "# TYPE depth gauge\n"
+        "depth 7.0\n"
+        "# HELP latency_seconds Latency\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{le="0.1"} 2\n'
+        'latency_seconds_bucket{le="1.0"} 3\n'
+        'latency_seconds_bucket{le="+Inf"} 4\n'
+        "latency_seconds_sum 3.65\n"
+        "latency_seconds_count 4\n"
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="/\\"b\\"\\n"} 2.0\n'
+        'requests_total{path="/a"} 1.0\n'
+    )
+
+
+def test_registry_reuses_metrics_by_name():
+    registry = MetricsRegistry()
+    counter = registry.counter("hits_total", "Hits", ("cache",))
+    assert registry.counter("hits_total", "Hits", ("cache",)) is counter
+    assert registry.get("hits_total") is counter
+    with pytest.raises(ValueError, match="registered differently"):
+        registry.counter("hits_total", "Hits")
+    with pytest.raises(ValueError, match="registered differently"):
+        registry.gauge("hits_total", "Hits", ("cache",))
+    assert Metric("x", "X").render() == ["# HELP x X", "# TYPE x untyped"]
+
+
+def test_callback_metrics_are_read_at_scrape_time(caplog):
+    registry = MetricsRegistry()
+    depth = {"value": 1}
+    registry.callback("depth", "Depth", "gauge", lambda: {(): depth["value"]})
+    depth["value"] = 4
+    assert "depth 4.0" in registry.render()
+
+    registry.callback("depth", "Depth", "gauge", lambda: 1 / 0)
+    assert registry.render() == "# HELP depth Depth\n# TYPE depth gauge\n"
+    assert "Could not collect metric depth" in caplog.text
+
+
+def test_tracked_caches_export_hits_and_misses():
+    cache = MagicMock(hits=3, misses=1)
+    created = {}
+    with patch.dict(telemetry._caches, clear=True):
+        track_cache("disk", lambda: cache)
+        track_cache("lazy", lambda: created.get("cache"))
+        text = telemetry.metrics.render()
+    assert 'cache_requests_total{cache="disk",result="hit"} 3.0' in text
+    assert 'cache_requests_total{cache="disk",result="miss"} 1.0' in text
+    assert 'cache="lazy"' not in text
+
+
+async def test_spans_nest_across_tasks_and_record_errors(tracer):
+    async def child(name):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+
+    with tracer.span("turn", chat_id=1) as turn:
+        assert current_span() is turn
+        await asyncio.gather(child("a"), child("b"))
+        with pytest.raises(RuntimeError):
+            with tracer.span("boom"):
+                raise RuntimeError("no")
+    assert current_span() is None
+
+    spans = {span.name: span for span in tracer.spans}
+    assert {spans[n].parent_id for n in ("a", "b", "boom")} == {turn.span_id}
+    assert {span.trace_id for span in tracer.spans} == {turn.trace_id}
+    assert spans["boom"].status == "error"
+    assert spans["boom"].attributes["error"] == "RuntimeError('no')"
+    assert spans["turn"].attributes == {"chat_id": 1}
+
+    assert tracer.errors.value(span="boom") == 1
+    assert tracer.durations.count(span="a") == 1
+    with tracer.span("other") as other:
+        pass
+    assert other.trace_id != turn.trace_id
+    assert [s["name"] for s in tracer.recent(2)] == ["turn", "other"]
+
+
+async def test_traced_request_records_bot_api_calls_without_the_token(tracer):
+    inner = FakeRequest()
+    request = TracedRequest(inner)
+    bot = Bot("123:SECRET", request=request, get_updates_request=FakeRequest())
+    async with bot:
+        assert request.read_timeout == 5.0
+        await bot.get_me()
+    inner.initialize.assert_awaited_once()
+    inner.shutdown.assert_awaited_once()
+
+    # Bot.initialize() calls getMe as well
+    assert [s.name for s in tracer.spans] == ["telegram.getMe"] * 2
+    assert tracer.spans[-1].attributes["status"] == 200
+    assert "SECRET" not in json.dumps(tracer.recent())
+    assert "SECRET" in inner.urls[0]
+
+
+def test_metrics_server_serves_metrics_and_traces():
+    registry = MetricsRegistry()
+    registry.counter("turns_total", "Turns").inc()
+    traces = Tracer(registry)
+    with traces.span("turn"):
+        pass
+    server = start_metrics_server("127.0.0.1", 0, registry, traces)
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        with urllib.request.urlopen(f"{base}/metrics") as response:  # nosec B310
+            assert response.headers["Content-Type"].startswith("text/plain")
+            text = response.read().decode()
+        assert "turns_total 1.0" in text
+        assert 'span_duration_seconds_count{span="turn"} 1' in text
+
+        with urllib.request.urlopen(f"{base}/traces?limit=1") as response:  # nosec
+            assert json.load(response)[0]["name"] == "turn"
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{base}/nope")  # nosec B310
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_graph_nodes_and_tool_calls_are_traced(tracer):
+    selfie_call = AIMessage(
+        content="",
+        tool_calls=[{"name": "SelfieTool", "args": {"description": "x"}, "id": "c1"}],
+        usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12},
+    )
+    replies = [selfie_call, AIMessage(content="cute?"), AIMessage(content="bye")]
+    llm = ScriptedLLM(messages=iter(replies))
+    personality = Personality(name="Traced", byline="", identity=[], behavior=[])
+    with patch.object(Config, "LLM_PROVIDER", "google"):
+        with patch("src.agent.ChatGoogleGenerativeAI", return_value=llm):
+            app = create_agent(personality)
+
+    async def fake_selfie(self, description):
+        return "sent", None
+
+    tokens = telemetry.metrics.get("llm_tokens_total")
+    before = tokens.value(direction="input")
+    config = {"configurable": {"thread_id": "traced"}}
+    with patch("src.tools.SelfieTool._arun", fake_selfie):
+        with tracer.span("turn") as turn:
+            await app.ainvoke({"messages": [HumanMessage("pic?")]}, config)
+        app.invoke({"messages": [HumanMessage("sync")]}, config)
+
+    names = [s.name for s in tracer.spans if s.trace_id == turn.trace_id]
+    assert names.count("node.chatbot") == 2
+    assert names.count("node.tools") == 1
+    assert "tool.SelfieTool" in names
+    spans = {s.name: s for s in tracer.spans}
+    assert spans["tool.SelfieTool"].parent_id == spans["node.tools"].span_id
+    assert tokens.value(direction="input") == before + 10
+
+    # The sync path is traced too, as its own trace
+    assert [s.name for s in tracer.spans][-1] == "node.chatbot"
+    assert tracer.spans[-1].trace_id != turn.trace_id
+
+
+def test_sync_tool_calls_are_traced(tracer):
+    voice_call = AIMessage(
+        content="",
+        tool_calls=[{"name": "VoiceTool", "args": {"text": "hi"}, "id": "v1"}],
+    )
+    llm = ScriptedLLM(messages=iter([voice_call, AIMessage(content="listen")]))
+    personality = Personality(name="Sync", byline="", identity=[], behavior=[])
+    with patch.object(Config, "LLM_PROVIDER", "google"):
+        with patch("src.agent.ChatGoogleGenerativeAI", return_value=llm):
+            app = create_agent(personality)
+
+    config = {"configurable": {"thread_id": "sync-tools"}}
+    with patch("src.tools.VoiceTool._run", return_value=("sent", None)):
+        app.invoke({"messages": [HumanMessage("say hi")]}, config)
+    assert "tool.VoiceTool" in [s.name for s in tracer.spans]
+
+
+@pytest.mark.asyncio
+async def test_turns_are_traced_and_counted(tracer):
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+    context = MagicMock()
+    context.bot.send_chat_action = AsyncMock()
+    context.user_data = {}
+    agent = MagicMock()
+    agent.ainvoke = AsyncMock(return_value={"messages": [AIMessage("hi")]})
+    gauge = main_module.turns_in_progress
+
+    async def check_gauge(*args, **kwargs):
+        assert gauge.value() == 1
+        return {"messages": [AIMessage("hi")]}
+
+    agent.ainvoke.side_effect = check_gauge
+    batch = [main_module.IncomingMessage(7, "hey", update, context)]
+    with patch("src.main.get_agent_for_user", return_value=agent):
+        await process_messages(batch)
+    assert gauge.value() == 0
+    (turn,) = tracer.spans
+    assert turn.name == "turn"
+    assert turn.attributes == {"mode": "telegram", "messages": 1}
+
+    text = telemetry.metrics.render()
+    assert "chat_queue_depth 0.0" in text
+    assert 'cache_requests_total{cache="agents",result="hit"}' in text
+
+
+def test_build_application_traces_bot_api_calls_when_metrics_are_on():
+    with (
+        patch.object(Config, "METRICS_PORT", 9464),
+        patch("telegram.ext.Application.builder") as MockBuilder,
+    ):
+        build_application()
+    builder = MockBuilder.return_value.token.return_value.concurrent_updates
+    request = builder.return_value.request.call_args.args[0]
+    assert isinstance(request, TracedRequest)
+
+
+def test_main_starts_the_metrics_endpoint():
+    with (
+        patch("argparse.ArgumentParser.parse_args") as mock_args,
+        patch.object(Config, "METRICS_PORT", 9464),
+        patch.object(Config, "GOOGLE_API_KEY", "dummy_key"),
+        patch("src.main.start_metrics_server") as mock_start,
+        patch("src.main.bot_loop"),
+    ):
+        mock_args.return_value.cli = False
+        mock_args.return_value.workers = 1
+        main()
+        mock_start.assert_called_once_with(Config.METRICS_LISTEN, 9464)
+
+        # Supervised workers serve their own endpoints instead
+        mock_start.reset_mock()
+        mock_args.return_value.workers = 2
+        main()
+        mock_start.assert_not_called()
+
+
+def test_supervised_worker_serves_metrics_on_its_own_port():
+    inbox = queue.Queue()
+    inbox.put(None)
+    application = MagicMock()
+    application.__aenter__ = AsyncMock(return_value=application)
+    application.__aexit__ = AsyncMock(return_value=None)
+    application.start = AsyncMock()
+    application.stop = AsyncMock()
+    with (
+        patch.object(Config, "METRICS_PORT", 9464),
+        patch.object(Config, "TTS_CACHE_DIR", Config.TTS_CACHE_DIR),
+        patch.object(Config, "SELFIE_CACHE_DIR", Config.SELFIE_CACHE_DIR),
+        patch("src.supervisor.start_metrics_server") as mock_start,
+    ):
+        run_worker(2, inbox, MagicMock(), lambda updater: application)
+    mock_start.assert_called_once_with(Config.METRICS_LISTEN, 9466)
@@ -1,21 +1,91 @@
+import asyncio
+import threading
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from benchmarks.stubs import encode_mp3, tone_pcm
+from src.artifacts import ArtifactStore
+from src.cache import DiskCache
 from src.config import Config
-from src.tools import SelfieTool, VoiceTool
+from src.encoders import ImageOptions
+from src.selfies import SelfieService
+from src.tools import (
+    SELFIE_SENT,
+    VOICE_SENT,
+    SelfieTool,
+    ToolLimits,
+    VoiceTool,
+    get_tts_cache,
+)
 
 # --- Tests for src/tools.py ---
 
 
+@pytest.fixture(autouse=True)
+def tts_cache(tmp_path):
+    # Placeholder audio below is not decodable, so skip the OGG transcoding
+    cache = DiskCache(str(tmp_path / "tts"), 1024 * 1024, suffix=".mp3")
+    with (
+        patch("src.tools._tts_cache", cache),
+        patch.object(Config, "VOICE_FORMAT", "mp3"),
+    ):
+        yield cache
+
+
+@pytest.fixture(autouse=True)
+def selfie_service(tmp_path):
+    cache = DiskCache(str(tmp_path / "selfies"), 1024 * 1024, suffix=".jpg")
+    service = SelfieService(cache, 2, 4, 100, 3600, ImageOptions(max_side=64))
+    with patch("src.selfies._service", service):
+        yield service
+
+
+@pytest.fixture(autouse=True)
+def artifact_store():
+    store = ArtifactStore(spill_bytes=1024, ttl=60)
+    with patch("src.artifacts._store", store):
+        yield store
+
+
+def artifact_bytes(store, media):
+    with store.open(media["artifact_id"]) as f:
+        return f.read()
+
+
+async def stream_mp3():
+    yield {"type": "WordBoundary", "offset": 0, "duration": 1, "text": "hi"}
+    yield {"type": "audio", "data": b"mp3"}
+
+
+async def stream_nothing():
+    return
+    yield
+
+
+def test_get_tts_cache_is_lazy_singleton(tmp_path):
+    with patch("src.tools._tts_cache", None):
+        with patch.object(Config, "TTS_CACHE_DIR", str(tmp_path / "lazy")):
+            cache = get_tts_cache()
+            assert get_tts_cache() is cache
+            assert cache.directory == tmp_path / "lazy"
+            assert cache.suffix == ".mp3"
+    with patch("src.tools._tts_cache", None):
+        with (
+            patch.object(Config, "TTS_CACHE_DIR", str(tmp_path / "ogg")),
+            patch.object(Config, "VOICE_FORMAT", "ogg"),
+        ):
+            assert get_tts_cache().suffix == ".ogg"
+
+
 class TestSelfieTool:
     def test_run_no_api_key(self):
         with patch.object(Config, "GOOGLE_API_KEY", None):
             tool = SelfieTool()
-            result = tool._run("test")
+            result, media = tool._run("test")
             assert "missing GOOGLE_API_KEY" in result
 
-    def test_run_success(self):
+    def test_run_success(self, artifact_store):
         with patch.object(Config, "GOOGLE_API_KEY", "dummy"):
             with patch("src.tools.genai.Client") as MockClient:
                 mock_response = MagicMock()
@@ -28,13 +98,10 @@ class TestSelfieTool:
                 )
 
                 tool = SelfieTool()
-                with patch("src.tools.tempfile.NamedTemporaryFile") as MockTemp:
-                    mock_temp_file = MagicMock()
-                    mock_temp_file.name = "temp.png"
-                    MockTemp.return_value.__enter__.return_value = mock_temp_file
-
-                    result = tool._run("a selfie")
-                    assert "IMAGE_GENERATED:temp.png" in result
+                result, media = tool._run("a selfie")
+                assert result == SELFIE_SENT
+                assert media["kind"] == "photo"
+                assert artifact_bytes(artifact_store, media) == b"fake_image_bytes"
 
     def test_run_failure_no_images(self):
         with patch.object(Config, "GOOGLE_API_KEY", "dummy"):
@@ -47,7 +114,7 @@ class TestSelfieTool:
                 )
 
                 tool = SelfieTool()
-                result = tool._run("a selfie")
+                result, media = tool._run("a selfie")
                 assert "Failed to generate image" in result
 
     def test_run_failure_no_image_bytes(self):
@@ -63,7 +130,7 @@ class TestSelfieTool:
                 )
 
                 tool = SelfieTool()
-                result = tool._run("a selfie")
+                result, media = tool._run("a selfie")
                 assert "Failed to generate image" in result
 
     def test_run_exception(self):
@@ -74,11 +141,11 @@ class TestSelfieTool:
                 )
 
                 tool = SelfieTool()
-                result = tool._run("a selfie")
+                result, media = tool._run("a selfie")
                 assert "Error generating selfie: API Error" in result
 
     @pytest.mark.asyncio
-    async def test_arun(self):
+    async def test_arun(self, artifact_store):
         with patch.object(Config, "GOOGLE_API_KEY", "dummy"):
             with patch("src.tools.genai.Client") as MockClient:
                 # Mock aio.models.generate_images
@@ -95,26 +162,21 @@ class TestSelfieTool:
                 mock_client_instance.aio.models.generate_images = mock_generate
 
                 tool = SelfieTool()
+                result, media = await tool._arun("test prompt")
 
-                with patch("src.tools.tempfile.NamedTemporaryFile") as MockTemp:
-                    mock_temp_file = MagicMock()
-                    mock_temp_file.name = "temp.png"
-                    MockTemp.return_value.__enter__.return_value = mock_temp_file
-
-                    result = await tool._arun("test prompt")
-
-                    assert "IMAGE_GENERATED:temp.png" in result
-                    mock_generate.assert_awaited_once()
-                    # Verify model and prompt
-                    args, kwargs = mock_generate.await_args
-                    assert kwargs["model"] == "imagen-3.0-generate-001"
-                    assert kwargs["prompt"] == "test prompt"
+                assert artifact_bytes(artifact_store, media) == b"fake_bytes"
+                assert artifact_store.get(media["artifact_id"]).filename == "selfie.png"
+                mock_generate.assert_awaited_once()
+                # Verify model and prompt
+                args, kwargs = mock_generate.await_args
+                assert kwargs["model"] == "imagen-3.0-generate-001"
+                assert kwargs["prompt"] == "test prompt"
 
     @pytest.mark.asyncio
     async def test_arun_no_api_key(self):
         with patch.object(Config, "GOOGLE_API_KEY", None):
             tool = SelfieTool()
-            result = await tool._arun("test")
+            result, media = await tool._arun("test")
             assert "missing GOOGLE_API_KEY" in result
 
     @pytest.mark.asyncio
@@ -125,7 +187,7 @@ class TestSelfieTool:
                 MockClient.return_value.aio.models.generate_images = mock_generate
 
                 tool = SelfieTool()
-                result = await tool._arun("test")
+                result, media = await tool._arun("test")
                 assert "Error generating selfie: Async Error" in result
 
     @pytest.mark.asyncio
@@ -138,7 +200,7 @@ class TestSelfieTool:
                 MockClient.return_value.aio.models.generate_images = mock_generate
 
                 tool = SelfieTool()
-                result = await tool._arun("test")
+                result, media = await tool._arun("test")
                 assert "Failed to generate image" in result
 
     @pytest.mark.asyncio
@@ -154,7 +216,7 @@ class TestSelfieTool:
                 MockClient.return_value.aio.models.generate_images = mock_generate
 
                 tool = SelfieTool()
-                result = await tool._arun("test")
+                result, media = await tool._arun("test")
                 assert "Failed to generate image" in result
 
 
@@ -163,36 +225,138 @@ class TestVoiceTool:
     async def test_arun_no_voice(self):
         with patch.object(Config, "EDGE_TTS_VOICE", None):
             tool = VoiceTool()
-            result = await tool._arun("test")
+            result, media = await tool._arun("test")
             assert "missing EDGE_TTS_VOICE" in result
 
     @pytest.mark.asyncio
-    async def test_arun_success(self):
+    async def test_arun_success(self, tts_cache, artifact_store):
+        with patch.object(Config, "EDGE_TTS_VOICE", "en-US"):
+            tool = VoiceTool()
+            with patch("src.speech.edge_tts.Communicate") as MockComm:
+                MockComm.return_value.stream = stream_mp3
+
+                result, media = await tool._arun("hello")
+                assert result == VOICE_SENT
+                assert media["kind"] == "voice"
+                artifact = artifact_store.get(media["artifact_id"])
+                # The artifact holds a copy, so evicting the clip is harmless.
+                for path in tts_cache.directory.iterdir():
+                    path.unlink()
+                assert artifact.filename.endswith(".mp3")
+                assert artifact_bytes(artifact_store, media) == b"mp3"
+                MockComm.assert_called_once_with(
+                    "hello", "en-US", rate="+0%", pitch="+0Hz"
+                )
+
+    @pytest.mark.asyncio
+    async def test_arun_cache_hit_skips_synthesis(self, tts_cache, artifact_store):
+        with patch.object(Config, "EDGE_TTS_VOICE", "en-US"):
+            tool = VoiceTool()
+            with patch("src.speech.edge_tts.Communicate") as MockComm:
+                MockComm.return_value.stream = stream_mp3
+
+                _, first = await tool._arun("good night babe")
+                _, second = await tool._arun("good night babe")
+                _, other = await tool._arun("good morning babe")
+
+                names = [
+                    artifact_store.get(media["artifact_id"]).filename
+                    for media in (first, second, other)
+                ]
+                assert names[0] == names[1] != names[2]
+                assert MockComm.call_count == 2
+                assert tts_cache.hits == 1
+                assert tts_cache.misses == 2
+
+    @pytest.mark.asyncio
+    async def test_arun_cache_key_includes_rate(self, tts_cache, artifact_store):
         with patch.object(Config, "EDGE_TTS_VOICE", "en-US"):
             tool = VoiceTool()
-            with patch("src.tools.edge_tts.Communicate") as MockComm:
-                mock_comm_instance = AsyncMock()
-                MockComm.return_value = mock_comm_instance
+            with patch("src.speech.edge_tts.Communicate") as MockComm:
+                MockComm.return_value.stream = stream_mp3
+                _, normal = await tool._arun("hey")
+                with patch.object(Config, "EDGE_TTS_RATE", "+20%"):
+                    _, fast = await tool._arun("hey")
+                assert (
+                    artifact_store.get(normal["artifact_id"]).filename
+                    != artifact_store.get(fast["artifact_id"]).filename
+                )
+                assert MockComm.call_args.kwargs["rate"] == "+20%"
+
+    @pytest.mark.asyncio
+    async def test_arun_stream_failure_caches_nothing(self, tts_cache):
+        async def broken():
+            yield {"type": "audio", "data": b"mp"}
+            raise Exception("Net")
 
-                with patch("src.tools.tempfile.NamedTemporaryFile") as MockTemp:
-                    mock_temp_file = MagicMock()
-                    mock_temp_file.name = "temp.mp3"
-                    MockTemp.return_value.__enter__.return_value = mock_temp_file
+        with patch.object(Config, "EDGE_TTS_VOICE", "en-US"):
+            tool = VoiceTool()
+            with patch("src.speech.edge_tts.Communicate") as MockComm:
+                MockComm.return_value.stream = broken
+                result, media = await tool._arun("hello")
+                assert "Error generating voice: Net" in result
+                assert list(tts_cache.directory.iterdir()) == []
 
-                    result = await tool._arun("hello")
-                    assert "AUDIO_GENERATED:temp.mp3" in result
-                    mock_comm_instance.save.assert_awaited_once_with("temp.mp3")
+    @pytest.mark.asyncio
+    async def test_arun_without_audio_is_an_error(self, tts_cache):
+        with patch.object(Config, "EDGE_TTS_VOICE", "en-US"):
+            with patch("src.speech.edge_tts.Communicate") as MockComm:
+                MockComm.return_value.stream = stream_nothing
+                result, media = await VoiceTool()._arun("hello")
+        assert result == "Error generating voice: no audio received"
+        assert media is None
 
     @pytest.mark.asyncio
     async def test_arun_exception(self):
         with patch.object(Config, "EDGE_TTS_VOICE", "en-US"):
             with patch(
-                "src.tools.edge_tts.Communicate", side_effect=Exception("TTS Error")
+                "src.speech.edge_tts.Communicate", side_effect=Exception("TTS Error")
             ):
                 tool = VoiceTool()
-                result = await tool._arun("hello")
+                result, media = await tool._arun("hello")
                 assert "Error generating voice: TTS Error" in result
 
+    @pytest.mark.asyncio
+    async def test_arun_sends_ogg_opus(self, tmp_path, artifact_store):
+        mp3 = encode_mp3(tone_pcm(1.0, 440))
+
+        async def stream():
+            yield {"type": "audio", "data": mp3}
+
+        cache = DiskCache(str(tmp_path / "ogg"), 1024 * 1024, suffix=".ogg")
+        with (
+            patch("src.tools._tts_cache", cache),
+            patch.object(Config, "VOICE_FORMAT", "ogg"),
+            patch.object(Config, "EDGE_TTS_VOICE", "en-US"),
+            patch("src.speech.edge_tts.Communicate") as MockComm,
+        ):
+            MockComm.return_value.stream = stream
+            result, media = await VoiceTool()._arun("hello")
+            _, again = await VoiceTool()._arun("hello")
+            with patch.object(Config, "VOICE_OPUS_BITRATE", 16000):
+                await VoiceTool()._arun("hello")
+
+        assert result == VOICE_SENT
+        artifact = artifact_store.get(media["artifact_id"])
+        assert artifact.filename.endswith(".ogg")
+        data = artifact_bytes(artifact_store, media)
+        assert data.startswith(b"OggS") and len(data) < len(mp3)
+        # The bitrate is part of the cache key, the repeated request is not
+        assert MockComm.call_count == 2
+        assert artifact_store.get(again["artifact_id"]).filename == artifact.filename
+
+    @pytest.mark.asyncio
+    async def test_arun_transcode_failure(self, artifact_store):
+        with (
+            patch.object(Config, "VOICE_FORMAT", "ogg"),
+            patch.object(Config, "EDGE_TTS_VOICE", "en-US"),
+            patch("src.speech.edge_tts.Communicate") as MockComm,
+        ):
+            MockComm.return_value.stream = stream_mp3
+            result, media = await VoiceTool()._arun("hello")
+        assert result.startswith("Error generating voice: ")
+        assert media is None
+
     def test_run_success(self):
         # This test is tricky because asyncio.run might clash with existing loop if
         # not careful.
@@ -201,9 +365,37 @@ class TestVoiceTool:
 
         tool = VoiceTool()
         with patch.object(tool, "_arun", new_callable=AsyncMock) as mock_arun:
-            mock_arun.return_value = "success"
-            result = tool._run("test")
-            assert result == "success"
+            mock_arun.return_value = ("success", None)
+            assert tool._run("test") == ("success", None)
+
+    def test_run_respects_the_voice_limit(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        async def slow_arun(self, text):
+            with lock:
+                active.append(text)
+                peak.append(len(active))
+            await asyncio.sleep(0.05)
+            with lock:
+                active.remove(text)
+            return VOICE_SENT, None
+
+        with (
+            patch("src.tools.tool_limits", ToolLimits({"VoiceTool": 2})),
+            patch.object(VoiceTool, "_arun", slow_arun),
+        ):
+            # Each sync call runs on its own event loop
+            threads = [
+                threading.Thread(target=VoiceTool()._run, args=(f"line {n}",))
+                for n in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert max(peak) == 2
 
     def test_run_loop_running_error(self):
         tool = VoiceTool()
@@ -212,7 +404,7 @@ class TestVoiceTool:
         mock_loop.is_running.return_value = True
 
         with patch("src.tools.asyncio.get_running_loop", return_value=mock_loop):
-            result = tool._run("test")
+            result, media = tool._run("test")
             assert "Async event loop already running" in result
 
     def test_run_exception(self):
@@ -221,5 +413,25 @@ class TestVoiceTool:
         with patch("asyncio.run", side_effect=Exception("Run Error")):
             # Mock _arun to avoid creating a coroutine that is never awaited
             with patch.object(tool, "_arun", new_callable=MagicMock):
-                result = tool._run("test")
+                result, media = tool._run("test")
                 assert "Error: Run Error" in result
+
+
+@pytest.mark.asyncio
+async def test_tool_call_attaches_media_as_artifact(artifact_store):
+    # Through the LangChain tool-call interface the media travels on
+    # ToolMessage.artifact while the model only sees the content string.
+    with patch.object(Config, "EDGE_TTS_VOICE", "en-US"):
+        with patch("src.speech.edge_tts.Communicate") as MockComm:
+            MockComm.return_value.stream = stream_mp3
+            message = await VoiceTool().ainvoke(
+                {
+                    "type": "tool_call",
+                    "name": "VoiceTool",
+                    "args": {"text": "hi"},
+                    "id": "call-1",
+                }
+            )
+    assert message.content == VOICE_SENT
+    assert message.artifact["kind"] == "voice"
+    assert artifact_store.get(message.artifact["artifact_id"]) is not None
@@ -5,7 +5,7 @@ from src.tools import SelfieTool
 
 
 class TestSelfieToolPerf:
-    def test_client_instantiation_count(self):
+    def test_client_instantiation_count(self, tmp_path):
         # Patch Config.GOOGLE_API_KEY to ensure tool attempts to create client
         with patch.object(Config, "GOOGLE_API_KEY", "dummy_key"):
             with patch("src.tools.genai.Client") as MockClient:
@@ -22,7 +22,11 @@ class TestSelfieToolPerf:
                 tool = SelfieTool()
 
                 # Run twice
-                with patch("src.tools.tempfile.NamedTemporaryFile"):
+                with (
+                    patch("src.tools.get_artifact_store"),
+                    patch("src.selfies._service", None),
+                    patch.object(Config, "SELFIE_CACHE_DIR", str(tmp_path)),
+                ):
                     tool._run("test 1")
                     tool._run("test 2")
 
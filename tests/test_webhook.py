@@ -0,0 +1,215 @@
+import asyncio
+from typing import Any, Dict, List
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer, unused_port
+from telegram import Update
+from telegram.ext import Application, ContextTypes, MessageHandler, filters
+
+from src.webhook import create_webhook_app, serve_webhook
+
+# --- Tests for src/webhook.py ---
+
+TOKEN = "123:fake"
+UPDATES = 20
+
+
+class FakeTelegram:
+    """A minimal Bot API server: getUpdates, sendMessage and webhook calls."""
+
+    def __init__(self) -> None:
+        self.pending: List[Dict[str, Any]] = []
+        self.arrived = asyncio.Event()
+        self.sent: List[Dict[str, Any]] = []
+        self.webhooks: List[Dict[str, Any]] = []
+        self.all_sent = asyncio.Event()
+        self.expected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        result: Any = True
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fb"}
+        elif method == "getUpdates":
+            if not self.pending:
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), 0.2)
+                except asyncio.TimeoutError:
+                    pass
+            limit = int(params.get("limit", 100))
+            result, self.pending = self.pending[:limit], self.pending[limit:]
+        elif method == "sendMessage":
+            self.sent.append(params)
+            if len(self.sent) >= self.expected:
+                self.all_sent.set()
+            result = {
+                "message_id": len(self.sent),
+                "date": 0,
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params["text"],
+            }
+        elif method == "setWebhook":
+            self.webhooks.append(params)
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(f"/bot{TOKEN}/{{method}}", self.handle)
+        return app
+
+    def push(self, updates: List[Dict[str, Any]]) -> None:
+        self.pending.extend(updates)
+        self.arrived.set()
+
+
+def make_update(update_id: int) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": update_id, "type": "private"},
+            "text": "hi",
+        },
+    }
+
+
+def build_application(server: TestServer, concurrent: Any) -> Application:
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(str(server.make_url("/bot")))
+        .concurrent_updates(concurrent)
+        .build()
+    )
+    return application
+
+
+@pytest.fixture
+async def telegram():
+    fake = FakeTelegram()
+    server = TestServer(fake.app())
+    await server.start_server()
+    yield fake, server
+    await server.close()
+
+
+@pytest.fixture
+async def idle_app(telegram):
+    _, server = telegram
+    application = build_application(server, 8)
+    yield application
+
+
+async def test_health_reports_startup_and_backlog(idle_app):
+    client = TestClient(TestServer(create_webhook_app(idle_app)))
+    await client.start_server()
+    try:
+        response = await client.get("/healthz")
+        assert response.status == 503
+        assert (await response.json())["status"] == "starting"
+
+        async with idle_app:
+            await idle_app.start()
+            response = await client.get("/healthz")
+            body = await response.json()
+            await idle_app.stop()
+        assert response.status == 200
+        assert body == {"status": "ok", "pending_updates": 0, "concurrent_updates": 8}
+    finally:
+        await client.close()
+
+
+async def test_webhook_checks_secret_and_payload(idle_app):
+    app = create_webhook_app(idle_app, path="/hook", secret_token="s3cret")
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    try:
+        response = await client.post("/hook", json=make_update(1))
+        assert response.status == 403
+
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        response = await client.post("/hook", data="not json", headers=headers)
+        assert response.status == 400
+
+        response = await client.post("/hook", json=make_update(1), headers=headers)
+        assert response.status == 200
+        update = idle_app.update_queue.get_nowait()
+        assert update.message.chat.id == 1
+    finally:
+        await client.close()
+
+
+async def test_both_modes_handle_a_burst_concurrently(telegram):
+    # CONCURRENT_UPDATES applies to polling and webhook alike: every update
+    # of a burst is in its handler at the same time (a sequential dispatcher
+    # would never release the barrier) and gets its reply. The throughput of
+    # both modes is measured by benchmarks/harness.py.
+    fake, server = telegram
+    for webhook in (False, True):
+        fake.sent.clear()
+        fake.all_sent.clear()
+        fake.expected = UPDATES
+        inside = 0
+        everyone = asyncio.Event()
+
+        async def barrier(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            nonlocal inside
+            inside += 1
+            if inside == UPDATES:
+                everyone.set()
+            await everyone.wait()
+            await update.message.reply_text("ok")
+
+        application = build_application(server, UPDATES)
+        application.add_handler(MessageHandler(filters.TEXT, barrier))
+        updates = [make_update(i) for i in range(1, UPDATES + 1)]
+        if webhook:
+            await deliver_by_webhook(fake, application, updates)
+        else:
+            await deliver_by_polling(fake, application, updates)
+
+        assert inside == UPDATES
+        assert sorted(int(m["chat_id"]) for m in fake.sent) == list(
+            range(1, UPDATES + 1)
+        )
+
+
+async def deliver_by_polling(
+    fake: FakeTelegram, application: Application, updates: List[Dict[str, Any]]
+) -> None:
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        fake.push(updates)
+        await asyncio.wait_for(fake.all_sent.wait(), 5)
+        await application.updater.stop()
+        await application.stop()
+
+
+async def deliver_by_webhook(
+    fake: FakeTelegram, application: Application, updates: List[Dict[str, Any]]
+) -> None:
+    port = unused_port()
+    stop = asyncio.Event()
+    serving = asyncio.create_task(
+        serve_webhook(
+            application, "127.0.0.1", port, "https://bot.example.com/", stop=stop
+        )
+    )
+    # The webhook is registered once the server listens
+    while not fake.webhooks:
+        await asyncio.sleep(0.01)
+    async with aiohttp.ClientSession() as session:
+        for update in updates:
+            url = f"http://127.0.0.1:{port}/telegram"
+            async with session.post(url, json=update) as response:
+                assert response.status == 200
+    await asyncio.wait_for(fake.all_sent.wait(), 5)
+    stop.set()
+    await serving
+    assert fake.webhooks[0]["url"] == "https://bot.example.com/telegram"